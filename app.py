@@ -6,28 +6,139 @@ from flask import (
     url_for,
     request,
     jsonify,
+    g,
     send_from_directory,
-    send_file,
 )
 from dotenv import load_dotenv
 
 load_dotenv()
 from config import DevelopmentConfig
 import os
-import cv2
-import numpy as np
-import pytesseract
 import json
-from PIL import Image
+import logging
 from functools import wraps
 import random
-import traceback
+import threading
+import time
+import uuid
+from archive_index import ArchiveIndex
+from archive_watcher import ArchiveWatcher
+from audio_streaming import send_audio
+from metadata_cache import MetadataCache
+from catalog import compile_catalog, open_catalog
+from ocr_pipeline import load_ocr_stack, read_country, warm_up as warm_up_ocr
+from ocr_geometry import CLIENT_CROP, Viewfinder
+from ocr_cache import OcrResultCache, frame_hash
+from live_scan import LiveScans
+from ocr_jobs import OcrJobQueue, QueueFull
+from country_matcher import CountryMatcher, load_aliases
+from ocr_vote import CountryVote
+from debug_capture import DebugCapture, RESULT_FILE
+from log_setup import REQUEST_ID, configure_logging
+import metrics
 
 app = Flask(__name__)
 app.config.from_object(DevelopmentConfig)
 
-# Update this to your actual archive path
-ARCHIVE_PATH = "/mnt/ssd/globemusic/archive"
+configure_logging(
+    app.config["LOG_LEVEL"],
+    app.config["LOG_FILE"],
+    max_bytes=app.config["LOG_MAX_BYTES"],
+    backups=app.config["LOG_BACKUPS"],
+)
+log = logging.getLogger(__name__)
+
+# Request latency and counters for /metrics, summed over all processes in METRICS_DIR
+os.environ.setdefault("METRICS_DIR", app.config["METRICS_DIR"])
+HTTP_SECONDS = metrics.Histogram(
+    "globo_http_request_duration_seconds", "Time to answer a request", ["route", "method", "status"]
+)
+STAGE_SECONDS = metrics.Histogram("globo_stage_duration_seconds", "Time spent in each step of a request", ["stage"])
+SCANS = metrics.Counter("globo_ocr_scans_total", "Scans by outcome", ["result"])
+COUNTRIES_DETECTED = metrics.Counter("globo_detected_countries_total", "Scans that found each country", ["country"])
+CACHE_HITS = metrics.Counter("globo_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = metrics.Counter("globo_cache_misses_total", "Cache misses", ["cache"])
+DROPPED = metrics.Counter("globo_dropped_total", "Frames and captures dropped under load", ["what"])
+
+ARCHIVE_PATH = app.config["ARCHIVE_PATH"]
+
+# Scan the archive once at startup; song picks read from this instead of the disk
+ARCHIVE_INDEX = ArchiveIndex(ARCHIVE_PATH, app.config["ARCHIVE_INDEX_FILE"]).load()
+if app.config["ARCHIVE_WATCH"]:
+    ArchiveWatcher(ARCHIVE_INDEX, poll_interval=app.config["ARCHIVE_POLL_INTERVAL"]).start()
+
+# Parsed sidecar metadata, re-read only when a file's mtime/size changes
+METADATA_CACHE = MetadataCache(max_entries=app.config["METADATA_CACHE_SIZE"])
+# Compiled sidecar metadata shared by all workers (None until `flask compile-catalog` is run)
+CATALOG = open_catalog(app.config["CATALOG_FILE"], ARCHIVE_PATH)
+
+# Sampled scans are saved for /debug/captures (None unless DEBUG_CAPTURE is on)
+DEBUG_CAPTURE = None
+if app.config["DEBUG_CAPTURE"]:
+    DEBUG_CAPTURE = DebugCapture(
+        app.config["DEBUG_CAPTURE_DIR"],
+        sample_rate=app.config["DEBUG_CAPTURE_SAMPLE"],
+        max_captures=app.config["DEBUG_CAPTURE_MAX"],
+    )
+
+# cv2/numpy/PIL load on the first scan; with OCR_PREWARM they load in the
+# background after boot instead, so neither boot nor that scan waits for them
+if app.config["OCR_PREWARM"]:
+    threading.Thread(target=load_ocr_stack, name="ocr-prewarm", daemon=True).start()
+
+# Text read from recent scans, reused when the camera sees the same label again
+OCR_CACHE = OcrResultCache(
+    max_entries=app.config["OCR_CACHE_SIZE"],
+    ttl=app.config["OCR_CACHE_TTL"],
+    max_distance=app.config["OCR_CACHE_DISTANCE"],
+)
+
+# OCR runs in a small pool of warm worker processes, not in the request.
+# They read the engine and preprocessing choices from the environment they inherit.
+os.environ.setdefault("OCR_ENGINE", app.config["OCR_ENGINE"])
+os.environ.setdefault("OCR_PREPROCESS", app.config["OCR_PREPROCESS"])
+os.environ.setdefault("LOG_LEVEL", app.config["LOG_LEVEL"])
+OCR_JOBS = OcrJobQueue(
+    app.config["OCR_JOBS_DIR"],
+    workers=app.config["OCR_WORKERS"],
+    max_pending=app.config["OCR_MAX_PENDING"],
+    warm_up=warm_up_ocr,
+)
+
+
+
+def submit_live_frame(frame, view):
+    try:
+        return OCR_JOBS.submit(read_country, frame, None, view, app.config["OCR_MIN_CONFIDENCE"])[0]
+    except QueueFull:
+        return None
+
+
+# Live scanning kiosks: each one's newest frame is OCR'd at a bounded rate.  The
+# slots live beside the job results so every worker sees the same kiosk.
+LIVE_SCANS = LiveScans(
+    os.path.join(app.config["OCR_JOBS_DIR"], "live"),
+    submit_live_frame,
+    OCR_JOBS.status,
+    lookup=lambda frame, view: OCR_CACHE.get(scan_hash(frame, view)),
+    interval=app.config["LIVE_SCAN_INTERVAL"],
+    stable_reads=app.config["LIVE_SCAN_STABLE_READS"],
+    idle_timeout=app.config["LIVE_SCAN_IDLE"],
+)
+
+
+def collect_metrics():
+    # Counts the caches and queues keep themselves, copied in before each metrics snapshot
+    CACHE_HITS.set(METADATA_CACHE.hits, cache="metadata")
+    CACHE_MISSES.set(METADATA_CACHE.misses, cache="metadata")
+    CACHE_HITS.set(OCR_CACHE.hits, cache="ocr")
+    CACHE_MISSES.set(OCR_CACHE.misses, cache="ocr")
+    DROPPED.set(LIVE_SCANS.dropped, what="live_scan_frame")
+    if DEBUG_CAPTURE:
+        DROPPED.set(DEBUG_CAPTURE.dropped, what="debug_capture")
+
+
+metrics.add_collector(collect_metrics)
 
 # ------------------------------
 # Helper Functions
@@ -42,7 +153,7 @@ def load_countries():
         with open(country_file_path, "r") as f:
             return json.load(f)
     except Exception as e:
-        print(f"Error loading countries file: {e}")
+        log.error("Error loading countries file: %s", e)
         # Fallback to a minimal set in case of error
         return {
             "FRA": "France",
@@ -54,8 +165,9 @@ def load_countries():
         }
 # Load the countries at app startup
 COUNTRIES = load_countries()
-# Reverse lookup (name to code)
-COUNTRY_CODES = {v: k for k, v in COUNTRIES.items()}
+# Finds country names in OCR text for the synchronous /image_processing; the
+# OCR jobs match in the OCR worker processes (ocr_pipeline.read_country)
+COUNTRY_MATCHER = CountryMatcher(COUNTRIES, load_aliases())
 
 # Decorator to ensure calibration is done
 def require_calibration(f):
@@ -68,41 +180,8 @@ def require_calibration(f):
     return decorated_function
 
 
-# Image processing functions
-def crop_center(img, cropx, cropy):
-    y, x = img.shape[:2]
-    startx = x // 2 - (cropx // 2)
-    starty = y // 2 - (cropy // 2)
-    return img[starty : starty + cropy, startx : startx + cropx]
-
-
-def detect_country(text, country_codes):
-    # First try direct name matching
-    for name in country_codes:
-        if name.upper() in text.upper():
-            return name, country_codes[name]
-
-    # If no direct match, try more fuzzy matching
-    # This could be enhanced with more sophisticated text matching
-    words = text.upper().split()
-    for name in country_codes:
-        for word in words:
-            if len(word) >= 3 and word in name.upper():
-                return name, country_codes[name]
-
-    return None, None
-
-
 def get_available_decades(country_code):
-    country_path = os.path.join(ARCHIVE_PATH, country_code)
-    if not os.path.isdir(country_path):
-        return []
-
-    decades = [
-        d
-        for d in os.listdir(country_path)
-        if os.path.isdir(os.path.join(country_path, d)) and d != "images"
-    ]
+    decades = [d for d in ARCHIVE_INDEX.decades(country_code) if d != "images"]
 
     if decades and "all" not in decades:
         decades.append("all")
@@ -110,56 +189,36 @@ def get_available_decades(country_code):
     return sorted(decades)
 
 
+def load_song_metadata(song_path):
+    """Sidecar metadata for a song: the compiled catalog if it has the track, else the JSON files."""
+    with STAGE_SECONDS.time(stage="metadata"):
+        return _load_song_metadata(song_path)
+
+
+def _load_song_metadata(song_path):
+    # <track>.json first, then any other sidecar in the song's folder
+    sidecars = ARCHIVE_INDEX.sidecars(os.path.dirname(song_path))
+    track_sidecar = ARCHIVE_INDEX.track_sidecar(song_path)
+    if track_sidecar:
+        sidecars = [track_sidecar] + [p for p in sidecars if p != track_sidecar]
+    if CATALOG:
+        # Unless a sidecar changed since the catalog was compiled
+        metadata = CATALOG.metadata(song_path, sidecars)
+        if metadata is not None:
+            return metadata
+    return METADATA_CACHE.first(sidecars)
+
+
 def pick_song(country_code, decade, exclude_path=None):
     """Pick a random song from the country and decade, optionally excluding the last played song."""
-    if decade == "all":
-        country_path = os.path.join(ARCHIVE_PATH, country_code)
-        decades = [
-            d
-            for d in os.listdir(country_path)
-            if os.path.isdir(os.path.join(country_path, d)) and d != "all"
-        ]
-
-        if not decades:
-            return None, None
-        decade = random.choice(decades)
-
-    dir_path = os.path.join(ARCHIVE_PATH, country_code, decade)
-    if not os.path.isdir(dir_path):
+    with STAGE_SECONDS.time(stage="pick_track"):
+        track = ARCHIVE_INDEX.random_track(country_code, decade, exclude_path=exclude_path)
+    if not track:
         return None, None
 
-    songs = []
-    for root, dirs, files in os.walk(dir_path):
-        mp3s = [f for f in files if f.lower().endswith(".mp3")]
-        for mp3 in mp3s:
-            full_path = os.path.join(root, mp3)
-            if exclude_path and os.path.abspath(full_path) == os.path.abspath(exclude_path):
-                continue
-            songs.append((full_path, root))
-
-    # Fallback: if only one song exists and it was excluded, allow it
-    if not songs and exclude_path:
-        for root, dirs, files in os.walk(dir_path):
-            mp3s = [f for f in files if f.lower().endswith(".mp3")]
-            for mp3 in mp3s:
-                full_path = os.path.join(root, mp3)
-                songs.append((full_path, root))
-                break  # only need one fallback
-
-    if not songs:
-        return None, None
+    song_path = track.path
 
-    song_path, song_dir = random.choice(songs)
-
-    metadata = {}
-    json_files = [f for f in os.listdir(song_dir) if f.lower().endswith(".json")]
-    for json_file in json_files:
-        try:
-            with open(os.path.join(song_dir, json_file), "r") as f:
-                metadata = json.load(f)
-                break
-        except:
-            continue
+    metadata = load_song_metadata(song_path)
 
     # Add country info to metadata
     country_code, country_name = get_country_from_path(song_path)
@@ -170,44 +229,19 @@ def pick_song(country_code, decade, exclude_path=None):
 
 
 def pick_random_song_from_archive():
-    mp3_files = []
-    print("[DEBUG] Starting to walk through archive to find mp3 files...")
-    for root, dirs, files in os.walk(ARCHIVE_PATH):
-        for fname in files:
-            if fname.lower().endswith('.mp3'):
-                full_path = os.path.join(root, fname)
-                mp3_files.append(full_path)
-    print(f"[DEBUG] Found {len(mp3_files)} mp3 files in archive.")
-
-    if not mp3_files:
-        print("[DEBUG] No mp3 files found, returning None.")
-        return None, None
-
-    chosen = random.choice(mp3_files)
-    print(f"[DEBUG] Randomly chosen mp3 file: {chosen}")
+    track = ARCHIVE_INDEX.random_track()
 
-    meta_path = os.path.splitext(chosen)[0] + '.json'
-    metadata = {}
-    if os.path.exists(meta_path):
-        print(f"[DEBUG] Metadata JSON found at: {meta_path}, loading...")
-        try:
-            with open(meta_path, 'r') as f:
-                metadata = json.load(f)
-            print(f"[DEBUG] Metadata loaded: {metadata}")
-        except Exception as e:
-            print(f"[DEBUG] Error loading metadata JSON: {e}")
-    else:
-        print(f"[DEBUG] No metadata JSON found for chosen mp3.")
+    if not track:
+        log.warning("No tracks in the archive index (%s)", ARCHIVE_PATH)
+        return None, None
 
+    chosen = track.path
+    metadata = load_song_metadata(chosen)
     country_code, country_name = get_country_from_path(chosen)
-    print(f"[DEBUG] Country code from path: {country_code}")
-    print(f"[DEBUG] Country name from path: {country_name}")
-
     metadata["country_code"] = country_code
     metadata["country_name"] = country_name
 
-    print(f"[DEBUG] Final metadata sent to front end: {metadata}")
-
+    log.debug("Random pick from %d tracks: %s %s", len(ARCHIVE_INDEX), chosen, metadata)
     return chosen, metadata
 
 
@@ -215,23 +249,17 @@ def pick_random_song_from_archive():
 def get_country_from_path(song_path):
     try:
         parts = os.path.normpath(song_path).split(os.sep)
-        print(f"[DEBUG] song_path: {song_path}")
-        print(f"[DEBUG] parts: {parts}")
 
         if "archive" in parts:
             archive_index = parts.index("archive")
-            print(f"[DEBUG] archive_index: {archive_index}")
             country_code = parts[archive_index + 1]
-            print(f"[DEBUG] country_code from path: {country_code}")
-
             country_name = COUNTRIES.get(country_code, "Unknown Country")
-            print(f"[DEBUG] country_name: {country_name}")
-
+            log.debug("Country %s (%s) from path %s", country_code, country_name, song_path)
             return country_code, country_name
         else:
-            print("[DEBUG] 'archive' not in path")
+            log.debug("'archive' not in path %s", song_path)
     except Exception as e:
-        print(f"[ERROR] Failed in get_country_from_path: {e}")
+        log.error("Failed to get the country from path %s: %s", song_path, e)
 
     return None, "Unknown Country"
 
@@ -245,6 +273,44 @@ def get_country_from_path(song_path):
 # ------------------------------
 
 
+@app.before_request
+def start_request():
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    g.request_id = request_id
+    g.request_started = time.perf_counter()
+    g.request_id_token = REQUEST_ID.set(request_id)
+    # The worker's first request (usually the page load) starts the OCR pool,
+    # so the first scan doesn't wait for processes to spawn and load Tesseract
+    OCR_JOBS.start()
+
+
+@app.after_request
+def finish_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_SECONDS.observe(
+        time.perf_counter() - g.request_started,
+        route=route,
+        method=request.method,
+        status=response.status_code,
+    )
+    response.headers["X-Request-ID"] = g.request_id
+    return response
+
+
+@app.teardown_request
+def end_request(error=None):
+    token = g.pop("request_id_token", None)
+    if token is not None:
+        REQUEST_ID.reset(token)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text format: request and stage latency, scans, caches (all workers)."""
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+
 @app.route("/")
 def index():
     for key in ["current_country", "song", "decade", "selected_decade", "global_shuffle"]:
@@ -297,6 +363,7 @@ def main_interface():
         x=session.get("x"),
         y=session.get("y"),
         diameter=session.get("diameter"),
+        capture=capture_settings(),
         country_code=country_code,
         country_name=country_name,
         decades=decades,
@@ -307,85 +374,146 @@ def main_interface():
 
 
 
-@app.route("/image_processing", methods=["POST"])
-@require_calibration
-def image_processing():
-    try:
-        if "photo" not in request.files:
-            return jsonify({"status": "error", "message": "No photo uploaded"}), 400
-
-        file = request.files["photo"]
-        if file.filename == "":
-            return jsonify({"status": "error", "message": "Empty filename"}), 400
+def get_uploaded_photo():
+    """Return (image bytes, None) for the uploaded photo, or (None, error response)."""
+    if "photo" not in request.files:
+        return None, (jsonify({"status": "error", "message": "No photo uploaded"}), 400)
 
-        # Convert to OpenCV format
-        file_bytes = np.frombuffer(file.read(), np.uint8)
-        image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    file = request.files["photo"]
+    if file.filename == "":
+        return None, (jsonify({"status": "error", "message": "Empty filename"}), 400)
 
-        if image is None:
-            return (
-                jsonify({"status": "error", "message": "Failed to decode image"}),
-                400,
-            )
+    return file.read(), None
 
-        # Crop the center
-        cropped = crop_center(image, 200, 350)
 
-        # Convert to grayscale and threshold
-        gray = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY)
+def capture_settings():
+    """How the kiosk should capture frames: upload size and quality, and the quality gate."""
+    return {
+        "max_side": app.config["CAPTURE_MAX_SIDE"],
+        "quality": app.config["CAPTURE_QUALITY"],
+        "min_sharpness": app.config["CAPTURE_MIN_SHARPNESS"],
+        "min_brightness": app.config["CAPTURE_MIN_BRIGHTNESS"],
+        "max_brightness": app.config["CAPTURE_MAX_BRIGHTNESS"],
+        "live_scan": True,
+        "live_max_side": app.config["LIVE_SCAN_MAX_SIDE"],
+        "live_frame_ms": app.config["LIVE_SCAN_FRAME_MS"],
+    }
 
-        # Optional: Save debug images (for development only)
-        debug_dir = os.path.join(app.static_folder, "debug")
-        os.makedirs(debug_dir, exist_ok=True)
 
-        cv2.imwrite(os.path.join(debug_dir, "debug_cropped.jpg"), cropped)
-        cv2.imwrite(os.path.join(debug_dir, "debug_gray.jpg"), gray)
-        cv2.imwrite(os.path.join(debug_dir, "debug_original.jpg"), image)
-        print("Received image upload")
+def get_viewfinder():
+    """How to find the scanning box in the uploaded frames: a Viewfinder, CLIENT_CROP or None.
 
-        # OCR
-        processed_pil = Image.fromarray(gray)
-        custom_config = (
-            r'--oem 3 --psm 6 -c tessedit_char_whitelist="ABCDEFGHIJKLMNOPQRSTUVWXYZ"'
+    The kiosk page crops the box itself and sends crop=viewfinder; whole
+    frames come with the size the video was shown at as view_width and
+    view_height; older kiosks send neither.
+    """
+    if request.form.get("crop") == "viewfinder":
+        return CLIENT_CROP
+    try:
+        return Viewfinder(
+            float(session["x"]),
+            float(session["y"]),
+            float(session["diameter"]),
+            float(request.form["view_width"]),
+            float(request.form["view_height"]),
         )
-        text = pytesseract.image_to_string(processed_pil, config=custom_config)
-
-        print("=== OCR RESULT ===")
-        print(text)
-        print("==================")
-
-        country_name, country_code = detect_country(text, COUNTRY_CODES)
-
-        if country_code:
-            decades = get_available_decades(country_code)
-            session["current_country"] = country_code
-
-            # If there are decades available, select the first one by default
-            if decades:
-                session["selected_decade"] = decades[0]
-                session["global_shuffle"] = False
-
-            return jsonify(
-                {
-                    "status": "success",
-                    "result": {
-                        "country": country_name,
-                        "country_code": country_code,
-                        "decades": decades,
-                    },
-                }
-            )
-            
-        else:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "No country detected. Try to center the country name in the viewfinder and ensure it's well lit.",
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def scan_hash(image_bytes, view):
+    """The frame's OCR cache key, or None when caching is off or the frame isn't worth it."""
+    if OCR_CACHE.max_entries <= 0:
+        return None
+    with STAGE_SECONDS.time(stage="frame_hash"):
+        return frame_hash(image_bytes, view)
+
+
+def detection_response(reading, capture_id=None, scan_key=None):
+    """Make the country of a reading (see ocr_pipeline.read_text) the session's current country
+    and build the JSON reply.
+
+    Matches below OCR_MIN_CONFIDENCE are already treated as no match rather
+    than a guess.  `scan_key` is the frame hash the reading came from; a
+    country found is cached under it.
+    """
+    text, country = reading["text"], reading["country"] or {}
+    log.info("OCR result: %r", text)
+
+    country_name, country_code = country.get("name"), country.get("code")
+    confidence = country.get("confidence", 0)
+    if capture_id:
+        DEBUG_CAPTURE.save(
+            capture_id,
+            {
+                RESULT_FILE: {
+                    "text": text,
+                    "country": country_name,
+                    "country_code": country_code,
+                    "confidence": confidence,
                 }
+            },
+            prune=True,
+        )
+
+    SCANS.inc(result="country" if country_code else "no_country")
+    if country_code:
+        COUNTRIES_DETECTED.inc(country=country_code)
+        OCR_CACHE.put(scan_key, reading)
+        decades = get_available_decades(country_code)
+        session["current_country"] = country_code
+
+        # If there are decades available, select the first one by default
+        if decades:
+            session["selected_decade"] = decades[0]
+            session["global_shuffle"] = False
+
+        return {
+            "status": "success",
+            "result": {
+                "country": country_name,
+                "country_code": country_code,
+                "confidence": confidence,
+                "decades": decades,
+            },
+        }
+
+    return {
+        "status": "error",
+        "message": "No country detected. Try to center the country name in the viewfinder and ensure it's well lit.",
+    }
+
+
+@app.route("/image_processing", methods=["POST"])
+@require_calibration
+def image_processing():
+    """Synchronous OCR, kept for older clients; the UI uses /ocr_jobs."""
+    try:
+        image_bytes, error = get_uploaded_photo()
+        if error:
+            return error
+        log.debug("Received image upload")
+
+        view = get_viewfinder()
+        scan_key = scan_hash(image_bytes, view)
+        cached = OCR_CACHE.get(scan_key)
+        if cached is not None:
+            return jsonify(detection_response(cached))
+
+        try:
+            capture_id = DEBUG_CAPTURE.sample() if DEBUG_CAPTURE else None
+            capture = (DEBUG_CAPTURE.directory, capture_id, "frame0-") if capture_id else None
+            reading = read_country(
+                image_bytes, capture, view, app.config["OCR_MIN_CONFIDENCE"], matcher=COUNTRY_MATCHER
             )
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        return jsonify(detection_response(reading, capture_id, scan_key))
 
     except Exception as e:
-        print(f"Error processing image: {str(e)}")
+        log.exception("Error processing image: %s", e)
+        SCANS.inc(result="error")
         return jsonify(
             {
                 "status": "error",
@@ -393,6 +521,114 @@ def image_processing():
             }
         )
 
+
+@app.route("/ocr_jobs", methods=["POST"])
+@require_calibration
+def submit_ocr_job():
+    """Queue the uploaded photo(s) for OCR and return a job id straight away.
+
+    Several "photo" fields make a burst: the frames are read in parallel and
+    the job finishes as soon as they agree on a country.
+    """
+    frames = [f.read() for f in request.files.getlist("photo") if f.filename]
+    if not frames:
+        return jsonify({"status": "error", "message": "No photo uploaded"}), 400
+    frames = frames[: app.config["OCR_BURST_MAX_FRAMES"]]
+    view = get_viewfinder()
+
+    # The same label seen again is answered from the cache without queueing a job
+    scan_key = scan_hash(frames[0], view)
+    cached = OCR_CACHE.get(scan_key)
+    if cached is not None:
+        return jsonify(detection_response(cached))
+
+    capture_id = DEBUG_CAPTURE.sample() if DEBUG_CAPTURE else None
+    captures = [
+        (DEBUG_CAPTURE.directory, capture_id, f"frame{i}-") if capture_id else None
+        for i in range(len(frames))
+    ]
+
+    # Repeated captures from one kiosk while its scan is still running share that job
+    scanner_id = session.setdefault("scanner_id", uuid.uuid4().hex)
+    min_confidence = app.config["OCR_MIN_CONFIDENCE"]
+    try:
+        if len(frames) == 1:
+            job_id, coalesced = OCR_JOBS.submit(
+                read_country, frames[0], captures[0], view, min_confidence, coalesce_key=scanner_id
+            )
+        else:
+            vote = CountryVote(exit_score=app.config["OCR_BURST_EXIT_SCORE"])
+            job_id, coalesced = OCR_JOBS.submit_burst(
+                read_country,
+                [(frame, capture, view, min_confidence) for frame, capture in zip(frames, captures)],
+                vote=vote,
+                coalesce_key=scanner_id,
+            )
+    except QueueFull:
+        return jsonify({"status": "error", "message": "Scanner busy, please try again."}), 429
+    if not coalesced:
+        session["scan_key"] = scan_key
+        if capture_id:
+            session["debug_capture_id"] = capture_id
+
+    return jsonify({"status": "pending", "job_id": job_id, "coalesced": coalesced}), 202
+
+
+@app.route("/ocr_jobs/<job_id>")
+@require_calibration
+def ocr_job_result(job_id):
+    """Poll an OCR job; ?wait=N long-polls for up to N seconds."""
+    wait = min(request.args.get("wait", 0, type=float), app.config["OCR_POLL_MAX_WAIT"])
+    state = OCR_JOBS.status(job_id, wait=max(wait, 0))
+
+    if state is None:
+        return jsonify({"status": "error", "message": "Unknown or expired scan"}), 404
+    if state["state"] == "pending":
+        return jsonify({"status": "pending", "job_id": job_id})
+    if state["state"] == "error":
+        log.error("Error processing image: %s", state["error"])
+        SCANS.inc(result="error")
+        return jsonify({"status": "error", "message": f"Error processing image: {state['error']}"})
+
+    return jsonify(
+        detection_response(
+            state["result"], session.pop("debug_capture_id", None), session.pop("scan_key", None)
+        )
+    )
+
+
+@app.route("/live_scan", methods=["POST"])
+@require_calibration
+def live_scan():
+    """Live scan: take the kiosk's newest frame; replies "scanning" until the country settles."""
+    file = request.files.get("photo")
+    if file is None or file.filename == "":
+        return jsonify({"status": "error", "message": "No photo uploaded"}), 400
+
+    scanner_id = session.setdefault("scanner_id", uuid.uuid4().hex)
+    reading = LIVE_SCANS.offer(scanner_id, file.read(), get_viewfinder())
+    if reading is None:
+        return jsonify({"status": "scanning"})
+    return jsonify(detection_response(reading))
+
+
+@app.route("/debug/captures")
+def debug_captures():
+    """Recent sampled scans: each frame at every stage, the OCR text and the country chosen."""
+    if not DEBUG_CAPTURE:
+        return "Debug capture is off (set DEBUG_CAPTURE=1)", 404
+    return render_template(
+        "debug_captures.html", captures=DEBUG_CAPTURE.captures(), dropped=DEBUG_CAPTURE.dropped
+    )
+
+
+@app.route("/debug/captures/<capture_id>/<filename>")
+def debug_capture_file(capture_id, filename):
+    if not DEBUG_CAPTURE:
+        return "Debug capture is off (set DEBUG_CAPTURE=1)", 404
+    return send_from_directory(DEBUG_CAPTURE.directory, f"{capture_id}/{filename}")
+
+
 @app.route("/select_decade/<decade>")
 @require_calibration
 def select_decade(decade):
@@ -465,9 +701,12 @@ def play_music():
     # Store song info in session
     session["song_info"] = song_info
 
+    track = ARCHIVE_INDEX.track_for_path(song_path)
+
     return jsonify({
         'status': 'success',
         'music_files': [os.path.basename(song_path)],
+        'track_id': track.id if track else None,
         'song_info': song_info,
         'country': metadata.get('country_name', 'Unknown')
     })
@@ -476,26 +715,23 @@ def play_music():
 
 @app.route("/play/<filename>")
 def play(filename):
+    """Stream a track by basename or by its index track id."""
     # First check if we have the current song path in the session
     song_path = session.get("current_song")
-    
-    # If we don't have a stored path, or the filename doesn't match, search for it
+
+    # If we don't have a stored path, or the filename doesn't match, look it up
     if not song_path or os.path.basename(song_path) != filename:
-        # Search for the file in the archive
-        for root, dirs, files in os.walk(ARCHIVE_PATH):
-            for file in files:
-                if file == filename:
-                    song_path = os.path.join(root, file)
-                    # Update the session with the found path
-                    session["current_song"] = song_path
-                    break
-            if song_path and os.path.basename(song_path) == filename:
-                break
-    
+        track = ARCHIVE_INDEX.lookup(filename)
+        song_path = track.path if track else None
+        if song_path:
+            # Update the session with the found path
+            session["current_song"] = song_path
+
     if not song_path or not os.path.exists(song_path):
         return f"Song not found: {filename}", 404
-    
-    return send_file(song_path, mimetype="audio/mpeg")
+
+    with STAGE_SECONDS.time(stage="send_audio"):
+        return send_audio(song_path, mimetype="audio/mpeg", archive_root=ARCHIVE_PATH)
   
 
 @app.route("/global_shuffle", methods=["POST"])
@@ -528,25 +764,46 @@ def global_shuffle():
         # Store song info in session
         session["song_info"] = song_info
 
+        track = ARCHIVE_INDEX.track_for_path(song_path)
+
         # Return in the same format as the play_music route
         return jsonify({
             'status': 'success',
             'music_files': [os.path.basename(song_path)],
+            'track_id': track.id if track else None,
             'song_info': song_info,
             'country': metadata.get('country_name', 'Unknown'),
             'country_code': metadata.get('country_code', '')
         })
 
     except Exception as e:
-        traceback.print_exc()
+        log.exception("Global shuffle failed: %s", e)
         return jsonify({'status': 'error', 'message': f'Error: {str(e)}'}), 500
 
 
+# ------------------------------
+# CLI
+# ------------------------------
+
+
+@app.cli.command("compile-catalog")
+def compile_catalog_command():
+    """Compile the archive's JSON sidecars into the read-only metadata catalog."""
+    catalog_file = app.config["CATALOG_FILE"]
+    count = compile_catalog(ARCHIVE_PATH, catalog_file)
+    print(f"Compiled {count} tracks into {catalog_file}; restart the app to use it")
+
+
 # ------------------------------
 # Development Server
 # ------------------------------
 
 if __name__ == "__main__":
+    # Processes of the OCR pool import __main__ again from its path before
+    # their first task, which would repeat all of the setup above (index load,
+    # archive watcher and prewarm threads) in each of them.  They only need
+    # ocr_pipeline, which OcrJobQueue preloads, so leave them no path.
+    del __file__
     app.run(host="127.0.0.1", port=5000)  # plain HTTP, local only
 
 
@@ -1,25 +1,54 @@
-from flask import Flask, session, render_template, redirect, url_for, request, jsonify, send_from_directory, send_file
+from flask import Flask, session, render_template, redirect, url_for, request, jsonify, send_from_directory
 from dotenv import load_dotenv
 load_dotenv()
 from config import DevelopmentConfig
 import os
-import cv2
-import numpy as np
-import pytesseract
 import json
-from PIL import Image
+import logging
 from functools import wraps
 import random
+from archive_index import ArchiveIndex
+from archive_watcher import ArchiveWatcher
+from audio_streaming import send_audio
+from metadata_cache import MetadataCache
+from catalog import compile_catalog, open_catalog
+from ocr_pipeline import ocr_image
+from ocr_geometry import CLIENT_CROP, Viewfinder
+from country_matcher import CountryMatcher, load_aliases
+from werkzeug.security import safe_join
+from queue_store import create_queue_store
+from shuffle import new_shuffle, next_index
+from log_setup import configure_logging
 
 app = Flask(__name__)
 app.config.from_object(DevelopmentConfig)
 
+configure_logging(
+    app.config['LOG_LEVEL'],
+    app.config['LOG_FILE'],
+    max_bytes=app.config['LOG_MAX_BYTES'],
+    backups=app.config['LOG_BACKUPS'],
+)
+log = logging.getLogger(__name__)
+
 UPLOAD_FOLDER = "uploads"
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max-limit
 
-# Update this to your actual archive path
-ARCHIVE_PATH = "/mnt/ssd/globemusic/archive"
+ARCHIVE_PATH = app.config['ARCHIVE_PATH']
+
+# Scan the archive once at startup; queues and picks read from this instead of the disk
+ARCHIVE_INDEX = ArchiveIndex(ARCHIVE_PATH, app.config["ARCHIVE_INDEX_FILE"]).load()
+if app.config["ARCHIVE_WATCH"]:
+    ArchiveWatcher(ARCHIVE_INDEX, poll_interval=app.config["ARCHIVE_POLL_INTERVAL"]).start()
+
+# Parsed sidecar metadata, re-read only when a file's mtime/size changes
+METADATA_CACHE = MetadataCache(max_entries=app.config["METADATA_CACHE_SIZE"])
+# Compiled sidecar metadata shared by all workers (None until `flask compile-catalog` is run)
+CATALOG = open_catalog(app.config["CATALOG_FILE"], ARCHIVE_PATH)
+
+# Play queues are kept server-side; the session only holds queue_id/queue_pos
+QUEUE_STORE = create_queue_store(app.config)
 
 # ------------------------------
 # Helper Functions
@@ -33,7 +62,7 @@ def load_countries():
         with open(country_file_path, "r") as f:
             return json.load(f)
     except Exception as e:
-        print(f"Error loading countries file: {e}")
+        log.error("Error loading countries file: %s", e)
         # Fallback to a minimal set in case of error
         return {
             "FRA": "France",
@@ -53,70 +82,71 @@ def require_calibration(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Image processing functions
-def crop_center(img, cropx, cropy):
-    y, x = img.shape[:2]
-    startx = x // 2 - (cropx // 2)
-    starty = y // 2 - (cropy // 2)
-    return img[starty:starty+cropy, startx:startx+cropx]
-  
 def build_queue(country, decade):
-    """Collect and shuffle songs for a given country/decade."""
-    songs = []
-    # Decide which countries to scan
-    if country == 'all':
-        country_list = [d for d in os.listdir(ARCHIVE_PATH) if os.path.isdir(os.path.join(ARCHIVE_PATH, d))]
-    else:
-        country_list = [country]
-    for c in country_list:
-        base_country = os.path.join(ARCHIVE_PATH, c)
-        if not os.path.isdir(base_country):
-            continue
-        # Decide which decades to scan
-        if decade == 'all':
-            decade_list = [d for d in os.listdir(base_country) if os.path.isdir(os.path.join(base_country, d))]
-        else:
-            decade_list = [decade]
-        for d in decade_list:
-            base_dir = os.path.join(base_country, d)
-            if not os.path.isdir(base_dir):
-                continue
-            for root, dirs, files in os.walk(base_dir):
-                for filename in files:
-                    if filename.lower().endswith('.mp3'):
-                        # Store path relative to the static folder for URL building
-                        rel_path = os.path.relpath(os.path.join(root, filename), ARCHIVE_PATH)
-                        songs.append(f"/archive/{rel_path}")
-
-                        songs.append(rel_path)
-    random.shuffle(songs)  # Shuffle the list in place:contentReference[oaicite:3]{index=3}
-    session['queue'] = songs
-
-def detect_country(text, country_codes):
-    # First try direct name matching
-    for name in country_codes:
-        if name.upper() in text.upper():
-            return name, country_codes[name]
-    
-    # If no direct match, try more fuzzy matching
-    # This could be enhanced with more sophisticated text matching
-    words = text.upper().split()
-    for name in country_codes:
-        for word in words:
-            if len(word) >= 3 and word in name.upper():
-                return name, country_codes[name]
-    
-    return None, None
+    """Collect and shuffle songs for a given country/decade into a new queue."""
+    old_queue_id = session.pop('queue_id', None)
+    if old_queue_id:
+        QUEUE_STORE.delete(old_queue_id)
+    session.pop('queue_pos', None)
+    session.pop('shuffle', None)
+
+    if country == 'all' or decade == 'all':
+        # "all" selections can span the whole archive: don't build the list at
+        # all, walk a seeded permutation of the index instead
+        tracks = ARCHIVE_INDEX.ordered_tracks(country, decade)
+        shuffle = new_shuffle(len(tracks))
+        shuffle.update(country=country, decade=decade)
+        session['shuffle'] = shuffle
+        return
+
+    # Paths are relative to ARCHIVE_PATH
+    songs = [track.rel_path for track in ARCHIVE_INDEX.tracks(country, decade)]
+    random.shuffle(songs)
+    session['queue_id'] = QUEUE_STORE.create(songs)
+    session['queue_pos'] = 0
+
+def pop_queue():
+    """Return the next song (relative path) from the session's queue, or None when it is used up."""
+    shuffle = session.get('shuffle')
+    if shuffle:
+        tracks = ARCHIVE_INDEX.ordered_tracks(shuffle['country'], shuffle['decade'])
+        if len(tracks) != shuffle['length']:
+            # The archive changed under this shuffle; start a new one over the current tracks
+            shuffle.update(new_shuffle(len(tracks)))
+        index = next_index(shuffle)
+        session['shuffle'] = shuffle
+        return tracks[index].rel_path if index is not None else None
+
+    queue_id = session.get('queue_id')
+    if not queue_id:
+        return None
+    position = session.get('queue_pos', 0)
+    song = QUEUE_STORE.get(queue_id, position)
+    if song is not None:
+        session['queue_pos'] = position + 1
+    return song
+
+def queue_remaining():
+    shuffle = session.get('shuffle')
+    if shuffle:
+        return shuffle['length'] - shuffle['cursor']
+    queue_id = session.get('queue_id')
+    if not queue_id:
+        return 0
+    return max(QUEUE_STORE.length(queue_id) - session.get('queue_pos', 0), 0)
+
+def detect_country(text):
+    """(name, code, confidence) of the best country match in OCR text, or (None, None, 0).
+
+    Matches below OCR_MIN_CONFIDENCE are treated as no match rather than a guess.
+    """
+    candidate = COUNTRY_MATCHER.best(text, min_confidence=app.config['OCR_MIN_CONFIDENCE'])
+    if candidate is None:
+        return None, None, 0
+    return candidate.name, candidate.code, candidate.confidence
 
 def get_available_decades(country_code):
-    country_path = os.path.join(ARCHIVE_PATH, country_code)
-    if not os.path.isdir(country_path):
-        return []
-
-    decades = [
-        d for d in os.listdir(country_path)
-        if os.path.isdir(os.path.join(country_path, d)) and d != "images"
-    ]
+    decades = [d for d in ARCHIVE_INDEX.decades(country_code) if d != "images"]
 
     if decades and "all" not in decades:
         decades.append("all")
@@ -125,78 +155,46 @@ def get_available_decades(country_code):
 
 
 
-def pick_song(country_code, decade):
-    """Pick a random song from the country and decade"""
-    if decade == "all":
-        # Get all decade directories
-        country_path = os.path.join(ARCHIVE_PATH, country_code)
-        decades = [
-            d
-            for d in os.listdir(country_path)
-            if os.path.isdir(os.path.join(country_path, d)) and d != "all"
-        ]
-
-        # Randomly select a decade
-        if not decades:
-            return None, None
-        decade = random.choice(decades)
-
-    dir_path = os.path.join(ARCHIVE_PATH, country_code, decade)
-    if not os.path.isdir(dir_path):
-        return None, None
+def load_song_metadata(song_path):
+    """Sidecar metadata for a song: the compiled catalog if it has the track, else the JSON files."""
+    # <track>.json first, then any other sidecar in the song's folder
+    sidecars = ARCHIVE_INDEX.sidecars(os.path.dirname(song_path))
+    track_sidecar = ARCHIVE_INDEX.track_sidecar(song_path)
+    if track_sidecar:
+        sidecars = [track_sidecar] + [p for p in sidecars if p != track_sidecar]
+    if CATALOG:
+        # Unless a sidecar changed since the catalog was compiled
+        metadata = CATALOG.metadata(song_path, sidecars)
+        if metadata is not None:
+            return metadata
+    return METADATA_CACHE.first(sidecars)
 
-    # Look for subdirectories that might contain songs
-    songs = []
-    for root, dirs, files in os.walk(dir_path):
-        mp3s = [f for f in files if f.lower().endswith(".mp3")]
-        for mp3 in mp3s:
-            songs.append((os.path.join(root, mp3), root))
 
-    if not songs:
+def pick_song(country_code, decade):
+    """Pick a random song from the country and decade"""
+    track = ARCHIVE_INDEX.random_track(country_code, decade)
+    if not track:
         return None, None
 
-    # Select a random song
-    song_path, song_dir = random.choice(songs)
+    song_path = track.path
 
     # Try to find metadata json file
-    metadata = {}
-    json_files = [f for f in os.listdir(song_dir) if f.lower().endswith(".json")]
-    for json_file in json_files:
-        try:
-            with open(os.path.join(song_dir, json_file), "r") as f:
-                metadata = json.load(f)
-                break
-        except:
-            continue
+    metadata = load_song_metadata(song_path)
 
     return song_path, metadata
 def get_music_files(country_code, decade):
+    # Paths are relative to the decade folder, or to the country folder for "all"
     if decade == "all":
-        # Get files from all decades
-        music_files = []
-        country_path = os.path.join(ARCHIVE_PATH, country_code)
-        for decade_dir in os.listdir(country_path):
-            if os.path.isdir(os.path.join(country_path, decade_dir)) and decade_dir != "all":
-                decade_path = os.path.join(country_path, decade_dir)
-                files = [os.path.join(decade_dir, f) for f in os.listdir(decade_path) 
-                         if f.endswith(('.mp3', '.wav', '.ogg'))]
-                music_files.extend(files)
+        base = country_code
     else:
-        # Get files from specific decade
-        decade_path = os.path.join(ARCHIVE_PATH, country_code, decade)
-        if os.path.isdir(decade_path):
-            music_files = [f for f in os.listdir(decade_path) 
-                           if f.endswith(('.mp3', '.wav', '.ogg'))]
-        else:
-            music_files = []
-    
-    return music_files
+        base = os.path.join(country_code, decade)
+    return [os.path.relpath(t.rel_path, base) for t in ARCHIVE_INDEX.tracks(country_code, decade)]
   
 
 # Load the countries at app startup
 COUNTRIES = load_countries()
-# Reverse lookup (name to code)
-COUNTRY_CODES = {v: k for k, v in COUNTRIES.items()}
+# Finds country names in OCR text; built once instead of scanning every name per scan
+COUNTRY_MATCHER = CountryMatcher(COUNTRIES, load_aliases())
 
 # ------------------------------
 # Routes
@@ -251,14 +249,45 @@ def main_interface():
         country_name=country_name,
         decades=decades,
         selected_decade=selected_decade,
-        song_info=song_info
+        song_info=song_info,
+        capture=capture_settings()
     )
 
+def capture_settings():
+    # Upload size/quality and the quality gate for the kiosk's captures
+    return {
+        'max_side': app.config['CAPTURE_MAX_SIDE'],
+        'quality': app.config['CAPTURE_QUALITY'],
+        'min_sharpness': app.config['CAPTURE_MIN_SHARPNESS'],
+        'min_brightness': app.config['CAPTURE_MIN_BRIGHTNESS'],
+        'max_brightness': app.config['CAPTURE_MAX_BRIGHTNESS'],
+    }
+
 @app.route('/archive/<path:filename>')
 def serve_archive_file(filename):
-    return send_from_directory(ARCHIVE_PATH, filename)
+    path = safe_join(ARCHIVE_PATH, filename)
+    if path is None:
+        return "Not found", 404
+    return send_audio(path, archive_root=ARCHIVE_PATH)
 
   
+def get_viewfinder():
+    # Calibrated viewfinder for whole-frame uploads, CLIENT_CROP for frames the
+    # kiosk page cropped itself, None for older kiosks
+    if request.form.get('crop') == 'viewfinder':
+        return CLIENT_CROP
+    try:
+        return Viewfinder(
+            float(session['x']),
+            float(session['y']),
+            float(session['diameter']),
+            float(request.form['view_width']),
+            float(request.form['view_height']),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 @app.route('/image_processing', methods=['POST'])
 @require_calibration
 def image_processing():
@@ -270,38 +299,16 @@ def image_processing():
         if file.filename == '':
             return jsonify({'status': 'error', 'message': 'Empty filename'}), 400
 
-        # Convert to OpenCV format
-        file_bytes = np.frombuffer(file.read(), np.uint8)
-        image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-        if image is None:
-            return jsonify({'status': 'error', 'message': 'Failed to decode image'}), 400
-
-        # Crop the center
-        cropped = crop_center(image, 200, 350)
-
-        # Convert to grayscale and threshold
-        gray = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY)
+        log.debug("Received image upload")
 
-        # Optional: Save debug images (for development only)
-        debug_dir = os.path.join(app.static_folder, 'debug')
-        os.makedirs(debug_dir, exist_ok=True)
-        
-        cv2.imwrite(os.path.join(debug_dir, "debug_cropped.jpg"), cropped)
-        cv2.imwrite(os.path.join(debug_dir, "debug_gray.jpg"), gray)
-        cv2.imwrite(os.path.join(debug_dir, "debug_original.jpg"), image)
-        print("Received image upload")
-
-        # OCR       
-        processed_pil = Image.fromarray(gray)
-        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist="ABCDEFGHIJKLMNOPQRSTUVWXYZ"'
-        text = pytesseract.image_to_string(processed_pil, config=custom_config)
+        try:
+            text = ocr_image(file.read(), view=get_viewfinder())
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
 
-        print("=== OCR RESULT ===")
-        print(text)
-        print("==================")
+        log.info("OCR result: %r", text)
 
-        country_name, country_code = detect_country(text, COUNTRY_CODES)
+        country_name, country_code, confidence = detect_country(text)
 
         if country_code:
             decades = get_available_decades(country_code)
@@ -316,6 +323,7 @@ def image_processing():
                 "result": {
                     "country": country_name,
                     "country_code": country_code,
+                    "confidence": confidence,
                     "decades": decades,
                 }
             })
@@ -326,7 +334,7 @@ def image_processing():
             })
 
     except Exception as e:
-        print(f"Error processing image: {str(e)}")
+        log.exception("Error processing image: %s", e)
         return jsonify({
             "status": "error",
             "message": f"Error processing image: {str(e)}",
@@ -344,8 +352,7 @@ def select_decade(decade):
     if decade in decades:
         session['selected_decade'] = decade
 
-        # Reset and rebuild the queue for the new country/decade selection
-        session.pop('queue', None)
+        # Rebuild the queue for the new country/decade selection
         build_queue(country_code, decade)
         
     return redirect(url_for('main_ui'))
@@ -391,38 +398,21 @@ def play_music():
         build_queue(country_code, decade)
         
         # Get the first song from the queue
-        queue = session.get('queue', [])
-        if not queue:
+        first_song = pop_queue()
+        if first_song is None:
             return jsonify({
                 "status": "error",
                 "message": f"No music found for {COUNTRIES.get(country_code, country_code)} in {decade}"
             })
         
-        # Get the first song path and remove it from the queue
-        first_song = queue.pop(0)
-        session['queue'] = queue
-        
-        # Make sure we have the full path to the song
-        if first_song.startswith(ARCHIVE_PATH):
-            song_path = first_song
-        else:
-            song_path = os.path.join(ARCHIVE_PATH, first_song)
+        song_path = os.path.join(ARCHIVE_PATH, first_song)
         
         # Store current song info in session
         session["current_song"] = song_path
         session["current_decade"] = decade
         
         # Get metadata if available
-        metadata = {}
-        song_dir = os.path.dirname(song_path)
-        json_files = [f for f in os.listdir(song_dir) if f.lower().endswith(".json")]
-        for json_file in json_files:
-            try:
-                with open(os.path.join(song_dir, json_file), "r") as f:
-                    metadata = json.load(f)
-                    break
-            except:
-                continue
+        metadata = load_song_metadata(song_path)
         
         # Store song info in session
         session["song_info"] = metadata
@@ -434,10 +424,10 @@ def play_music():
             "decade": decade,
             "song_info": metadata,
             "play_url": f"/play/{os.path.basename(song_path)}",
-            "queue_size": len(queue)
+            "queue_size": queue_remaining()
         })
     except Exception as e:
-        print(f"Error selecting music: {str(e)}")
+        log.exception("Error selecting music: %s", e)
         return jsonify({
             "status": "error",
             "message": f"Error selecting music: {str(e)}"
@@ -446,43 +436,26 @@ def play_music():
 # Update the next_song route to serve the next song in the queue
 @app.route('/next_song')
 def next_song():
-    queue = session.get('queue', [])
-    if not queue:
+    next_song_path = pop_queue()
+    if next_song_path is None:
         # If queue is empty, try to rebuild using the last country/decade
         country_code = session.get('current_country')
         decade = session.get('selected_decade')
         if country_code and decade:
             build_queue(country_code, decade)
-            queue = session.get('queue', [])
-            if not queue:
+            next_song_path = pop_queue()
+            if next_song_path is None:
                 return jsonify({"status": "error", "message": "No more songs in queue"}), 404
         else:
             return jsonify({"status": "error", "message": "Queue is empty"}), 404
 
-    # Get the next song path and remove it from the queue
-    next_song_path = queue.pop(0)
-    session['queue'] = queue
-    
-    # Make sure we have the full path to the song
-    if next_song_path.startswith(ARCHIVE_PATH):
-        song_path = next_song_path
-    else:
-        song_path = os.path.join(ARCHIVE_PATH, next_song_path)
+    song_path = os.path.join(ARCHIVE_PATH, next_song_path)
     
     # Update current song in session
     session["current_song"] = song_path
     
     # Get metadata if available
-    metadata = {}
-    song_dir = os.path.dirname(song_path)
-    json_files = [f for f in os.listdir(song_dir) if f.lower().endswith(".json")]
-    for json_file in json_files:
-        try:
-            with open(os.path.join(song_dir, json_file), "r") as f:
-                metadata = json.load(f)
-                break
-        except:
-            continue
+    metadata = load_song_metadata(song_path)
     
     # Store song info in session
     session["song_info"] = metadata
@@ -494,14 +467,29 @@ def next_song():
         "filename": filename,
         "play_url": f"/play/{filename}",
         "song_info": metadata,
-        "queue_size": len(queue)
+        "queue_size": queue_remaining()
     })
 
 @app.route('/music/<country_code>/<decade>/<path:filename>')
 def serve_music(country_code, decade, filename):
     """Serve music files from the archive"""
-    music_dir = os.path.join(ARCHIVE_PATH, country_code, decade)
-    return send_from_directory(music_dir, filename)
+    path = safe_join(ARCHIVE_PATH, country_code, decade, filename)
+    if path is None:
+        return "Not found", 404
+    return send_audio(path, archive_root=ARCHIVE_PATH)
+
+# ------------------------------
+# CLI
+# ------------------------------
+
+
+@app.cli.command("compile-catalog")
+def compile_catalog_command():
+    """Compile the archive's JSON sidecars into the read-only metadata catalog."""
+    catalog_file = app.config["CATALOG_FILE"]
+    count = compile_catalog(ARCHIVE_PATH, catalog_file)
+    print(f"Compiled {count} tracks into {catalog_file}; restart the app to use it")
+
 
 # ------------------------------
 # Development Server
@@ -509,10 +497,6 @@ def serve_music(country_code, decade, filename):
 
 if __name__ == "__main__":
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    
-    # Create debug directory if it doesn't exist
-    debug_dir = os.path.join(app.static_folder, 'debug')
-    os.makedirs(debug_dir, exist_ok=True)
 
     # For development with camera access
     app.run(host="0.0.0.0", port=5000)
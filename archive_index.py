@@ -0,0 +1,506 @@
+# archive_index.py
+#
+# In-memory catalog of the music archive.
+#
+# The archive is laid out as <ARCHIVE_PATH>/<country>/<decade>/.../<track>.mp3.
+# Walking that tree on every play takes seconds on a large archive, so we scan
+# it once at startup, keep every track in flat arrays (one per decade, one per
+# country and one for the whole archive) and pick from those in O(1).  Tracks
+# can also be looked up by basename or by a stable id in O(1).  The names of
+# the JSON metadata sidecars in each directory are recorded during the same
+# walk, so finding a track's metadata never needs a directory listing.
+#
+# The scan result is also written to a small JSON file.  On the next start we
+# only stat the directories recorded in it; if none of them changed we rebuild
+# the arrays from the file instead of walking the archive again.
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+TRACK_EXTENSIONS = (".mp3",)
+SIDECAR_EXTENSION = ".json"
+
+# rel_path is relative to the archive root, country/decade are None for
+# tracks that sit above the <country>/<decade> level.
+Track = namedtuple("Track", ["id", "path", "rel_path", "country", "decade"])
+
+
+def make_track_id(rel_path):
+    """Stable id for a track: the same relative path always gives the same id."""
+    return hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:12]
+
+
+class TrackBucket:
+    """A list of tracks with O(1) add, remove and random choice."""
+
+    def __init__(self):
+        self._tracks = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __iter__(self):
+        return iter(list(self._tracks))
+
+    def __contains__(self, rel_path):
+        return rel_path in self._positions
+
+    def get(self, rel_path):
+        pos = self._positions.get(rel_path)
+        return None if pos is None else self._tracks[pos]
+
+    def add(self, track):
+        if track.rel_path in self._positions:
+            return
+        self._positions[track.rel_path] = len(self._tracks)
+        self._tracks.append(track)
+
+    def discard(self, rel_path):
+        pos = self._positions.pop(rel_path, None)
+        if pos is None:
+            return
+        # Swap the last track into the hole so removal stays O(1)
+        last = self._tracks.pop()
+        if pos < len(self._tracks):
+            self._tracks[pos] = last
+            self._positions[last.rel_path] = pos
+
+    def choice(self, exclude=None):
+        """Pick a random track, avoiding `exclude` (a rel_path) when possible."""
+        tracks = self._tracks
+        if not tracks:
+            return None
+        pos = self._positions.get(exclude) if exclude else None
+        if pos is None or len(tracks) == 1:
+            return random.choice(tracks)
+        # Draw from the other n-1 slots by skipping over the excluded one
+        i = random.randrange(len(tracks) - 1)
+        if i >= pos:
+            i += 1
+        return tracks[i]
+
+
+class ArchiveIndex:
+    """Country -> decade -> track index over an archive directory."""
+
+    def __init__(self, root, cache_file=None):
+        self.root = os.path.abspath(root)
+        self.cache_file = cache_file
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._all = TrackBucket()
+        self._countries = {}  # country -> TrackBucket of all its tracks
+        self._decades = {}  # country -> {decade: TrackBucket}
+        self._dir_mtimes = {}  # rel dir path -> mtime, used to validate the cache
+        self._by_id = {}  # track id -> Track
+        self._by_name = {}  # basename -> [Track, ...], more than one if duplicated
+        self._ordered = {}  # (country, decade) -> sorted tuple of tracks, see ordered_tracks
+        self._all_countries = {}  # decade -> TrackBucket merged over every country, see _bucket
+        self._sidecars = {}  # rel dir path -> sorted list of .json filenames in it
+
+    # ------------------------------
+    # Building
+    # ------------------------------
+
+    def load(self, rebuild=False):
+        """Load the index from the cache file if it is still valid, else scan."""
+        with self._lock:
+            if not rebuild and self._load_cache():
+                log.info("Loaded %d tracks from %s", len(self._all), self.cache_file)
+            else:
+                self.scan()
+                self.save()
+                log.info("Scanned %d tracks under %s", len(self._all), self.root)
+            duplicates = self.duplicate_names()
+            if duplicates:
+                log.warning(
+                    "%d filenames are shared by more than one track (e.g. %s); "
+                    "use track ids to play those reliably",
+                    len(duplicates),
+                    duplicates[0],
+                )
+            return self
+
+    def scan(self):
+        """Walk the archive and rebuild the whole index."""
+        with self._lock:
+            self._reset()
+            if not os.path.isdir(self.root):
+                # Still record the root, so the cache is stale and the watcher
+                # picks the archive up once it appears (e.g. a disk mounted late)
+                log.warning("Archive %s does not exist", self.root)
+                self._add_dir("", None)
+                return self
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                rel_dir = self._rel(dirpath)
+                self._add_dir(rel_dir, _mtime(dirpath))
+                for fname in filenames:
+                    if _is_track(fname):
+                        self._add_track(os.path.join(rel_dir, fname))
+                    elif _is_sidecar(fname):
+                        self._add_sidecar(os.path.join(rel_dir, fname))
+            return self
+
+    def save(self):
+        """Write the index to the cache file (atomically)."""
+        if not self.cache_file:
+            return
+        with self._lock:
+            data = {
+                "version": INDEX_VERSION,
+                "root": self.root,
+                "dirs": self._dir_mtimes,
+                "tracks": [t.rel_path for t in self._all],
+                "sidecars": self._sidecars,
+            }
+        tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            log.warning("Could not write index cache %s: %s", self.cache_file, e)
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return False
+        try:
+            with open(self.cache_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable index cache: %s", e)
+            return False
+
+        if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+            return False
+
+        # Adding or removing an entry changes the parent directory's mtime, so
+        # an unchanged set of directory mtimes means an unchanged archive.
+        dirs = data.get("dirs", {})
+        if "" not in dirs:
+            # Written before the root was always recorded; can't be validated
+            return False
+        for rel_dir, mtime in dirs.items():
+            if _mtime(os.path.join(self.root, rel_dir)) != mtime:
+                return False
+
+        self._reset()
+        for rel_dir, mtime in dirs.items():
+            self._add_dir(rel_dir, mtime)
+        for rel_path in data.get("tracks", []):
+            self._add_track(rel_path)
+        self._sidecars = data.get("sidecars", {})
+        return True
+
+    def _rel(self, path):
+        rel = os.path.relpath(path, self.root)
+        return "" if rel == os.curdir else rel
+
+    def _add_dir(self, rel_dir, mtime):
+        self._dir_mtimes[rel_dir] = mtime
+        parts = rel_dir.split(os.sep) if rel_dir else []
+        if len(parts) >= 1:
+            self._countries.setdefault(parts[0], TrackBucket())
+            self._decades.setdefault(parts[0], {})
+        if len(parts) >= 2:
+            self._decades[parts[0]].setdefault(parts[1], TrackBucket())
+
+    def _add_track(self, rel_path):
+        if rel_path in self._all:
+            return None
+        parts = rel_path.split(os.sep)
+        country = parts[0] if len(parts) > 1 else None
+        decade = parts[1] if len(parts) > 2 else None
+        track = Track(
+            make_track_id(rel_path), os.path.join(self.root, rel_path), rel_path, country, decade
+        )
+        self._ordered.clear()
+        self._all_countries.clear()
+
+        self._all.add(track)
+        self._by_id[track.id] = track
+        self._by_name.setdefault(os.path.basename(rel_path), []).append(track)
+        if country:
+            self._countries.setdefault(country, TrackBucket()).add(track)
+        if decade:
+            self._decades.setdefault(country, {}).setdefault(decade, TrackBucket()).add(track)
+        return track
+
+    def _remove_track(self, track):
+        self._ordered.clear()
+        self._all_countries.clear()
+        self._all.discard(track.rel_path)
+        self._by_id.pop(track.id, None)
+        name = os.path.basename(track.rel_path)
+        same_name = [t for t in self._by_name.get(name, []) if t.rel_path != track.rel_path]
+        if same_name:
+            self._by_name[name] = same_name
+        else:
+            self._by_name.pop(name, None)
+        if track.country:
+            self._countries[track.country].discard(track.rel_path)
+        if track.decade:
+            self._decades[track.country][track.decade].discard(track.rel_path)
+
+    def _add_sidecar(self, rel_path):
+        rel_dir, name = os.path.split(rel_path)
+        names = self._sidecars.setdefault(rel_dir, [])
+        if name in names:
+            return False
+        names.append(name)
+        names.sort()
+        return True
+
+    def _remove_sidecar(self, rel_path):
+        rel_dir, name = os.path.split(rel_path)
+        names = self._sidecars.get(rel_dir, [])
+        if name not in names:
+            return False
+        names.remove(name)
+        if not names:
+            del self._sidecars[rel_dir]
+        return True
+
+    # ------------------------------
+    # Incremental updates (used by archive_watcher)
+    # ------------------------------
+
+    def add_path(self, path):
+        """Index a new track or a whole new directory tree. Returns True if anything changed."""
+        with self._lock:
+            rel = self._rel(path)
+            if rel.startswith(os.pardir):
+                return False
+            changed = False
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    rel_dir = self._rel(dirpath)
+                    changed |= rel_dir not in self._dir_mtimes
+                    self._add_dir(rel_dir, _mtime(dirpath))
+                    for fname in filenames:
+                        if _is_track(fname):
+                            changed |= self._add_track(os.path.join(rel_dir, fname)) is not None
+                        elif _is_sidecar(fname):
+                            changed |= self._add_sidecar(os.path.join(rel_dir, fname))
+            elif _is_track(path) and os.path.exists(path):
+                changed = self._add_track(rel) is not None
+            elif _is_sidecar(path) and os.path.exists(path):
+                changed = self._add_sidecar(rel)
+            self._touch_dir(os.path.dirname(rel))
+            return changed
+
+    def remove_path(self, path):
+        """Drop a track or a whole directory tree. Returns True if anything changed."""
+        with self._lock:
+            rel = self._rel(path)
+            if not rel or rel.startswith(os.pardir):
+                return False
+            self._touch_dir(os.path.dirname(rel))
+
+            track = self._all.get(rel)
+            if track:
+                self._remove_track(track)
+                return True
+            if _is_sidecar(rel) and self._remove_sidecar(rel):
+                return True
+            if rel not in self._dir_mtimes:
+                return False
+
+            prefix = rel + os.sep
+            for track in self._narrowest_bucket(rel):
+                if track.rel_path.startswith(prefix):
+                    self._remove_track(track)
+            for rel_dir in [d for d in self._dir_mtimes if d == rel or d.startswith(prefix)]:
+                del self._dir_mtimes[rel_dir]
+                self._sidecars.pop(rel_dir, None)
+
+            parts = rel.split(os.sep)
+            if len(parts) == 1:
+                self._countries.pop(rel, None)
+                self._decades.pop(rel, None)
+            elif len(parts) == 2:
+                self._decades.get(parts[0], {}).pop(parts[1], None)
+            return True
+
+    def refresh_dir(self, path):
+        """Sync one directory's direct children with the disk. Returns True if anything changed."""
+        with self._lock:
+            if not os.path.isdir(path):
+                return self.remove_path(path)
+            rel_dir = self._rel(path)
+            try:
+                entries = set(os.listdir(path))
+            except OSError:
+                return False
+            self._dir_mtimes[rel_dir] = _mtime(path)
+
+            known_tracks = {
+                os.path.basename(t.rel_path)
+                for t in self._narrowest_bucket(rel_dir)
+                if os.path.dirname(t.rel_path) == rel_dir
+            }
+            known_dirs = {
+                os.path.basename(d)
+                for d in self._dir_mtimes
+                if d and d != rel_dir and os.path.dirname(d) == rel_dir
+            }
+
+            known = known_tracks | known_dirs | set(self._sidecars.get(rel_dir, []))
+
+            changed = False
+            for name in known - entries:
+                changed |= self.remove_path(os.path.join(path, name))
+            for name in entries - known:
+                full_path = os.path.join(path, name)
+                if os.path.isdir(full_path) or _is_track(name) or _is_sidecar(name):
+                    changed |= self.add_path(full_path)
+            return changed
+
+    def stale_dirs(self):
+        """Absolute paths of indexed directories whose mtime no longer matches the disk."""
+        with self._lock:
+            dirs = list(self._dir_mtimes.items())
+        return [
+            os.path.join(self.root, rel_dir)
+            for rel_dir, mtime in dirs
+            if _mtime(os.path.join(self.root, rel_dir)) != mtime
+        ]
+
+    def directories(self):
+        """Absolute paths of every indexed directory."""
+        with self._lock:
+            return [os.path.join(self.root, d) for d in self._dir_mtimes]
+
+    def _touch_dir(self, rel_dir):
+        if rel_dir in self._dir_mtimes:
+            self._dir_mtimes[rel_dir] = _mtime(os.path.join(self.root, rel_dir))
+
+    def _narrowest_bucket(self, rel_dir):
+        parts = rel_dir.split(os.sep) if rel_dir else []
+        if len(parts) >= 2:
+            return self._decades.get(parts[0], {}).get(parts[1]) or TrackBucket()
+        if len(parts) == 1:
+            return self._countries.get(parts[0]) or TrackBucket()
+        return self._all
+
+    # ------------------------------
+    # Queries
+    # ------------------------------
+
+    def __len__(self):
+        return len(self._all)
+
+    def countries(self):
+        with self._lock:
+            return sorted(self._decades)
+
+    def decades(self, country_code):
+        """Decade directories under a country, including empty ones."""
+        with self._lock:
+            return sorted(self._decades.get(country_code, {}))
+
+    def tracks(self, country_code="all", decade="all"):
+        """All tracks for a country/decade selection ("all" matches anything)."""
+        with self._lock:
+            return list(self._bucket(country_code, decade))
+
+    def ordered_tracks(self, country_code="all", decade="all"):
+        """Tracks for a selection sorted by path, as a shared tuple.
+
+        Every process builds the same order for the same archive, so positions
+        in it (used by lazy shuffles) mean the same track on every worker.  The
+        tuple is cached until the index changes.
+        """
+        key = (country_code, decade)
+        with self._lock:
+            ordered = self._ordered.get(key)
+            if ordered is None:
+                ordered = tuple(sorted(self._bucket(country_code, decade), key=lambda t: t.rel_path))
+                self._ordered[key] = ordered
+            return ordered
+
+    def random_track(self, country_code="all", decade="all", exclude_path=None):
+        """Pick a random track in O(1), avoiding `exclude_path` if possible."""
+        exclude = self._rel(os.path.abspath(exclude_path)) if exclude_path else None
+        with self._lock:
+            return self._bucket(country_code, decade).choice(exclude)
+
+    def lookup(self, name_or_id):
+        """Find a track by id or by basename in O(1).
+
+        An id always identifies one track.  If several tracks share a basename
+        the first one indexed is returned.
+        """
+        with self._lock:
+            track = self._by_id.get(name_or_id)
+            if track:
+                return track
+            same_name = self._by_name.get(name_or_id)
+            return same_name[0] if same_name else None
+
+    def track_for_path(self, path):
+        """The indexed track at an absolute path, or None."""
+        with self._lock:
+            return self._all.get(self._rel(os.path.abspath(path)))
+
+    def sidecars(self, dir_path):
+        """Absolute paths of the .json sidecars in a directory, in name order."""
+        rel_dir = self._rel(dir_path)
+        with self._lock:
+            names = list(self._sidecars.get(rel_dir, ()))
+        return [os.path.join(self.root, rel_dir, name) for name in names]
+
+    def track_sidecar(self, track_path):
+        """Path of the <track>.json sidecar next to a track, or None if there isn't one."""
+        json_path = os.path.splitext(track_path)[0] + SIDECAR_EXTENSION
+        rel_dir, name = os.path.split(self._rel(json_path))
+        with self._lock:
+            return json_path if name in self._sidecars.get(rel_dir, ()) else None
+
+    def duplicate_names(self):
+        """Basenames that belong to more than one track."""
+        with self._lock:
+            return sorted(name for name, tracks in self._by_name.items() if len(tracks) > 1)
+
+    def _bucket(self, country_code, decade):
+        if country_code == "all":
+            if decade == "all":
+                return self._all
+            # Only used by app2's "all countries, one decade" queues.  Merging
+            # is O(N), so the bucket is kept until a track is added or removed.
+            bucket = self._all_countries.get(decade)
+            if bucket is None:
+                bucket = TrackBucket()
+                for decades in self._decades.values():
+                    for track in decades.get(decade, ()):
+                        bucket.add(track)
+                self._all_countries[decade] = bucket
+            return bucket
+        if decade == "all":
+            return self._countries.get(country_code) or TrackBucket()
+        return self._decades.get(country_code, {}).get(decade) or TrackBucket()
+
+
+def _is_track(name):
+    return name.lower().endswith(TRACK_EXTENSIONS)
+
+
+def _is_sidecar(name):
+    return name.lower().endswith(SIDECAR_EXTENSION)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,228 @@
+# archive_watcher.py
+#
+# Keeps an ArchiveIndex in sync with the archive directory while the app runs,
+# so new decade folders or tracks show up without a rescan or a gunicorn HUP.
+#
+# On Linux we use inotify (through ctypes, no extra dependency) and apply each
+# create/delete/move event to the index as it arrives.  Anywhere else, or if
+# inotify can't be set up, we fall back to polling the directory mtimes that
+# the index already records and refreshing only the directories that changed.
+#
+# The watcher runs in a daemon thread per process.  Under gunicorn each worker
+# imports the app and starts its own watcher (don't combine with --preload,
+# threads don't survive the fork).
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self, timeout):
+        """Yield (wd, mask, name) tuples, waiting up to `timeout` seconds for the first one."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ArchiveWatcher:
+    """Background thread applying filesystem changes to an ArchiveIndex."""
+
+    def __init__(self, index, poll_interval=30.0, save_delay=10.0, use_inotify=True):
+        self.index = index
+        self.poll_interval = poll_interval
+        self.save_delay = save_delay
+        self.use_inotify = use_inotify
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._watches = {}  # wd -> absolute directory path
+        self._dirty_since = None
+
+    def start(self):
+        if self._thread:
+            return self
+        if self.use_inotify:
+            try:
+                self._inotify = Inotify()
+                for path in self.index.directories():
+                    self._watch(path)
+                self.mode = "inotify"
+            except (OSError, AttributeError) as e:
+                # AttributeError: libc without inotify_init1 (macOS etc.)
+                log.warning("inotify unavailable (%s), falling back to polling", e)
+                self._close_inotify()
+        if not self._inotify:
+            self.mode = "poll"
+
+        self._thread = threading.Thread(target=self._run, name="archive-watcher", daemon=True)
+        self._thread.start()
+        log.info("Watching %s (%s)", self.index.root, self.mode)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._close_inotify()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._inotify:
+                    changed = self._process_inotify(timeout=1.0)
+                    if not self._watches:
+                        # Nothing to watch yet, e.g. the archive's disk isn't
+                        # mounted; look for it every poll interval
+                        changed |= self._resync()
+                        self._stop.wait(self.poll_interval)
+                else:
+                    changed = self.poll_once()
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                log.exception("Error while watching archive: %s", e)
+                changed = False
+                self._stop.wait(self.poll_interval)
+            self._maybe_save(changed)
+        self._maybe_save(False, force=True)
+
+    def poll_once(self):
+        """Refresh every directory whose mtime moved. Returns True if the index changed."""
+        changed = False
+        for path in self.index.stale_dirs():
+            changed |= self.index.refresh_dir(path)
+        return changed
+
+    def _process_inotify(self, timeout):
+        changed = False
+        for wd, mask, name in self._inotify.read_events(timeout):
+            if mask & IN_Q_OVERFLOW:
+                # The kernel dropped events; catch up from directory mtimes
+                log.warning("inotify queue overflowed, resyncing")
+                changed |= self._resync()
+                continue
+
+            dir_path = self._watches.get(wd)
+            if dir_path is None:
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # The parent's IN_DELETE/IN_MOVED_FROM updates the index
+                continue
+
+            path = os.path.join(dir_path, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                changed |= self.index.remove_path(path)
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Watch first, then index the subtree so nothing copied in
+                # between is missed
+                for dirpath, _dirs, _files in os.walk(path):
+                    self._watch(dirpath)
+                changed |= self.index.add_path(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed |= self.index.add_path(path)
+        return changed
+
+    def _resync(self):
+        # Catch up from directory mtimes and watch any directory that's new
+        changed = self.poll_once()
+        for path in self.index.directories():
+            self._watch(path)
+        return changed
+
+    def _watch(self, path):
+        try:
+            wd = self._inotify.add_watch(path)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise
+        self._watches[wd] = path
+
+    def _maybe_save(self, changed, force=False):
+        # Batch cache writes so a large copy into the archive isn't written
+        # out after every file
+        now = time.monotonic()
+        if changed and self._dirty_since is None:
+            self._dirty_since = now
+        if self._dirty_since is None:
+            return
+        if force or now - self._dirty_since >= self.save_delay:
+            self.index.save()
+            self._dirty_since = None
+
+    def _close_inotify(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+        self._watches = {}
@@ -0,0 +1,147 @@
+# audio_streaming.py
+#
+# Serving audio files for the <audio> element.
+#
+# Browsers fetch audio with Range requests and re-request on every seek, so we
+# answer them with 206 partial responses and honour ETag / If-None-Match /
+# If-Range.  Flask's send_file handles ranges too, but it wraps the body in a
+# Python iterator once a range is applied, which means the worker copies every
+# byte itself.  Here the file is seeked to the start of the range and handed to
+# the server's wsgi.file_wrapper with an exact Content-Length, so gunicorn can
+# push just that slice with os.sendfile (zero-copy).
+#
+# For deployments behind nginx/Apache the bytes can be offloaded completely:
+# with AUDIO_OFFLOAD set we only return an X-Accel-Redirect or X-Sendfile
+# header and the proxy streams the file (and handles ranges) without holding
+# a Python worker.
+import mimetypes
+import os
+import stat as stat_module
+from urllib.parse import quote
+
+from flask import Response, current_app, request
+from werkzeug.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+
+
+def send_audio(path, mimetype=None, archive_root=None):
+    """Return a (possibly partial) response streaming the file at `path`.
+
+    `archive_root` is needed for X-Accel-Redirect, where the internal URI is
+    built from the path relative to it.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return Response("Not found", status=404)
+    # Directories (e.g. /archive/<decade folder> on app2) and devices aren't tracks
+    if not stat_module.S_ISREG(stat.st_mode):
+        return Response("Not found", status=404)
+
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    size = stat.st_size
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+    last_modified = int(stat.st_mtime)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{etag}"',
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": "no-cache",
+    }
+
+    offload = current_app.config.get("AUDIO_OFFLOAD")
+    if offload:
+        return _offload_response(path, mimetype, headers, offload, archive_root)
+
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    start, end = 0, size
+    status = 200
+    if request.range and _if_range_matches(etag, last_modified):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None and len(request.range.ranges) == 1:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status=416, headers=headers)
+        if byte_range is not None:
+            # Multi-range requests fall through to a full 200 response
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    length = end - start
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status=status, headers=headers, mimetype=mimetype)
+
+    try:
+        f = open(path, "rb")
+    except OSError:
+        # Removed or made unreadable since the stat
+        return Response("Not found", status=404)
+    f.seek(start)
+    return Response(
+        _file_body(f, length),
+        status=status,
+        headers=headers,
+        mimetype=mimetype,
+        direct_passthrough=True,
+    )
+
+
+def _file_body(f, length):
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None:
+        # The server stops at Content-Length; gunicorn uses sendfile from the
+        # current file offset for this
+        return file_wrapper(f, CHUNK_SIZE)
+    return _read_range(f, length)
+
+
+def _read_range(f, length):
+    try:
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return int(request.if_modified_since.timestamp()) >= last_modified
+    return False
+
+
+def _if_range_matches(etag, last_modified):
+    """A Range is only honoured if If-Range (when sent) still matches the file."""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return int(if_range.date.timestamp()) == last_modified
+    return True
+
+
+def _offload_response(path, mimetype, headers, offload, archive_root):
+    headers = dict(headers)
+    if offload == "x-accel-redirect":
+        if archive_root is None:
+            raise ValueError("X-Accel-Redirect needs the archive root to build the internal URI")
+        prefix = current_app.config.get("AUDIO_OFFLOAD_PREFIX", "/archive-internal/")
+        rel_path = os.path.relpath(path, archive_root)
+        headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(rel_path.replace(os.sep, "/"))
+    elif offload == "x-sendfile":
+        headers["X-Sendfile"] = path
+    else:
+        raise ValueError(f"Unknown AUDIO_OFFLOAD mode: {offload}")
+    # The proxy fills in the body, Content-Length and Content-Range itself
+    headers.pop("Accept-Ranges")
+    return Response(status=200, headers=headers, mimetype=mimetype)
@@ -0,0 +1,204 @@
+# benchmarks/archive_routes.py
+#
+# Latency and throughput of the archive-backed routes as the archive grows.
+#
+#     python -m benchmarks.archive_routes [--sizes 1000 10000 100000] [--app app]
+#                                         [--requests 500] [--output results.json]
+#                                         [--compare baseline.json]
+#
+# Run from the repository root.  For each size a synthetic archive (see
+# benchmarks/synthetic_archive.py) is written to a temp dir and the app is
+# imported in a fresh process with ARCHIVE_PATH pointing at it and the index
+# cache, catalog and metrics directory all in the temp dir, so nothing on the
+# machine's real archive is read or written.  Requests go through Flask's test
+# client, one after another, so the numbers are the app's own time without a
+# server or network in front of it.
+#
+# "boot" is the cold import, including the first scan of the archive.  Each
+# route then gets --requests calls and reports p50/p95/p99 and requests per
+# second.  --output saves the results as JSON; --compare prints the change
+# against a saved run, e.g. one made on the previous commit.
+#
+# /select_decade is left out: its redirect points at a view that doesn't
+# exist, so it only ever measures the error page.
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_archive import DECADES, generate
+
+ROUTES = {
+    "app": ["navigate_decades", "play_music", "play", "global_shuffle"],
+    "app2": ["play_music", "next_song", "archive"],
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(timings, errors, elapsed):
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "rps": len(timings) / elapsed if elapsed else 0.0,
+    }
+
+
+def run_child(module, requests, country, decade):
+    """Import the app and time its routes. Runs in the benchmark's child process."""
+    started = time.perf_counter()
+    app_module = __import__(module)
+    boot_ms = (time.perf_counter() - started) * 1000
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session.update(x=320, y=240, diameter=200, current_country=country, selected_decade=decade)
+    client.get("/play_music")  # sets current_song and, for app2, the queue
+
+    def request(route):
+        if route == "navigate_decades":
+            return client.get("/navigate_decades/next")
+        if route == "play_music":
+            return client.get("/play_music")
+        if route == "next_song":
+            return client.get("/next_song")
+        if route == "global_shuffle":
+            response = client.post("/global_shuffle")
+            # Back to the country so the other routes keep their selection
+            with client.session_transaction() as session:
+                session.update(global_shuffle=False, current_country=country, selected_decade=decade)
+            return response
+        with client.session_transaction() as session:
+            song_path = session.get("current_song")
+        if route == "play":
+            return client.get(f"/play/{os.path.basename(song_path)}", headers={"Range": "bytes=0-1023"})
+        rel_path = os.path.relpath(song_path, app_module.ARCHIVE_PATH)
+        return client.get(f"/archive/{rel_path}", headers={"Range": "bytes=0-1023"})
+
+    results = {"boot_ms": boot_ms, "tracks": len(app_module.ARCHIVE_INDEX), "routes": {}}
+    for route in ROUTES[module]:
+        timings = []
+        errors = 0
+        loop_started = time.perf_counter()
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = request(route)
+            timings.append(time.perf_counter() - started)
+            if response.status_code >= 400 or (response.is_json and response.get_json().get("status") == "error"):
+                errors += 1
+            response.close()
+        results["routes"][route] = summarize(timings, errors, time.perf_counter() - loop_started)
+    return results
+
+
+def measure(module, size, countries, decades, depth, sidecars, requests):
+    tracks = max(size // (countries * decades), 1)
+    workdir = tempfile.mkdtemp(prefix="globo-bench-")
+    try:
+        started = time.perf_counter()
+        archive = generate(workdir, countries=countries, decades=decades, tracks=tracks, depth=depth, sidecars=sidecars)
+        generate_s = time.perf_counter() - started
+
+        env = dict(
+            os.environ,
+            ARCHIVE_PATH=archive,
+            ARCHIVE_INDEX_FILE=os.path.join(workdir, "archive_index.json"),
+            ARCHIVE_WATCH="0",
+            CATALOG_FILE=os.path.join(workdir, "catalog.sqlite3"),
+            METRICS_DIR=os.path.join(workdir, "metrics"),
+            OCR_PREWARM="0",
+            LOG_LEVEL="WARNING",
+        )
+        env.setdefault("SECRET_KEY", "benchmark")
+        country = sorted(os.listdir(archive))[0]
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.archive_routes", "--child", module,
+             "--requests", str(requests), "--country", country, "--decade", DECADES[0]],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        # The app may print while booting; the child's JSON is the last line
+        results = json.loads(output.strip().splitlines()[-1])
+        results["generate_s"] = generate_s
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(size, results, baseline=None):
+    print(f"\n{size} tracks ({results['tracks']} indexed)   boot {results['boot_ms']:.0f} ms   "
+          f"generated in {results['generate_s']:.1f} s")
+    print(f"  {'route':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}")
+    for route, stats in results["routes"].items():
+        line = (f"  {route:<18}{stats['p50_ms']:9.2f}{stats['p95_ms']:9.2f}{stats['p99_ms']:9.2f}"
+                f"{stats['rps']:9.0f}{stats['errors']:8d}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p95_ms"]:
+            line += f"   p95 {100 * (stats['p95_ms'] / old['p95_ms'] - 1):+.0f}% vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the archive routes on synthetic archives")
+    parser.add_argument("--app", default="app", choices=sorted(ROUTES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="total tracks")
+    parser.add_argument("--countries", type=int, default=20)
+    parser.add_argument("--decades", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=0, help="nested folders below each decade")
+    parser.add_argument("--sidecars", type=float, default=1.0, help="fraction of tracks with a JSON sidecar")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON saved by an earlier --output")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--country", help=argparse.SUPPRESS)
+    parser.add_argument("--decade", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        results = run_child(args.child, args.requests, args.country, args.decade)
+        print(json.dumps(results))
+        sys.stdout.flush()
+        os._exit(0)  # skip shutdown of the OCR pool threads the app starts
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            saved = json.load(f)
+        if saved["app"] != args.app:
+            parser.error(f"{args.compare} is a run of {saved['app']}, not {args.app}")
+        baseline = saved["sizes"]
+
+    report = {
+        "app": args.app,
+        "shape": {"countries": args.countries, "decades": args.decades, "depth": args.depth, "sidecars": args.sidecars},
+        "requests": args.requests,
+        "sizes": {},
+    }
+    for size in args.sizes:
+        results = measure(args.app, size, args.countries, args.decades, args.depth, args.sidecars, args.requests)
+        report["sizes"][str(size)] = results
+        print_results(size, results, baseline.get(str(size)))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/catalog_lookup.py
+#
+# Cost of a track's first metadata lookup in a fresh process: reading its JSON
+# sidecar (MetadataCache) against the compiled catalog (catalog.py).
+#
+#     python -m benchmarks.catalog_lookup [--size 20000] [--lookups 3000]
+#
+# Run from the repository root.  A synthetic archive (see
+# benchmarks/synthetic_archive.py) and its catalog are written to a temp dir.
+# Each run is a new process that scans the archive into an ArchiveIndex and
+# then looks up the metadata of --lookups random tracks, each once, as the
+# first plays after a restart would.
+#
+# "cold" runs first evict the archive's and the catalog's file pages from the
+# OS page cache (posix_fadvise DONTNEED, no root needed), so each sidecar read
+# goes to the disk as it would on a machine that just booted; inodes stay
+# cached, so the per-lookup os.stat that both paths make is cheap in both.
+# "warm" runs leave the page cache alone.
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_archive import generate
+
+
+def run_child(mode, archive, catalog_file, lookups):
+    """Time first lookups through one path. Runs in the benchmark's child process."""
+    from archive_index import ArchiveIndex
+    from catalog import open_catalog
+    from metadata_cache import MetadataCache
+
+    index = ArchiveIndex(archive).scan()
+    paths = [os.path.join(index.root, track.rel_path) for track in index.tracks()]
+    random.Random(0).shuffle(paths)
+    paths = paths[:lookups]
+    cache = MetadataCache()
+    catalog = open_catalog(catalog_file, archive)
+
+    started = time.perf_counter()
+    for path in paths:
+        sidecars = [index.track_sidecar(path)]
+        if mode == "catalog":
+            metadata = catalog.metadata(path, sidecars)
+        else:
+            metadata = cache.first(sidecars)
+        if metadata is None:
+            raise RuntimeError(f"No metadata for {path}")
+    return (time.perf_counter() - started) * 1e6 / len(paths)
+
+
+def evict(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time first metadata lookups: sidecars vs the catalog")
+    parser.add_argument("--size", type=int, default=20000, help="total tracks")
+    parser.add_argument("--lookups", type=int, default=3000, help="tracks looked up per run")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "ARCHIVE", "CATALOG"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(*args.child, args.lookups)))
+        return
+
+    from catalog import compile_catalog
+
+    workdir = tempfile.mkdtemp(prefix="globo-catalog-")
+    try:
+        archive = generate(workdir, countries=40, decades=5, tracks=max(args.size // 200, 1))
+        catalog_file = os.path.join(workdir, "catalog.sqlite3")
+        started = time.perf_counter()
+        count = compile_catalog(archive, catalog_file)
+        print(f"Compiled {count} tracks in {time.perf_counter() - started:.2f} s")
+        os.sync()
+
+        print(f"  {'':<8}{'sidecars us':>13}{'catalog us':>12}")
+        for cache in ("cold", "warm"):
+            timings = {"sidecars": [], "catalog": []}
+            for _ in range(args.runs):
+                for mode in timings:
+                    if cache == "cold":
+                        evict(workdir)
+                    output = subprocess.run(
+                        [sys.executable, "-m", "benchmarks.catalog_lookup", "--lookups", str(args.lookups),
+                         "--child", mode, archive, catalog_file],
+                        capture_output=True,
+                        text=True,
+                        check=True,
+                    ).stdout
+                    timings[mode].append(json.loads(output.strip().splitlines()[-1]))
+            print(f"  {cache:<8}{min(timings['sidecars']):13.1f}{min(timings['catalog']):12.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
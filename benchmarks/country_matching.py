@@ -0,0 +1,103 @@
+# benchmarks/country_matching.py
+#
+# Cost of finding a country in OCR text (country_matcher.py), paid once per
+# OCR'd frame: in the OCR worker processes for scan jobs, bursts and live
+# scan, and in the request for the synchronous /image_processing path.
+#
+#     python -m benchmarks.country_matching [--runs 200] [--seed 0]
+#
+# Run from the repository root.  Each case is a set of generated OCR texts:
+# random letter noise of 5, 20 and 40 words (nothing to find, so the fuzzy
+# pass does all its work), country names with Tesseract-style misreads, and
+# those names buried in noise.  For each case it reports p50/p95/max per text
+# for CountryMatcher.best() and, for scale, for the substring scan that
+# detect_country did before the matcher existed.
+import argparse
+import json
+import random
+import string
+import time
+
+from country_matcher import CONFUSABLE, COUNTRIES_FILE, CountryMatcher, load_aliases
+
+
+def baseline_detect(text, countries):
+    # detect_country as it was before CountryMatcher, for comparison
+    for name in countries:
+        if name.upper() in text.upper():
+            return name
+    words = text.upper().split()
+    for name in countries:
+        for word in words:
+            if len(word) >= 3 and word in name.upper():
+                return name
+    return None
+
+
+def noise(rng, words):
+    return " ".join(
+        "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 9))) for _ in range(words)
+    )
+
+
+def misread(rng, name, errors):
+    letters = list(name.upper())
+    for _ in range(errors):
+        i = rng.randrange(len(letters))
+        group = next((g for g in CONFUSABLE if letters[i] in g), None)
+        if group:
+            letters[i] = rng.choice([c for c in group if c != letters[i]])
+    return "".join(letters)
+
+
+def cases(names, runs, rng):
+    return {
+        "noise 5 words": [noise(rng, 5) for _ in range(runs)],
+        "noise 20 words": [noise(rng, 20) for _ in range(runs)],
+        "noise 40 words": [noise(rng, 40) for _ in range(runs)],
+        "exact name": [rng.choice(names).upper() for _ in range(runs)],
+        "misread name": [misread(rng, rng.choice(names), 2) for _ in range(runs)],
+        "misread in noise": [
+            f"{noise(rng, 3)} {misread(rng, rng.choice(names), 1)} {noise(rng, 3)}" for _ in range(runs)
+        ],
+    }
+
+
+def time_each(fn, texts):
+    timings = []
+    for text in texts:
+        started = time.perf_counter()
+        fn(text)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        "max_ms": timings[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time country matching on generated OCR text")
+    parser.add_argument("--runs", type=int, default=200, help="texts per case")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(COUNTRIES_FILE, "r", encoding="utf-8") as f:
+        countries = json.load(f)
+    by_name = {name: code for code, name in countries.items()}
+    started = time.perf_counter()
+    matcher = CountryMatcher(countries, load_aliases())
+    print(f"CountryMatcher built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    rng = random.Random(args.seed)
+    print(f"  {'case':<20}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'baseline p95':>14}")
+    for case, texts in cases(sorted(by_name), args.runs, rng).items():
+        stats = time_each(matcher.best, texts)
+        baseline = time_each(lambda text: baseline_detect(text, by_name), texts)
+        print(f"  {case:<20}{stats['p50_ms']:9.2f}{stats['p95_ms']:9.2f}{stats['max_ms']:9.2f}"
+              f"{baseline['p95_ms']:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
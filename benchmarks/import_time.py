@@ -0,0 +1,68 @@
+# benchmarks/import_time.py
+#
+# How long a fresh interpreter takes to import the app, i.e. what each
+# gunicorn worker pays at boot and after every HUP before it can serve.
+#
+#     python -m benchmarks.import_time [--runs 5] [--module app] [--prewarm]
+#
+# Run from the repository root (SECRET_KEY must be set, as config.py needs it).
+# Each run imports the module in a new process and reports the time and which
+# OCR libraries ended up loaded.  The OCR prewarm thread is off unless
+# --prewarm is given, so the numbers are the import alone.  To compare
+# before/after a change, run it on both checkouts.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+OCR_LIBRARIES = ["cv2", "numpy", "PIL", "pytesseract", "tesserocr"]
+
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(json.dumps({"ms": elapsed * 1000, "loaded": [m for m in sys.argv[2:] if m in sys.modules]}))
+sys.stdout.flush()
+os._exit(0)  # skip shutdown of the watcher/OCR pool threads the app starts
+"""
+
+
+def measure(module, prewarm):
+    env = dict(os.environ, OCR_PREWARM="1" if prewarm else "0")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, module] + OCR_LIBRARIES,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # The app prints while booting; the probe's JSON is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a cold import of the app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--prewarm", action="store_true", help="leave the OCR prewarm thread on")
+    args = parser.parse_args()
+
+    timings = []
+    loaded = set()
+    for _ in range(args.runs):
+        result = measure(args.module, args.prewarm)
+        timings.append(result["ms"])
+        loaded.update(result["loaded"])
+
+    print(
+        f"import {args.module}: median {statistics.median(timings):7.1f} ms   "
+        f"min {min(timings):7.1f} ms   max {max(timings):7.1f} ms   ({args.runs} runs)"
+    )
+    print(f"OCR libraries loaded at import: {', '.join(sorted(loaded)) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+# benchmarks/kiosk_load.py
+#
+# Load test: many kiosks going through the main_ui.html flow at once against a
+# real server, to size gunicorn workers and threads.
+#
+#     python -m benchmarks.kiosk_load [--kiosks 20] [--duration 60] [--think 1 3]
+#                                     [--workers 2] [--threads 4] [--tracks 10000]
+#                                     [--ocr-path jobs|sync] [--burst 3]
+#                                     [--url http://127.0.0.1:8000] [--output results.json]
+#
+# Run from the repository root.  Without --url it writes a synthetic archive
+# (benchmarks/synthetic_archive.py) to a temp dir and starts gunicorn on
+# app:app against it with --workers/--threads, the index cache, catalog, OCR
+# job results and metrics also in the temp dir; with --url it drives a server
+# that's already running, on whatever archive that has.
+#
+# Each kiosk is a thread with its own cookie session that calibrates once
+# (/save) and then repeats a visit: scan a photo of a label, step to the next
+# decade (/navigate_decades, then the /main page it redirects to), ask for a
+# track (/play_music) and stream the start of it with range requests
+# (/play/<file>), pausing a random think time from --think between steps.  When the scan finds no country the kiosk
+# presses global shuffle instead (/global_shuffle), as a visitor would, so the
+# music routes still get their share.  Photos are labels rendered by
+# benchmarks/ocr_accuracy.py for the archive's countries, or --photos.
+#
+# The scan takes the UI's path by default (--ocr-path jobs): a
+# burst of --burst frames posted to /ocr_jobs, then long-polls of
+# /ocr_jobs/<id>?wait=2 (recorded as "ocr_poll") until the job is done, so
+# the OCR pool, its 429s and polls answered by another worker are all in the
+# numbers.  --ocr-path sync uploads one frame to /image_processing instead,
+# as older clients do.  The gunicorn started here runs with OCR_CACHE_SIZE=0
+# unless it's set in the environment, since the scan cache would otherwise
+# answer the few rendered photos without any OCR after the first minute.
+#
+# Reports requests, errors (HTTP >= 400, {"status": "error"} replies and
+# failed connections) and p50/p95/p99/max latency per route, and throughput.
+import argparse
+import glob
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from benchmarks.synthetic_archive import generate
+
+SCREEN = {"x": 640, "y": 360, "diameter": 560, "view_width": 1280, "view_height": 720}
+PLAY_CHUNK = 256 * 1024
+PLAY_RANGES = 2
+POLL_WAIT = 2  # seconds, as OCR_POLL_WAIT in circular_ui.js
+POLL_TIMEOUT = 30
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Report /navigate_decades's 302 as its own request; the kiosk then loads /main
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Per-route latencies and error counts, shared by all kiosk threads."""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, error=None):
+        with self._lock:
+            self.timings[route].append(seconds)
+            if error:
+                self.errors[route] += 1
+                self.error_samples.setdefault(route, error)
+
+
+class Kiosk:
+    def __init__(self, base_url, photos, recorder, think, rng, ocr_path="jobs", burst=3):
+        self.base_url = base_url.rstrip("/")
+        self.photos = photos
+        self.ocr_path = ocr_path
+        self.burst = burst
+        self.recorder = recorder
+        self.think = think
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, route, path, data=None, headers=None, method=None):
+        """Make one request and record it. Returns (status, body), or (None, None) on failure."""
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers or {}, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except (OSError, urllib.error.URLError) as e:
+            self.recorder.add(route, time.perf_counter() - started, f"{type(e).__name__}: {e}")
+            return None, None
+        elapsed = time.perf_counter() - started
+
+        error = None
+        if status >= 400:
+            error = f"HTTP {status}"
+        elif body[:1] == b"{":
+            try:
+                reply = json.loads(body)
+            except ValueError:
+                reply = {}
+            if reply.get("status") == "error":
+                error = reply.get("message", "error")
+        self.recorder.add(route, elapsed, error)
+        return status, body
+
+    def pause(self):
+        time.sleep(self.rng.uniform(*self.think))
+
+    def calibrate(self):
+        body = json.dumps({k: SCREEN[k] for k in ("x", "y", "diameter")}).encode()
+        self.request("save", "/save", body, {"Content-Type": "application/json"})
+
+    def scan(self):
+        """Scan a photo the way --ocr-path says. Returns whether a country was found."""
+        photo = self.rng.choice(self.photos)
+        if self.ocr_path == "sync":
+            status, reply = self.upload("image_processing", "/image_processing", [photo])
+        else:
+            status, reply = self.upload("ocr_jobs", "/ocr_jobs", [photo] * self.burst)
+            if status == 202:
+                status, reply = self.poll(json.loads(reply)["job_id"])
+        try:
+            return status == 200 and json.loads(reply).get("status") == "success"
+        except (TypeError, ValueError):
+            return False
+
+    def upload(self, route, path, frames):
+        boundary = uuid.uuid4().hex
+        fields = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{SCREEN[name]}\r\n'.encode()
+            for name in ("view_width", "view_height")
+        ]
+        for i, frame in enumerate(frames):
+            fields.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="photo"; filename="capture{i}.jpg"\r\n'
+                f"Content-Type: image/jpeg\r\n\r\n".encode() + frame + b"\r\n"
+            )
+        body = b"".join(fields) + f"--{boundary}--\r\n".encode()
+        return self.request(route, path, body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    def poll(self, job_id):
+        """Long-poll an OCR job until it isn't pending. Returns the last (status, body)."""
+        deadline = time.monotonic() + POLL_TIMEOUT
+        while True:
+            status, reply = self.request("ocr_poll", f"/ocr_jobs/{job_id}?wait={POLL_WAIT}")
+            try:
+                pending = status == 200 and json.loads(reply).get("status") == "pending"
+            except (TypeError, ValueError):
+                pending = False
+            if not pending or time.monotonic() >= deadline:
+                return status, reply
+
+    def play(self, route, path, method=None):
+        status, reply = self.request(route, path, method=method)
+        try:
+            files = json.loads(reply).get("music_files") if status == 200 else None
+        except (TypeError, ValueError):
+            files = None
+        if not files:
+            return
+        self.pause()
+        for i in range(PLAY_RANGES):
+            start = i * PLAY_CHUNK
+            status, _ = self.request(
+                "play", f"/play/{urllib.request.quote(files[0])}", headers={"Range": f"bytes={start}-{start + PLAY_CHUNK - 1}"}
+            )
+            if status != 206:
+                break
+
+    def visit(self):
+        found = self.scan()
+        self.pause()
+        if found:
+            self.request("navigate_decades", "/navigate_decades/next")
+            self.request("main", "/main")
+            self.pause()
+            self.play("play_music", "/play_music")
+        else:
+            self.play("global_shuffle", "/global_shuffle", method="POST")
+        self.pause()
+
+    def run(self, deadline):
+        self.calibrate()
+        while time.monotonic() < deadline:
+            self.visit()
+
+
+def render_photos(country_codes, count, seed):
+    """JPEG frames of the archive's country names, as the kiosk camera would send them."""
+    from benchmarks.ocr_accuracy import VARIANTS, available_fonts, render
+
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "countries.json"), "r") as f:
+        names = json.load(f)
+    rng = random.Random(seed)
+    fonts = available_fonts() or [None]
+    return [
+        render(names[rng.choice(country_codes)], rng.choice(VARIANTS), rng.choice(fonts), rng)
+        for _ in range(count)
+    ]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(args, workdir, archive):
+    port = free_port()
+    env = dict(
+        os.environ,
+        ARCHIVE_PATH=archive,
+        ARCHIVE_INDEX_FILE=os.path.join(workdir, "archive_index.json"),
+        ARCHIVE_WATCH="0",
+        CATALOG_FILE=os.path.join(workdir, "catalog.sqlite3"),
+        OCR_JOBS_DIR=os.path.join(workdir, "ocr_jobs"),
+        METRICS_DIR=os.path.join(workdir, "metrics"),
+        LOG_LEVEL="WARNING",
+    )
+    env.setdefault("SECRET_KEY", "benchmark")
+    env.setdefault("OCR_CACHE_SIZE", "0")
+    command = [
+        args.gunicorn, "--workers", str(args.workers), "--threads", str(args.threads),
+        "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app",
+    ]
+    log_file = open(os.path.join(workdir, "gunicorn.log"), "w")
+    server = subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.boot_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}; see {log_file.name}")
+        try:
+            urllib.request.urlopen(url + "/calibrate", timeout=1).close()
+            return server, url
+        except OSError:
+            time.sleep(0.2)
+    server.send_signal(signal.SIGTERM)
+    raise RuntimeError(f"gunicorn did not answer within {args.boot_timeout} s; see {log_file.name}")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def report(recorder, elapsed):
+    routes = {}
+    for route, timings in recorder.timings.items():
+        routes[route] = {
+            "requests": len(timings),
+            "errors": recorder.errors[route],
+            "error_rate": recorder.errors[route] / len(timings),
+            "rps": len(timings) / elapsed,
+            "p50_ms": percentile(timings, 0.50) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000,
+            "p99_ms": percentile(timings, 0.99) * 1000,
+            "max_ms": max(timings) * 1000,
+            "mean_ms": statistics.mean(timings) * 1000,
+        }
+    total = sum(len(t) for t in recorder.timings.values())
+    return {
+        "seconds": elapsed,
+        "requests": total,
+        "rps": total / elapsed,
+        "errors": sum(recorder.errors.values()),
+        "routes": routes,
+        "first_errors": dict(recorder.error_samples),
+    }
+
+
+def print_report(summary):
+    print(f"\n{summary['requests']} requests in {summary['seconds']:.1f} s   {summary['rps']:.1f} req/s   "
+          f"{summary['errors']} errors")
+    print(f"  {'route':<18}{'requests':>9}{'req/s':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for route, stats in sorted(summary["routes"].items()):
+        print(f"  {route:<18}{stats['requests']:9d}{stats['rps']:8.1f}{stats['error_rate']:8.1%}"
+              f"{stats['p50_ms']:9.1f}{stats['p95_ms']:9.1f}{stats['p99_ms']:9.1f}{stats['max_ms']:9.1f}")
+    for route, error in summary["first_errors"].items():
+        print(f"  first {route} error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay concurrent kiosk sessions against a server")
+    parser.add_argument("--kiosks", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--think", type=float, nargs=2, default=[1.0, 3.0], metavar=("MIN", "MAX"),
+                        help="seconds between a kiosk's steps")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which the kiosks start")
+    parser.add_argument("--url", help="drive this running server instead of starting gunicorn")
+    parser.add_argument("--ocr-path", choices=["jobs", "sync"], default="jobs",
+                        help="scan through /ocr_jobs as the UI does, or the synchronous /image_processing")
+    parser.add_argument("--burst", type=int, default=3, help="frames per /ocr_jobs scan")
+    parser.add_argument("--gunicorn", default="gunicorn", help="gunicorn executable")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--boot-timeout", type=float, default=60)
+    parser.add_argument("--countries", type=int, default=20)
+    parser.add_argument("--decades", type=int, default=5)
+    parser.add_argument("--tracks", type=int, default=10000, help="total tracks in the synthetic archive")
+    parser.add_argument("--frames", type=int, default=1200, help="silent mp3 frames per track (1200 is ~30 s)")
+    parser.add_argument("--photos", help="glob of JPEGs to upload instead of rendered labels")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="globo-load-")
+    server = None
+    try:
+        codes = None
+        if args.url:
+            url = args.url
+        else:
+            per_folder = max(args.tracks // (args.countries * args.decades), 1)
+            archive = generate(workdir, countries=args.countries, decades=args.decades, tracks=per_folder,
+                               frames=args.frames, seed=args.seed)
+            codes = sorted(os.listdir(archive))
+            server, url = start_gunicorn(args, workdir, archive)
+            print(f"gunicorn on {url}: {args.workers} worker(s) x {args.threads} thread(s), "
+                  f"{per_folder * args.countries * args.decades} tracks")
+
+        if args.photos:
+            photos = []
+            for path in sorted(glob.glob(args.photos)):
+                with open(path, "rb") as f:
+                    photos.append(f.read())
+            if not photos:
+                parser.error(f"no photos match {args.photos}")
+        else:
+            if codes is None:
+                with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "countries.json"), "r") as f:
+                    codes = sorted(json.load(f))[: args.countries]
+            photos = render_photos(codes, 32, args.seed)
+
+        recorder = Recorder()
+        deadline = time.monotonic() + args.ramp + args.duration
+        kiosks = [
+            Kiosk(url, photos, recorder, args.think, random.Random(args.seed + i), args.ocr_path, args.burst)
+            for i in range(args.kiosks)
+        ]
+        threads = []
+        started = time.monotonic()
+        for i, kiosk in enumerate(kiosks):
+            thread = threading.Thread(target=kiosk.run, args=(deadline,), name=f"kiosk-{i}", daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(args.ramp / max(args.kiosks, 1))
+        for thread in threads:
+            thread.join()
+        summary = report(recorder, time.monotonic() - started)
+        summary["setup"] = {
+            "kiosks": args.kiosks,
+            "think": args.think,
+            "ocr_path": args.ocr_path,
+            "burst": args.burst if args.ocr_path == "jobs" else None,
+            "url": args.url,
+            "workers": None if args.url else args.workers,
+            "threads": None if args.url else args.threads,
+            "tracks": None if args.url else args.tracks,
+        }
+        print_report(summary)
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(summary, f, indent=2)
+            print(f"\nSaved to {args.output}")
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
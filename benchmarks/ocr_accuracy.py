@@ -0,0 +1,336 @@
+# benchmarks/ocr_accuracy.py
+#
+# How often a scan finds the right country, and how long each OCR stage takes,
+# measured on rendered globe labels instead of a camera.
+#
+#     python -m benchmarks.ocr_accuracy [--variants clean,blur,...] [--countries 50]
+#                                       [--engine tesserocr] [--stages clahe,threshold,regions]
+#                                       [--output results.json] [--baseline results.json]
+#                                       [--save-images DIR]
+#
+# Run from the repository root (SECRET_KEY must be set, as config.py needs it).
+# Every name in countries.json is printed in capitals on a globe-coloured
+# camera frame, once per variant: clean, curved along the globe, rotated,
+# blurred, noisy, unevenly lit, and "mixed" (a little of everything).  Fonts
+# cycle through the ones installed.  Each frame goes through what a kiosk scan
+# does: JPEG upload, ocr_pipeline.ocr_image_timed with the calibrated
+# viewfinder, then the country matcher with OCR_MIN_CONFIDENCE, as in
+# app.detect_country.  Renders are seeded, so two runs see the same images.
+#
+# The report has the accuracy overall and per variant, the most frequent
+# confusions (country expected -> country read, or "-" for none) and the
+# median/p95 of each pipeline stage.  --output saves it; --baseline compares
+# against a saved report and exits with status 1 if accuracy dropped by more
+# than --max-accuracy-drop or the p95 scan time grew by more than
+# --max-slowdown, so it can gate a change to the crop, the preprocessing or
+# the Tesseract settings.
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from config import DevelopmentConfig
+from country_matcher import CountryMatcher, load_aliases
+from ocr_engine import create_engine
+from ocr_geometry import ROI_SCALE, Viewfinder
+from ocr_pipeline import ocr_image_timed
+from ocr_preprocess import ALL_STAGES, config_from_env
+
+VARIANTS = ["clean", "curve", "rotation", "blur", "noise", "lighting", "mixed"]
+FONTS = [
+    "DejaVuSans-Bold.ttf",
+    "DejaVuSans.ttf",
+    "DejaVuSerif-Bold.ttf",
+    "DejaVuSerif.ttf",
+    "DejaVuSansMono.ttf",
+    "LiberationSans-Bold.ttf",
+    "LiberationSerif-Regular.ttf",
+    "FreeSans.ttf",
+]
+COUNTRIES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "countries.json")
+
+# A 720p frame shown full screen, calibrated with the viewfinder in the middle
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+VIEW = Viewfinder(FRAME_WIDTH / 2, FRAME_HEIGHT / 2, 560, FRAME_WIDTH, FRAME_HEIGHT)
+BOX_SIZE = int(VIEW.diameter * ROI_SCALE)
+JPEG_QUALITY = 85
+
+OCEAN = (205, 170, 120)  # BGR
+LAND = [(150, 200, 225), (140, 205, 170), (175, 190, 230), (190, 180, 200)]
+INK = [(30, 30, 30), (60, 40, 20), (20, 20, 90)]
+
+
+def available_fonts():
+    fonts = []
+    for name in FONTS:
+        try:
+            ImageFont.truetype(name, 12)
+        except OSError:
+            continue
+        fonts.append(name)
+    return fonts
+
+
+def wrap(draw, words, font, width):
+    lines = []
+    for word in words:
+        if lines and draw.textlength(f"{lines[-1]} {word}", font=font) <= width:
+            lines[-1] = f"{lines[-1]} {word}"
+        else:
+            lines.append(word)
+    return lines
+
+
+def text_mask(name, font_name, width, height):
+    """The label as a float mask (1 = ink), centred, as large as fits the box."""
+    mask = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(mask)
+    words = name.upper().split()
+    for size in range(44, 11, -2):
+        font = ImageFont.truetype(font_name, size) if font_name else ImageFont.load_default()
+        lines = wrap(draw, words, font, width)
+        boxes = [draw.textbbox((0, 0), line, font=font) for line in lines]
+        line_height = int(size * 1.25)
+        if max(b[2] - b[0] for b in boxes) <= width and line_height * len(lines) <= height:
+            break
+    top = (height - line_height * len(lines)) // 2
+    for i, (line, box) in enumerate(zip(lines, boxes)):
+        draw.text(((width - (box[2] - box[0])) // 2 - box[0], top + i * line_height), line, fill=255, font=font)
+    return np.asarray(mask, np.float32) / 255
+
+
+def curve(mask, amount):
+    """Bend the label along an arc, as text follows a globe's latitude."""
+    height, width = mask.shape
+    xs = np.arange(width, dtype=np.float32)
+    offsets = amount * ((xs - width / 2) / (width / 2)) ** 2
+    map_x = np.tile(xs, (height, 1))
+    map_y = np.arange(height, dtype=np.float32)[:, None] + offsets[None, :]
+    return cv2.remap(mask, map_x, map_y, cv2.INTER_LINEAR, borderValue=0)
+
+
+def rotate(mask, degrees):
+    height, width = mask.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), degrees, 1.0)
+    return cv2.warpAffine(mask, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=0)
+
+
+def light(frame, rng, strength):
+    """A directional light falloff plus a vignette."""
+    height, width = frame.shape[:2]
+    angle = rng.uniform(0, 2 * np.pi)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    ramp = (np.cos(angle) * (xs / width - 0.5) + np.sin(angle) * (ys / height - 0.5)) * 2
+    radius = np.hypot(xs / width - 0.5, ys / height - 0.5) / 0.7
+    gain = (1 + strength * 0.5 * ramp) * (1 - strength * 0.4 * radius ** 2)
+    return frame * gain[:, :, None]
+
+
+def render(name, variant, font_name, rng):
+    """A JPEG camera frame with `name` printed under the viewfinder, distorted per `variant`."""
+    mixed = variant == "mixed"
+    frame = np.empty((FRAME_HEIGHT, FRAME_WIDTH, 3), np.float32)
+    frame[:] = OCEAN
+    # A landmass behind the label, a little bigger than the scanning box
+    land = BOX_SIZE * rng.uniform(0.55, 0.8)
+    cx, cy = int(VIEW.x), int(VIEW.y)
+    cv2.ellipse(frame, (cx, cy), (int(land), int(land * rng.uniform(0.7, 1.0))), rng.uniform(0, 180),
+                0, 360, rng.choice(LAND), -1)
+
+    mask = text_mask(name, font_name, int(BOX_SIZE * 0.9), int(BOX_SIZE * 0.8))
+    if variant == "curve" or mixed:
+        mask = curve(mask, rng.uniform(6, 18) * (0.5 if mixed else 1) * rng.choice([-1, 1]))
+    if variant == "rotation" or mixed:
+        mask = rotate(mask, rng.uniform(-15, 15) * (0.5 if mixed else 1))
+    top = cy - mask.shape[0] // 2
+    left = cx - mask.shape[1] // 2
+    region = frame[top : top + mask.shape[0], left : left + mask.shape[1]]
+    region[:] = region * (1 - mask[:, :, None]) + np.float32(rng.choice(INK)) * mask[:, :, None]
+
+    if variant == "lighting" or mixed:
+        frame = light(frame, rng, rng.uniform(0.6, 1.0) * (0.5 if mixed else 1))
+    if variant == "blur" or mixed:
+        frame = cv2.GaussianBlur(frame, (0, 0), rng.uniform(1.2, 2.5) * (0.5 if mixed else 1))
+    if variant == "noise" or mixed:
+        sigma = rng.uniform(10, 22) * (0.5 if mixed else 1)
+        frame = frame + np.random.default_rng(rng.randrange(2 ** 32)).normal(0, sigma, frame.shape)
+
+    ok, encoded = cv2.imencode(".jpg", np.clip(frame, 0, 255).astype(np.uint8),
+                               [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return encoded.tobytes()
+
+
+def corpus(countries, variants, fonts, seed):
+    """(code, name, variant, font, jpeg bytes) for every country and variant."""
+    rng = random.Random(seed)
+    for i, (code, name) in enumerate(countries):
+        for j, variant in enumerate(variants):
+            font_name = fonts[(i + j) % len(fonts)] if fonts else None
+            yield code, name, variant, font_name, render(name, variant, font_name, rng)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def run(countries, matcher, variants, fonts, engine, config, min_confidence, seed, save_images=None):
+    samples = []
+    stages = defaultdict(list)
+    for code, name, variant, font_name, image_bytes in corpus(countries, variants, fonts, seed):
+        if save_images:
+            with open(os.path.join(save_images, f"{code}-{variant}.jpg"), "wb") as f:
+                f.write(image_bytes)
+        text, timings = ocr_image_timed(image_bytes, view=VIEW, engine=engine, config=config)
+        candidate = matcher.best(text, min_confidence=min_confidence)
+        for stage, ms in timings.items():
+            stages[stage].append(ms)
+        samples.append({
+            "code": code,
+            "variant": variant,
+            "font": font_name,
+            "text": text,
+            "found": candidate.code if candidate else None,
+            "confidence": candidate.confidence if candidate else 0,
+        })
+    return samples, stages
+
+
+def report(samples, stages, names):
+    by_variant = defaultdict(list)
+    confusions = Counter()
+    for sample in samples:
+        correct = sample["found"] == sample["code"]
+        by_variant[sample["variant"]].append(correct)
+        if not correct:
+            confusions[(sample["code"], sample["found"] or "-")] += 1
+    return {
+        "samples": len(samples),
+        "accuracy": sum(s["found"] == s["code"] for s in samples) / len(samples),
+        "no_match": sum(s["found"] is None for s in samples) / len(samples),
+        "variants": {variant: sum(hits) / len(hits) for variant, hits in by_variant.items()},
+        "confusions": [
+            {"expected": names.get(expected, expected), "found": names.get(found, found), "count": count}
+            for (expected, found), count in confusions.most_common()
+        ],
+        "stages": {
+            stage: {"p50_ms": statistics.median(values), "p95_ms": percentile(values, 0.95)}
+            for stage, values in stages.items()
+        },
+    }
+
+
+def print_report(summary, baseline=None, top=15):
+    old = baseline or {}
+    print(f"\n{summary['samples']} scans   accuracy {summary['accuracy']:.1%}   no match {summary['no_match']:.1%}"
+          + (f"   (baseline {old['accuracy']:.1%})" if old else ""))
+    print("\n  variant     accuracy")
+    for variant, accuracy in summary["variants"].items():
+        was = old.get("variants", {}).get(variant)
+        print(f"  {variant:<10}{accuracy:9.1%}" + (f"   (baseline {was:.1%})" if was is not None else ""))
+    print(f"\n  stage       p50 ms   p95 ms")
+    for stage, stats in summary["stages"].items():
+        print(f"  {stage:<10}{stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f}")
+    if summary["confusions"]:
+        print(f"\n  most frequent misreads (expected -> found)")
+        for confusion in summary["confusions"][:top]:
+            print(f"  {confusion['count']:4d}  {confusion['expected']} -> {confusion['found']}")
+
+
+def regressions(summary, baseline, max_accuracy_drop, max_slowdown):
+    problems = []
+    if summary["accuracy"] < baseline["accuracy"] - max_accuracy_drop:
+        problems.append(f"accuracy {summary['accuracy']:.1%} is below baseline {baseline['accuracy']:.1%}")
+    new_p95 = summary["stages"]["total"]["p95_ms"]
+    old_p95 = baseline["stages"]["total"]["p95_ms"]
+    if new_p95 > old_p95 * (1 + max_slowdown):
+        problems.append(f"p95 scan time {new_p95:.1f} ms is above baseline {old_p95:.1f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure OCR accuracy and latency on rendered globe labels")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="comma separated")
+    parser.add_argument("--countries", type=int, help="only the first N countries (alphabetical by code)")
+    parser.add_argument("--engine", default=os.environ.get("OCR_ENGINE", "auto"))
+    parser.add_argument("--stages", help='preprocessing stages, comma separated or "none" (default: OCR_PREPROCESS)')
+    parser.add_argument("--min-confidence", type=float, default=DevelopmentConfig.OCR_MIN_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the report as JSON")
+    parser.add_argument("--baseline", help="report saved by an earlier --output to compare against")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01, help="fail if accuracy falls by more")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="fail if p95 scan time grows by more")
+    parser.add_argument("--save-images", help="also write the rendered frames to this directory")
+    args = parser.parse_args()
+
+    variants = [v for v in args.variants.split(",") if v]
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variant(s): {', '.join(unknown)}")
+    config = config_from_env()
+    if args.stages is not None:
+        stages = () if args.stages == "none" else tuple(s for s in args.stages.split(",") if s)
+        unknown = [s for s in stages if s not in ALL_STAGES]
+        if unknown:
+            parser.error(f"unknown stage(s): {', '.join(unknown)}")
+        config = config._replace(stages=stages)
+
+    with open(COUNTRIES_FILE, "r", encoding="utf-8") as f:
+        names = json.load(f)
+    countries = sorted(names.items())[: args.countries]
+    fonts = available_fonts()
+    if not fonts:
+        print("No TrueType fonts found; using PIL's built-in bitmap font", file=sys.stderr)
+    if args.save_images:
+        os.makedirs(args.save_images, exist_ok=True)
+
+    engine = create_engine(args.engine)
+    started = time.perf_counter()
+    try:
+        # Match against every country, as the app does, even when only some are rendered
+        matcher = CountryMatcher(names, load_aliases())
+        samples, stages = run(countries, matcher, variants, fonts, engine, config, args.min_confidence, args.seed,
+                              args.save_images)
+    finally:
+        engine.close()
+    summary = report(samples, stages, names)
+    summary["setup"] = {
+        "engine": engine.name,
+        "stages": list(config.stages),
+        "min_confidence": args.min_confidence,
+        "fonts": fonts,
+        "seed": args.seed,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+
+    if args.output:
+        summary["results"] = samples
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSaved to {args.output}")
+
+    if baseline:
+        problems = regressions(summary, baseline, args.max_accuracy_drop, args.max_slowdown)
+        for problem in problems:
+            print(f"REGRESSION: {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
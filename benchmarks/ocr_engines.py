@@ -0,0 +1,80 @@
+# benchmarks/ocr_engines.py
+#
+# Per-scan latency of the OCR engines in ocr_engine.py.
+#
+#     python -m benchmarks.ocr_engines [--runs 50] [image.jpg ...]
+#
+# Run from the repository root.  Without images it renders a few country
+# names the size of the kiosk's crop.  Each engine is timed on the same
+# grayscale PIL images ocr_pipeline would hand it; the first call is
+# reported separately because it includes starting the engine.
+import argparse
+import statistics
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from ocr_engine import ENGINES
+from ocr_geometry import CROP_HEIGHT, CROP_WIDTH
+
+SAMPLE_WORDS = ["FRANCE", "PERU", "KENYA", "JAPAN"]
+
+
+def sample_images():
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 36)
+    except OSError:
+        font = ImageFont.load_default()
+    images = []
+    for word in SAMPLE_WORDS:
+        image = Image.new("L", (CROP_WIDTH, CROP_HEIGHT), 255)
+        ImageDraw.Draw(image).text((10, CROP_HEIGHT // 2 - 20), word, fill=0, font=font)
+        images.append(image)
+    return images
+
+
+def load_images(paths):
+    return [Image.open(path).convert("L") for path in paths]
+
+
+def bench(engine_cls, images, runs):
+    start = time.perf_counter()
+    engine = engine_cls()
+    first_text = engine.recognize(images[0])
+    first = time.perf_counter() - start
+
+    timings = []
+    for i in range(runs):
+        image = images[i % len(images)]
+        t0 = time.perf_counter()
+        engine.recognize(image)
+        timings.append(time.perf_counter() - t0)
+    engine.close()
+    return first, first_text, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR engine latency")
+    parser.add_argument("images", nargs="*", help="images to OCR (default: rendered samples)")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    images = load_images(args.images) if args.images else sample_images()
+    for name, engine_cls in ENGINES.items():
+        try:
+            first, text, timings = bench(engine_cls, images, args.runs)
+        except Exception as e:
+            print(f"{name:12} unavailable: {e}")
+            continue
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(
+            f"{name:12} first {first * 1000:7.1f} ms   "
+            f"median {statistics.median(timings) * 1000:7.1f} ms   "
+            f"p95 {p95 * 1000:7.1f} ms   "
+            f"({args.runs} runs, first text {text.strip()!r})"
+        )
+
+
+if __name__ == "__main__":
+    main()
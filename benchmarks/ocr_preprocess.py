@@ -0,0 +1,53 @@
+# benchmarks/ocr_preprocess.py
+#
+# Per-stage timings of the OCR preprocessing (ocr_preprocess.py), for tuning.
+#
+#     python -m benchmarks.ocr_preprocess [--runs 20] [--stages clahe,threshold,regions] [--ocr] image.jpg ...
+#
+# Run from the repository root with captures saved by /debug/captures (the
+# frameN-original.jpg files) or any photo of a label.  With --ocr the full
+# pipeline runs, including Tesseract, and the text read is printed.
+import argparse
+import statistics
+from collections import defaultdict
+
+import cv2
+
+from ocr_geometry import CROP_HEIGHT, CROP_WIDTH, crop_center
+from ocr_pipeline import ocr_image_timed
+from ocr_preprocess import ALL_STAGES, DEFAULT_CONFIG, preprocess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the OCR preprocessing stages")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--stages", default=",".join(ALL_STAGES), help='comma separated, or "none"')
+    parser.add_argument("--ocr", action="store_true", help="also run Tesseract on the boxes")
+    args = parser.parse_args()
+
+    stages = () if args.stages == "none" else tuple(s for s in args.stages.split(",") if s)
+    config = DEFAULT_CONFIG._replace(stages=stages)
+
+    timings = defaultdict(list)
+    for path in args.images:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        for _ in range(args.runs):
+            if args.ocr:
+                text, run_timings = ocr_image_timed(image_bytes, config=config)
+            else:
+                image = cv2.imread(path)
+                gray = cv2.cvtColor(crop_center(image, CROP_WIDTH, CROP_HEIGHT), cv2.COLOR_BGR2GRAY)
+                boxes, run_timings = preprocess(gray, config)
+                text = f"{len(boxes)} box(es)"
+            for stage, ms in run_timings.items():
+                timings[stage].append(ms)
+        print(f"{path}: {text.strip()!r}")
+
+    for stage, values in timings.items():
+        print(f"{stage:10} median {statistics.median(values):7.2f} ms   max {max(values):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/synthetic_archive.py
+#
+# Builds a fake music archive with the layout the app expects:
+#
+#     <root>/archive/<country>/<decade>/[<subfolder>/...]<track>.mp3
+#                                                          <track>.json
+#
+# Tracks are single silent MPEG-1 Layer III frames, so they are valid mp3s for
+# send_file and range requests but the whole archive stays small.  Country
+# codes come from countries.json, so names resolve as they would for the real
+# archive.
+#
+#     python -m benchmarks.synthetic_archive /tmp/bench --countries 20 --decades 5 --tracks 10
+#
+# The directory must be called "archive": get_country_from_path looks for it.
+import argparse
+import json
+import os
+import random
+
+DECADES = ["1920s", "1930s", "1940s", "1950s", "1960s", "1970s", "1980s", "1990s", "2000s", "2010s"]
+# 128 kbit/s, 44.1 kHz, no padding: 144 * 128000 / 44100 = 417 bytes per frame
+SILENT_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+COUNTRIES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "countries.json")
+
+
+def generate(root, countries=20, decades=5, tracks=10, depth=0, sidecars=1.0, frames=1, seed=0):
+    """Write the archive under root/archive and return its path.
+
+    `tracks` is per country and decade, `depth` adds that many nested
+    folders below each decade, and `sidecars` is the fraction of tracks that
+    get a JSON sidecar.
+    """
+    if decades > len(DECADES):
+        raise ValueError(f"At most {len(DECADES)} decades")
+    with open(COUNTRIES_FILE, "r") as f:
+        codes = sorted(json.load(f))
+    if countries > len(codes):
+        raise ValueError(f"At most {len(codes)} countries")
+
+    rng = random.Random(seed)
+    archive = os.path.join(root, "archive")
+    stub = SILENT_FRAME * frames
+    for code in codes[:countries]:
+        for decade in DECADES[:decades]:
+            decade_dir = os.path.join(archive, code, decade)
+            for i in range(tracks):
+                folder = os.path.join(decade_dir, *[f"disc{(i // 10 ** (d + 1)) % 10}" for d in range(depth)])
+                os.makedirs(folder, exist_ok=True)
+                name = f"{code.lower()}_{decade}_{i:05d}"
+                with open(os.path.join(folder, f"{name}.mp3"), "wb") as f:
+                    f.write(stub)
+                if rng.random() < sidecars:
+                    year = int(decade[:4]) + rng.randrange(10)
+                    with open(os.path.join(folder, f"{name}.json"), "w") as f:
+                        json.dump({"artist": f"Artist {code} {i % 37}", "title": f"Song {i}", "year": year}, f)
+    return archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic music archive")
+    parser.add_argument("root")
+    parser.add_argument("--countries", type=int, default=20)
+    parser.add_argument("--decades", type=int, default=5)
+    parser.add_argument("--tracks", type=int, default=10, help="tracks per country and decade")
+    parser.add_argument("--depth", type=int, default=0, help="nested folders below each decade")
+    parser.add_argument("--sidecars", type=float, default=1.0, help="fraction of tracks with a JSON sidecar")
+    parser.add_argument("--frames", type=int, default=1, help="silent mp3 frames per track")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    archive = generate(
+        args.root,
+        countries=args.countries,
+        decades=args.decades,
+        tracks=args.tracks,
+        depth=args.depth,
+        sidecars=args.sidecars,
+        frames=args.frames,
+        seed=args.seed,
+    )
+    total = args.countries * args.decades * args.tracks
+    print(f"Wrote {total} tracks under {archive}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # config.py
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-default-key')  # Use env var or fallback for development
@@ -7,6 +8,86 @@ class Config:
     TESTING = False
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # Root of the music archive: <country>/<decade>/<track>.mp3 (benchmarks point it elsewhere)
+    ARCHIVE_PATH = os.environ.get('ARCHIVE_PATH', '/mnt/ssd/globemusic/archive')
+    # On-disk copy of the archive index so workers don't rescan the archive on boot
+    ARCHIVE_INDEX_FILE = os.environ.get(
+        'ARCHIVE_INDEX_FILE', os.path.join(os.path.dirname(__file__), 'archive_index.json')
+    )
+    # Keep the index fresh while running (inotify, or mtime polling every N seconds)
+    ARCHIVE_WATCH = os.environ.get('ARCHIVE_WATCH', '1') == '1'
+    ARCHIVE_POLL_INTERVAL = float(os.environ.get('ARCHIVE_POLL_INTERVAL', '30'))
+    # Let a fronting proxy stream audio: 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache)
+    AUDIO_OFFLOAD = os.environ.get('AUDIO_OFFLOAD')
+    # nginx `internal` location that maps onto the archive, used with x-accel-redirect
+    AUDIO_OFFLOAD_PREFIX = os.environ.get('AUDIO_OFFLOAD_PREFIX', '/archive-internal/')
+    # Where play queues live: 'memory' (per worker) or 'sqlite' (shared by all workers)
+    QUEUE_STORE = os.environ.get('QUEUE_STORE', 'memory')
+    QUEUE_STORE_PATH = os.environ.get('QUEUE_STORE_PATH')
+    QUEUE_STORE_MAX_QUEUES = 1000
+    # Number of parsed metadata sidecars kept in memory per worker
+    METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', '4096'))
+    # Compiled metadata catalog, built with `flask compile-catalog`; used when present
+    CATALOG_FILE = os.environ.get(
+        'CATALOG_FILE', os.path.join(os.path.dirname(__file__), 'catalog.sqlite3')
+    )
+    # Logging (see log_setup.py): level, optional file (may contain {pid}) and its rotation
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.environ.get('LOG_FILE')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUPS = int(os.environ.get('LOG_BACKUPS', '5'))
+    # Where each process leaves its metrics for /metrics to add up; clear it on deploy
+    METRICS_DIR = os.environ.get(
+        'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'globohomunculus-metrics')
+    )
+    # OCR job pool: processes per web worker, queued frames (a burst counts each
+    # of its frames) before rejecting with 429, and where results are shared
+    # between web workers
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS', '2'))
+    OCR_MAX_PENDING = int(os.environ.get('OCR_MAX_PENDING', '12'))
+    OCR_JOBS_DIR = os.environ.get(
+        'OCR_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'globohomunculus-ocr-jobs')
+    )
+    OCR_POLL_MAX_WAIT = 10
+    # Tesseract backend: 'auto' (tesserocr if installed), 'tesserocr' or 'pytesseract'
+    OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto')
+    # Preprocessing before Tesseract (see ocr_preprocess.py); 'none' OCRs the plain grayscale crop
+    OCR_PREPROCESS = os.environ.get('OCR_PREPROCESS', 'downscale,clahe,threshold,regions,deskew')
+    # Import the OCR libraries in a background thread after boot rather than on the first scan
+    OCR_PREWARM = os.environ.get('OCR_PREWARM', '1') == '1'
+    # Fuzzy country matches scoring below this (0..1) are rejected instead of guessed
+    OCR_MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE', '0.7'))
+    # Burst scans: frames read per request, and the summed confidence that ends the vote early
+    OCR_BURST_MAX_FRAMES = int(os.environ.get('OCR_BURST_MAX_FRAMES', '5'))
+    OCR_BURST_EXIT_SCORE = float(os.environ.get('OCR_BURST_EXIT_SCORE', '1.0'))
+    # Sent to the kiosk: largest side of an uploaded viewfinder crop (px), its JPEG quality (0..1),
+    # and the viewfinder sharpness (Laplacian variance) and brightness (0..255) a frame
+    # needs before it's uploaded at all
+    CAPTURE_MAX_SIDE = int(os.environ.get('CAPTURE_MAX_SIDE', '1280'))
+    CAPTURE_QUALITY = float(os.environ.get('CAPTURE_QUALITY', '0.85'))
+    CAPTURE_MIN_SHARPNESS = float(os.environ.get('CAPTURE_MIN_SHARPNESS', '40'))
+    CAPTURE_MIN_BRIGHTNESS = float(os.environ.get('CAPTURE_MIN_BRIGHTNESS', '40'))
+    CAPTURE_MAX_BRIGHTNESS = float(os.environ.get('CAPTURE_MAX_BRIGHTNESS', '225'))
+    # Live scan (see live_scan.py): the kiosk posts crops of at most LIVE_SCAN_MAX_SIDE px
+    # every LIVE_SCAN_FRAME_MS; each kiosk gets an OCR run at most every LIVE_SCAN_INTERVAL
+    # seconds, and the country is reported after LIVE_SCAN_STABLE_READS agreeing reads
+    LIVE_SCAN_MAX_SIDE = int(os.environ.get('LIVE_SCAN_MAX_SIDE', '640'))
+    LIVE_SCAN_FRAME_MS = int(os.environ.get('LIVE_SCAN_FRAME_MS', '250'))
+    LIVE_SCAN_INTERVAL = float(os.environ.get('LIVE_SCAN_INTERVAL', '0.5'))
+    LIVE_SCAN_STABLE_READS = int(os.environ.get('LIVE_SCAN_STABLE_READS', '2'))
+    LIVE_SCAN_IDLE = 30
+    # Recent scans that found a country, reused for near-identical frames (0 entries turns it off):
+    # entries kept, seconds before one is stale, and how many of the 64 hash bits may differ
+    OCR_CACHE_SIZE = int(os.environ.get('OCR_CACHE_SIZE', '256'))
+    OCR_CACHE_TTL = int(os.environ.get('OCR_CACHE_TTL', '300'))
+    OCR_CACHE_DISTANCE = int(os.environ.get('OCR_CACHE_DISTANCE', '3'))
+    # Save a sample of scans (frames, OCR text, country) for /debug/captures; off by default
+    DEBUG_CAPTURE = os.environ.get('DEBUG_CAPTURE', '0') == '1'
+    DEBUG_CAPTURE_SAMPLE = float(os.environ.get('DEBUG_CAPTURE_SAMPLE', '0.1'))
+    DEBUG_CAPTURE_MAX = int(os.environ.get('DEBUG_CAPTURE_MAX', '50'))
+    DEBUG_CAPTURE_DIR = os.environ.get(
+        'DEBUG_CAPTURE_DIR', os.path.join(os.path.dirname(__file__), 'debug_captures')
+    )
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,396 @@
+# country_matcher.py
+#
+# Finds country names in OCR text.
+#
+# detect_country used to test every name in countries.json against the text
+# (upper-casing the text again for each one), then accepted any 3-letter word
+# that appeared inside a name, so "AND" matched Andorra, Poland, Finland...
+# CountryMatcher is built once from countries.json plus the aliases in
+# country_aliases.json ("IVORY COAST", "BURMA", "USSR", ...) and does two
+# passes:
+#
+#   exact  an Aho-Corasick automaton over all names and aliases finds every
+#          one that appears in the text in a single left-to-right walk.  A
+#          hit inside a longer hit ("NIGER" in "NIGERIA", "OMAN" in
+#          "ROMANIA") is dropped, and keys shorter than five letters ("UK",
+#          "OMAN") must be whole words.
+#   fuzzy  runs of one or more OCR words are compared with the names by an
+#          edit distance that charges less for Tesseract's usual confusions
+#          (O/D/Q, I/L, C/G, RN/M, ...).  The names live in one letter trie
+#          per length, so names sharing a prefix share the work, and a branch
+#          is abandoned as soon as no cell that could still reach the end of
+#          a run is within that length's allowance.  This is pure Python and
+#          costs tens of milliseconds on a few words of noise
+#          (benchmarks/country_matching.py), so it is skipped when the exact
+#          pass found a whole word, only tries runs whose length some name
+#          could match, looks at no more than MAX_FUZZY_WORDS words, and the
+#          OCR jobs run it in the OCR worker processes, not the web workers
+#          (ocr_pipeline.read_country).
+#
+# Every candidate carries a confidence in 0..1 (1 - distance / name length,
+# 1.0 for an exact whole-word hit) so callers can reject a guess instead of
+# jumping to the wrong country.  best() also rejects a tie: "ISLAND" is as
+# close to Iceland as to Ireland and Finland, and is no match at all.
+#
+# The globe also labels continents, oceans and seas, and those labels contain
+# country names ("INDIAN OCEAN", "GULF OF MEXICO").  STOP_PHRASES go through
+# both passes like names: a country found inside one is dropped, and so is a
+# fuzzy or embedded country that doesn't read better than a stop phrase does.
+#
+# Text and names are compared after upper-casing, stripping accents and
+# turning anything that isn't a letter into a single space, which matches
+# what the Tesseract whitelist (A-Z) can produce.
+import json
+import logging
+import os
+import unicodedata
+from collections import defaultdict, deque, namedtuple
+
+log = logging.getLogger(__name__)
+
+Candidate = namedtuple("Candidate", ["name", "code", "confidence", "exact"])
+
+DEFAULT_MIN_CONFIDENCE = 0.7
+# Exact hit glued to other letters ("XFRANCEZ"): probably right, but less sure
+EMBEDDED_CONFIDENCE = 0.9
+# Keys shorter than this only match as whole words ("OMAN" is not in "ROMAN")
+MIN_EMBEDDED_LENGTH = 5
+# Longest run of OCR words compared against a name
+MAX_WINDOW_WORDS = 4
+# Most OCR words the fuzzy pass starts a run at; a label is a few words, the rest is noise
+MAX_FUZZY_WORDS = 8
+# best() gives up when another country is this close to the top candidate
+TIE_MARGIN = 0.05
+
+# Single letters Tesseract mixes up on printed labels, and what that costs
+CONFUSION_COST = 0.3
+CONFUSABLE = [
+    "ODQC", "CG", "IJLT", "EF", "PR", "UV", "MN", "HN", "BE", "KX", "SZ",
+]
+# Letter groups read as a different group
+MULTI_COST = 0.4
+MULTI_CONFUSIONS = [("RN", "M"), ("NN", "M"), ("VV", "W"), ("CL", "D"), ("LI", "U"), ("II", "U"), ("IN", "M")]
+
+ALIASES_FILE = os.path.join(os.path.dirname(__file__), "country_aliases.json")
+COUNTRIES_FILE = os.path.join(os.path.dirname(__file__), "countries.json")
+
+# Globe labels that aren't countries
+STOP_PHRASES = [
+    "AFRICA", "AMERICA", "NORTH AMERICA", "SOUTH AMERICA", "CENTRAL AMERICA", "LATIN AMERICA", "ASIA",
+    "EUROPE", "OCEANIA", "AUSTRALASIA", "MIDDLE EAST", "SCANDINAVIA",
+    "ATLANTIC", "ATLANTIC OCEAN", "PACIFIC", "PACIFIC OCEAN", "INDIAN OCEAN", "ARCTIC OCEAN", "SOUTHERN OCEAN",
+    "MEDITERRANEAN SEA", "CARIBBEAN SEA", "ARABIAN SEA", "SOUTH CHINA SEA", "EAST CHINA SEA", "PHILIPPINE SEA",
+    "SEA OF JAPAN", "SEA OF OKHOTSK", "BERING SEA", "NORTH SEA", "BALTIC SEA", "BLACK SEA", "RED SEA",
+    "CASPIAN SEA", "CORAL SEA", "TASMAN SEA", "IRISH SEA", "ADRIATIC SEA", "AEGEAN SEA", "NORWEGIAN SEA",
+    "BARENTS SEA", "LABRADOR SEA", "GULF OF MEXICO", "GULF OF GUINEA", "GULF OF ADEN", "GULF OF OMAN",
+    "GULF OF THAILAND", "GULF OF ALASKA", "PERSIAN GULF", "BAY OF BENGAL", "BAY OF BISCAY", "HUDSON BAY",
+]
+
+
+def _substitution_costs():
+    costs = {}
+    for group in CONFUSABLE:
+        for a in group:
+            for b in group:
+                if a != b:
+                    costs[a, b] = CONFUSION_COST
+    return costs
+
+
+def _multi_by_end():
+    # (last observed letter, last expected letter) -> group confusions ending there
+    by_end = defaultdict(list)
+    for x, y in MULTI_CONFUSIONS + [(b, a) for a, b in MULTI_CONFUSIONS]:
+        by_end[x[-1], y[-1]].append((x, y))
+    return dict(by_end)
+
+
+SUBSTITUTION_COSTS = _substitution_costs()
+_MULTI_BY_END = _multi_by_end()
+INFINITY = float("inf")
+
+
+def normalize(text):
+    """Upper-case A-Z words separated by single spaces."""
+    text = unicodedata.normalize("NFKD", text)
+    letters = [c if "A" <= c <= "Z" else " " for c in text.upper() if not unicodedata.combining(c)]
+    return " ".join("".join(letters).split())
+
+
+class _ObservedCosts:
+    """Per-letter cost rows for one run of OCR text, computed once and shared by every name."""
+
+    def __init__(self, observed):
+        self.observed = observed
+        self._substitution = {}
+        self._groups = {}
+
+    def substitution(self, b):
+        """Cost of reading name letter `b` as each observed letter."""
+        row = self._substitution.get(b)
+        if row is None:
+            row = [0.0 if a == b else SUBSTITUTION_COSTS.get((a, b), 1.0) for a in self.observed]
+            self._substitution[b] = row
+        return row
+
+    def groups(self, b):
+        """{k: [(len(x), y)]} for group confusions x -> y whose x ends at observed[:k] and y ends in `b`."""
+        groups = self._groups.get(b)
+        if groups is None:
+            groups = {}
+            for k in range(1, len(self.observed) + 1):
+                for x, y in _MULTI_BY_END.get((self.observed[k - 1], b), ()):
+                    if self.observed[max(k - len(x), 0) : k] == x:
+                        groups.setdefault(k, []).append((len(x), y))
+            self._groups[b] = groups
+        return groups
+
+
+def load_aliases(path=ALIASES_FILE):
+    """Alias -> country code from country_aliases.json, or {} if it can't be read."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log.error("Error loading country aliases: %s", e)
+        return {}
+
+
+_default_matcher = None
+
+
+def default_matcher():
+    """A CountryMatcher over countries.json and the aliases, built once per process."""
+    global _default_matcher
+    if _default_matcher is None:
+        with open(COUNTRIES_FILE, "r", encoding="utf-8") as f:
+            _default_matcher = CountryMatcher(json.load(f), load_aliases())
+    return _default_matcher
+
+
+class CountryMatcher:
+    def __init__(self, countries, aliases=None, stop_phrases=STOP_PHRASES):
+        """`countries` maps code -> display name (countries.json); `aliases` maps alias -> code;
+        `stop_phrases` are labels that aren't countries."""
+        self._keys = []  # key id -> (normalized key, code), code None for a stop phrase
+        self._names = dict(countries)
+        seen = set()
+        entries = [(name, code) for code, name in sorted(countries.items())]
+        entries += sorted((alias, code) for alias, code in (aliases or {}).items() if code in countries)
+        entries += [(phrase, None) for phrase in stop_phrases]
+        for text, code in entries:
+            key = normalize(text)
+            if key and key not in seen:
+                seen.add(key)
+                self._keys.append((key, code))
+        self._build_automaton()
+        self._build_trie()
+
+    # ------------------------------
+    # Exact pass
+    # ------------------------------
+
+    def _build_automaton(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # state -> key ids that end here
+        for key_id, (key, _) in enumerate(self._keys):
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._out[state].append(key_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def exact_matches(self, text):
+        """(start, end, key id) for every key in normalized `text`, longest first, nested hits removed."""
+        hits = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for key_id in self._out[state]:
+                hits.append((end - len(self._keys[key_id][0]), end, key_id))
+
+        hits.sort(key=lambda hit: hit[0] - hit[1])
+        kept = []
+        for start, end, key_id in hits:
+            if not any(s <= start and end <= e for s, e, _ in kept):
+                kept.append((start, end, key_id))
+        return kept
+
+    # ------------------------------
+    # Fuzzy pass
+    # ------------------------------
+
+    def _build_trie(self):
+        # Names without spaces, since OCR splits and joins words freely, in
+        # one trie per name length so every branch knows its exact allowance.
+        # Node: [children by letter, key ids ending here]
+        self._tries = {}
+        for key_id, (key, _) in enumerate(self._keys):
+            compact = key.replace(" ", "")
+            node = self._tries.setdefault(len(compact), [{}, []])
+            for char in compact:
+                node = node[0].setdefault(char, [{}, []])
+            node[1].append(key_id)
+        self._min_length = min(self._tries, default=0)
+        self._max_length = max(self._tries, default=0)
+
+    def fuzzy_matches(self, text, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        """{key id: confidence} for keys within the allowed distance of some run of OCR words.
+
+        The cost is a weighted Damerau-Levenshtein distance: substitutions
+        between confusable letters or letter groups are cheap, everything else
+        costs 1.  A key of length L may be at most (1 - min_confidence) * L away,
+        so only runs of about a name's length are tried.
+        """
+        words = text.split()
+        max_ratio = 1 - min_confidence
+        # The distance is at least the difference in length
+        shortest = self._min_length * (1 - max_ratio)
+        longest = self._max_length * (1 + max_ratio)
+        best = {}
+        tried = 0
+        for i in range(len(words)):
+            if tried >= MAX_FUZZY_WORDS:
+                break
+            # Align the names against the longest run starting at this word and
+            # read off every shorter run at the word boundaries
+            ends = []
+            for word in words[i : i + MAX_WINDOW_WORDS]:
+                end = (ends[-1] if ends else 0) + len(word)
+                if end > longest:
+                    break
+                ends.append(end)
+            ends = [end for end in ends if end >= shortest]
+            if not ends:
+                continue
+            tried += 1
+            observed = "".join(words[i : i + MAX_WINDOW_WORDS])[: ends[-1]]
+            costs = _ObservedCosts(observed)
+            for length, trie in self._tries.items():
+                allowance = max_ratio * length
+                length_ends = [end for end in ends if abs(end - length) <= allowance]
+                if not length_ends:
+                    continue
+                first_row = [float(k) for k in range(length_ends[-1] + 1)]
+                for char, child in trie[0].items():
+                    self._align(child, costs, length_ends, length, 1, char, "", first_row, None, allowance, best)
+        return best
+
+    def _align(self, node, costs, ends, length, depth, b, b_prev, prev, prev2, allowance, best):
+        # One row of the edit-distance table per trie level: row[k] is the cost
+        # of reading the first `depth` letters of the name as observed[:k]
+        observed = costs.observed
+        substitution = costs.substitution(b)
+        groups = costs.groups(b)
+        row = [float(depth)]
+        for k in range(1, ends[-1] + 1):
+            cost = prev[k - 1] + substitution[k - 1]
+            if prev[k] + 1.0 < cost:
+                cost = prev[k] + 1.0
+            if row[k - 1] + 1.0 < cost:
+                cost = row[k - 1] + 1.0
+            if prev2 is not None and k > 1 and observed[k - 1] == b_prev and observed[k - 2] == b:
+                cost = min(cost, prev2[k - 2] + 1.0)
+            if k in groups:
+                for lx, y in groups[k]:
+                    if len(y) == 1:
+                        cost = min(cost, prev[k - lx] + MULTI_COST)
+                    elif prev2 is not None and b_prev + b == y:
+                        cost = min(cost, prev2[k - lx] + MULTI_COST)
+            row.append(cost)
+
+        if depth == length:
+            for key_id in node[1]:
+                for end in ends:
+                    if row[end] <= allowance:
+                        confidence = 1 - row[end] / depth
+                        if confidence > best.get(key_id, 0):
+                            best[key_id] = confidence
+            return
+
+        # The rest of the name has to take the run from some cell to one of the
+        # ends, so only cells within the allowance of that distance can lead
+        # anywhere; if none of them is under it, no name below can be
+        remaining = length - depth
+        lo = max(ends[0] - remaining - int(allowance), 0)
+        hi = ends[-1] - remaining + int(allowance)
+        if lo > hi or min(row[lo : hi + 1], default=INFINITY) > allowance:
+            return
+        for char, child in node[0].items():
+            self._align(child, costs, ends, length, depth + 1, char, b, row, prev, allowance, best)
+
+    # ------------------------------
+    # Queries
+    # ------------------------------
+
+    def candidates(self, text, limit=5, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        """Ranked Candidates for OCR text, one per country, best first."""
+        text = normalize(text)
+        by_code = {}
+
+        def offer(key_id, confidence, exact):
+            code = self._keys[key_id][1]
+            if code not in by_code or confidence > by_code[code].confidence:
+                by_code[code] = Candidate(self._names[code], code, round(confidence, 3), exact)
+
+        padded = f" {text} "
+        stops = []
+        for start, end, key_id in self.exact_matches(text):
+            whole_word = padded[start] == " " and padded[end + 1] == " "
+            if self._keys[key_id][1] is None:
+                # Countries nested in it are already gone; keep the rest of
+                # the text away from the fuzzy pass too
+                if whole_word:
+                    stops.append((start, end))
+            elif whole_word:
+                offer(key_id, 1.0, True)
+            elif end - start >= MIN_EMBEDDED_LENGTH:
+                offer(key_id, EMBEDDED_CONFIDENCE, True)
+
+        # A whole-word hit is as sure as the fuzzy pass could be, and it's the slow one
+        if not any(c.confidence == 1.0 for c in by_code.values()):
+            for start, end in sorted(stops, reverse=True):
+                text = f"{text[:start]} {text[end:]}"
+            fuzzy = self.fuzzy_matches(text, min_confidence)
+            stop_confidence = max(
+                (confidence for key_id, confidence in fuzzy.items() if self._keys[key_id][1] is None), default=0
+            )
+            for key_id, confidence in fuzzy.items():
+                if self._keys[key_id][1] is not None:
+                    offer(key_id, confidence, False)
+            # "INDIAN 0CEAN": the embedded INDIA reads no better than the ocean does
+            by_code = {code: c for code, c in by_code.items() if c.confidence > stop_confidence}
+
+        ranked = sorted(by_code.values(), key=lambda c: (-c.confidence, not c.exact, c.code))
+        return ranked[:limit]
+
+    def best(self, text, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        """The top Candidate for OCR text, or None if nothing reaches `min_confidence`
+        or another country comes within TIE_MARGIN of it."""
+        ranked = self.candidates(text, limit=2, min_confidence=min_confidence)
+        if not ranked or ranked[0].confidence < min_confidence:
+            return None
+        if len(ranked) > 1 and ranked[1].confidence >= ranked[0].confidence - TIE_MARGIN:
+            log.debug("Ambiguous OCR text %r: %s or %s", text, ranked[0].name, ranked[1].name)
+            return None
+        return ranked[0]
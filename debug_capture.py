@@ -0,0 +1,142 @@
+# debug_capture.py
+#
+# Optional record of what the scanner saw, for tuning the OCR.
+#
+# ocr_image used to cv2.imwrite three JPEGs into static/debug on every scan,
+# which added encode and disk time to each request and had concurrent scans
+# overwriting each other's files.  Now captures are off unless DEBUG_CAPTURE
+# is set, only a sample of scans (DEBUG_CAPTURE_SAMPLE) is kept, and the
+# files are written by a background thread fed through a bounded queue; when
+# the queue is full the capture is dropped rather than slowing the scan down.
+#
+# Each capture gets its own directory named by its capture id, which starts
+# with a timestamp so the newest sort last:
+#
+#     <DEBUG_CAPTURE_DIR>/<YYYYmmdd-HHMMSSmmm>-<hex>/frame0-original.jpg
+#                                                /frame0-cropped.jpg
+#                                                /frame0-page.jpg
+#                                                /frame0-ocr.txt
+#                                                /result.json
+#
+# Only the newest DEBUG_CAPTURE_MAX directories are kept.  The OCR worker
+# processes write the images, the web process writes result.json (OCR text
+# and the country chosen) and prunes old captures; /debug/captures shows them.
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+RESULT_FILE = "result.json"
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def new_capture_id():
+    now = time.time()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}"
+
+
+class DebugCapture:
+    """Samples scans and writes their files from a background thread."""
+
+    def __init__(self, directory, sample_rate=1.0, max_captures=50, queue_size=32):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_captures = max_captures
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """A new capture id if this scan should be captured, else None."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return new_capture_id()
+
+    def save(self, capture_id, files, prune=False):
+        """Queue files for a capture: {name: image array (.jpg), text (str) or dict (.json)}."""
+        self._start()
+        try:
+            self._queue.put_nowait((capture_id, files, prune))
+        except queue.Full:
+            self.dropped += 1
+
+    def captures(self):
+        """Captures on disk, newest first: [{"id", "files", "result"}]."""
+        results = []
+        for capture_id in sorted(self._capture_ids(), reverse=True):
+            path = os.path.join(self.directory, capture_id)
+            try:
+                files = sorted(f for f in os.listdir(path) if f != RESULT_FILE)
+            except OSError:
+                continue
+            result = None
+            try:
+                with open(os.path.join(path, RESULT_FILE), "r") as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                pass
+            results.append({"id": capture_id, "files": files, "result": result})
+        return results
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="debug-capture", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            capture_id, files, prune = self._queue.get()
+            try:
+                self._write(capture_id, files)
+                if prune:
+                    self._prune()
+            except Exception as e:
+                log.warning("Failed to write capture %s: %s", capture_id, e)
+
+    def _write(self, capture_id, files):
+        path = os.path.join(self.directory, capture_id)
+        os.makedirs(path, exist_ok=True)
+        for name, content in files.items():
+            target = os.path.join(path, name)
+            if isinstance(content, str):
+                with open(target, "w") as f:
+                    f.write(content)
+            elif isinstance(content, dict):
+                with open(target, "w") as f:
+                    json.dump(content, f, indent=2)
+            else:
+                import cv2
+
+                cv2.imwrite(target, content)
+
+    def _prune(self):
+        for capture_id in sorted(self._capture_ids())[: -self.max_captures or None]:
+            shutil.rmtree(os.path.join(self.directory, capture_id), ignore_errors=True)
+
+    def _capture_ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [n for n in names if os.path.isdir(os.path.join(self.directory, n))]
+
+
+def writer_for(directory):
+    """This process's writer for a capture directory (used inside the OCR workers)."""
+    with _writers_lock:
+        writer = _writers.get(directory)
+        if writer is None:
+            writer = _writers[directory] = DebugCapture(directory)
+        return writer
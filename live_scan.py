@@ -0,0 +1,118 @@
+# live_scan.py
+#
+# Live scanning: the kiosk streams small frames while the camera is pointed at
+# the globe, instead of waiting for a key press, and the country is reported
+# once successive reads agree on it.
+#
+# Frames arrive faster than Tesseract can read them, and under load the OCR
+# pool may be busy with other kiosks.  Queueing every frame would make each
+# answer older than the last, so a kiosk has at most one OCR job running and
+# starts the next no sooner than `interval` seconds after the last, on the
+# frame that has just arrived; frames posted in between are dropped (counted
+# in `dropped`).  The OCR rate is bounded however fast frames arrive, and the
+# frame read is always the newest.
+#
+# There is no background thread: each frame post checks the kiosk's running
+# job and starts the next one, and its reply says whether the country is
+# settled ("stable_reads" reads in a row on the same country).  gunicorn hands
+# a kiosk's posts to whichever worker is free, so each kiosk's slot (running
+# job, last run, the country read so far) is a small JSON file in a directory
+# all workers share, next to the OCR job results, and is locked while a post
+# updates it.
+import fcntl
+import json
+import os
+import time
+
+
+class LiveScans:
+    """The OCR job and reads so far of each live-scanning kiosk, shared between workers."""
+
+    def __init__(self, state_dir, submit, status, lookup=None, interval=0.5, stable_reads=2, idle_timeout=30):
+        """`submit(frame, view)` queues a read (ocr_pipeline.read_country) and returns a job id,
+        or None if the pool is busy; `status(job_id)` returns that job's state
+        dict; `lookup(frame, view)` returns a cached reading or None.
+        """
+        self.state_dir = state_dir
+        self.submit = submit
+        self.status = status
+        self.lookup = lookup
+        self.interval = interval
+        self.stable_reads = stable_reads
+        self.idle_timeout = idle_timeout
+        self.dropped = 0  # frames this process didn't read
+        self._last_expiry = 0.0
+        os.makedirs(state_dir, exist_ok=True)
+
+    def offer(self, scanner_id, frame, view=None):
+        """Take a kiosk's newest frame. Returns the reading once the country is stable, else None."""
+        # Scanner ids are hex session ids; anything else mustn't reach the filesystem
+        if not scanner_id or not all(c in "0123456789abcdef" for c in scanner_id):
+            return None
+        now = time.time()
+        self._expire(now)
+        with open(os.path.join(self.state_dir, f"{scanner_id}.json"), "a+") as f:
+            # Held while this post reads and updates the slot, so two workers
+            # can't both start a job for the same kiosk
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                slot = json.loads(f.read() or "{}")
+            except ValueError:
+                slot = {}
+
+            reading = None
+            ran = False
+            if slot.get("job_id"):
+                state = self.status(slot["job_id"])
+                if state is None or state["state"] != "pending":
+                    slot["job_id"] = None
+                    if state is not None and state["state"] == "done":
+                        reading = self._read(slot, state["result"])
+            if reading is None and not slot.get("job_id") and now - slot.get("last_run", 0.0) >= self.interval:
+                ran = True
+                reading = self._run(slot, frame, view, now)
+            if not ran:
+                self.dropped += 1
+
+            # A settled kiosk starts over on its next frame
+            f.seek(0)
+            f.truncate()
+            json.dump({} if reading is not None else slot, f)
+        return reading
+
+    def _run(self, slot, frame, view, now):
+        slot["last_run"] = now
+        cached = self.lookup(frame, view) if self.lookup else None
+        if cached is not None:
+            return self._read(slot, cached)
+        slot["job_id"] = self.submit(frame, view)
+        return None
+
+    def _read(self, slot, reading):
+        country = reading["country"]
+        if country is None:
+            slot["code"], slot["reads"] = None, 0
+            return None
+        if country["code"] == slot.get("code"):
+            slot["reads"] += 1
+        else:
+            slot["code"], slot["reads"] = country["code"], 1
+        return reading if slot["reads"] >= self.stable_reads else None
+
+    def _expire(self, now):
+        # Slots of kiosks that stopped posting; at most once per idle timeout per process
+        if now - self._last_expiry < self.idle_timeout:
+            return
+        self._last_expiry = now
+        try:
+            names = os.listdir(self.state_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.stat(path).st_mtime < now - self.idle_timeout:
+                    os.remove(path)
+            except OSError:
+                continue
@@ -0,0 +1,68 @@
+# log_setup.py
+#
+# Logging for the web workers and the OCR worker processes.
+#
+# Modules log through their own logger (logging.getLogger(__name__)) with
+# %-style arguments, so a message below LOG_LEVEL is dropped before it's
+# formatted.  Request threads never write to the terminal or the log file
+# themselves: the root logger has a single QueueHandler that puts the record
+# on an in-memory queue, and a QueueListener thread formats and writes it.
+#
+# Records go to stderr (nohup.out under gunicorn) and, if LOG_FILE is set, to
+# a file rotated at LOG_MAX_BYTES keeping LOG_BACKUPS old copies.  Rotation is
+# per process, so with several gunicorn workers put "{pid}" in LOG_FILE to
+# give each worker its own file.
+#
+# Records carry the id of the request that logged them (REQUEST_ID, set per
+# request by app.py and returned as X-Request-ID), "-" outside a request.
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+
+FORMAT = "%(asctime)s %(levelname)-7s [%(name)s] [%(request_id)s] %(message)s"
+
+REQUEST_ID = contextvars.ContextVar("request_id", default="-")
+
+_listener = None
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        # Read here, in the request's thread; the listener thread formats later
+        record.request_id = REQUEST_ID.get()
+        return True
+
+
+def configure_logging(level="INFO", log_file=None, max_bytes=10 * 1024 * 1024, backups=5):
+    """Route this process's logging through a background writer. Only the first call takes effect."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        log_file = log_file.replace("{pid}", str(os.getpid()))
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(
+            logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups)
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(_RequestIdFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
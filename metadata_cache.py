@@ -0,0 +1,67 @@
+# metadata_cache.py
+#
+# Parsed JSON sidecar metadata (artist, title, year, ...) kept in memory.
+#
+# Every play used to list the song's directory and json.load a sidecar.  The
+# archive index now knows which sidecars exist, and this cache keeps the
+# parsed contents in a bounded LRU.  Each hit costs one os.stat: an entry is
+# only reused while the file's mtime and size are unchanged, so editing a
+# sidecar on disk is picked up on the next play.
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class MetadataCache:
+    """Bounded LRU of parsed JSON files, validated by mtime and size."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> (mtime_ns, size, data or None)
+        self._lock = threading.Lock()
+
+    def load(self, json_path):
+        """Return a copy of the parsed file, or None if it is missing or not valid JSON."""
+        if not json_path:
+            return None
+        try:
+            stat = os.stat(json_path)
+        except OSError:
+            with self._lock:
+                self._entries.pop(json_path, None)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(json_path)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._entries.move_to_end(json_path)
+                self.hits += 1
+                return dict(entry[2]) if entry[2] is not None else None
+            self.misses += 1
+
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = None
+        except (OSError, ValueError):
+            # Remember broken files too, so they aren't re-parsed on every play
+            data = None
+
+        with self._lock:
+            self._entries[json_path] = (stat.st_mtime_ns, stat.st_size, data)
+            self._entries.move_to_end(json_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(data) if data is not None else None
+
+    def first(self, json_paths):
+        """Metadata from the first of `json_paths` that loads, or {} if none do."""
+        for json_path in json_paths:
+            data = self.load(json_path)
+            if data is not None:
+                return data
+        return {}
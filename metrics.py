@@ -0,0 +1,219 @@
+# metrics.py
+#
+# Counters and latency histograms, served in the Prometheus text format at
+# /metrics.
+#
+# Updates only touch a dict in the process that makes them.  When
+# METRICS_DIR is set (app.py sets it for itself and its OCR workers), a
+# background thread writes this process's values to METRICS_DIR/<pid>.json
+# every few seconds, and /metrics adds up the files of every process: all
+# gunicorn workers and their OCR worker processes, whichever worker answers
+# the scrape.  Files of processes that have exited are kept, so counters
+# don't go backwards when a worker is replaced; clear the directory when the
+# service is (re)started.  Without METRICS_DIR /metrics shows only the
+# process that answers.
+#
+# Values other modules already count (cache hits, dropped frames) are read by
+# collectors registered with add_collector just before each write, rather
+# than counted twice.
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 5.0
+
+_metrics = {}  # name -> metric, in registration order
+_collectors = []
+_lock = threading.Lock()
+_flusher = None
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}  # label values -> count
+        _register(self)
+
+    def inc(self, amount=1, **labels):
+        key = _key(self, labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _start_flusher()
+
+    def set(self, value, **labels):
+        """Set the running total outright, for counts kept elsewhere (see add_collector)."""
+        key = _key(self, labels)
+        with _lock:
+            self.values[key] = value
+
+    def _merge(self, samples):
+        values = {}
+        for key, value in samples:
+            values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+    def _lines(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [count per bucket (+Inf last), sum]
+        _register(self)
+
+    def observe(self, value, **labels):
+        key = _key(self, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+        _start_flusher()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _merge(self, samples):
+        values = {}
+        for key, (counts, total) in samples:
+            entry = values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+        return values
+
+    def _lines(self, values):
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+
+
+def add_collector(fn):
+    """Call `fn()` before each snapshot, to copy counts kept elsewhere into Counters."""
+    _collectors.append(fn)
+
+
+def render():
+    """All metrics, across processes when METRICS_DIR is set, in the Prometheus text format."""
+    directory = os.environ.get("METRICS_DIR")
+    if directory:
+        flush()
+        merged = _read_all(directory)
+    else:
+        merged = _snapshot()
+    lines = []
+    for name, metric in _metrics.items():
+        kind = "counter" if isinstance(metric, Counter) else "histogram"
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(metric._lines(metric._merge(merged.get(name, []))))
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """Write this process's values to METRICS_DIR (if set)."""
+    directory = os.environ.get("METRICS_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _snapshot():
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception:
+            pass
+    with _lock:
+        return {
+            name: [[list(key), value] for key, value in metric.values.items()]
+            for name, metric in _metrics.items()
+        }
+
+
+def _read_all(directory):
+    merged = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), "r") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, samples in snapshot.items():
+            merged.setdefault(name, []).extend(samples)
+    return merged
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None or not os.environ.get("METRICS_DIR"):
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flusher.start()
+    atexit.register(flush)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _register(metric):
+    if metric.name in _metrics:
+        raise ValueError(f"Metric {metric.name} is already registered")
+    _metrics[metric.name] = metric
+
+
+def _key(metric, labels):
+    return tuple(str(labels.get(name, "")) for name in metric.labels)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,130 @@
+# ocr_cache.py
+#
+# Remembers what was read from recent scans (the text and the country found in
+# it) so pointing the camera at the same spot on the globe again doesn't pay
+# for Tesseract again.
+#
+# Two photos of the same label are never byte-identical (sensor noise, a hand
+# wobbling the globe), so entries are keyed by a 64-bit difference hash
+# (dHash) of the part of the frame that would be OCR'd: the crop is shrunk to
+# 9x8 and each bit says whether a pixel is brighter than its right-hand
+# neighbour.  Frames of the same label land a few bits apart, so a lookup
+# accepts any entry within max_distance bits (Hamming distance).
+#
+# Lookups use multi-index hashing: the 64 bits are cut into max_distance + 1
+# bands and each band indexes the entries having that band value.  Two hashes
+# within max_distance bits must agree exactly on at least one band, so only
+# the entries sharing a band are compared, not the whole cache.  Keep
+# max_distance small: a label is a thin strip of the crop, so two different
+# words at the same spot on a plain background can be only a few bits apart;
+# it's the coastlines and colours around them that tell them apart.
+#
+# The hash is computed in the web process from a half-resolution decode, a
+# couple of milliseconds, before a scan is queued.  Only scans that found a
+# country are cached, entries expire ttl seconds after they were stored and the
+# least recently used are dropped beyond max_entries.
+import threading
+import time
+from collections import OrderedDict
+
+from ocr_geometry import crop_scan
+
+HASH_SIZE = 8  # 8x8 = 64 bits
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# Flat crops (lens covered, pointing at the sea) hash to noise; don't cache them
+MIN_CONTRAST = 8.0
+
+
+def frame_hash(image_bytes, view=None):
+    """dHash of the region ocr_image would read, or None if there's nothing worth caching."""
+    import cv2
+    import numpy as np
+
+    if view is not None:
+        # The crop scales with the frame, so half resolution crops the same region
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    else:
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    try:
+        region = crop_scan(image, view)
+    except ValueError:
+        return None
+    if not region.size or region.std() < MIN_CONTRAST:
+        return None
+
+    small = cv2.resize(region, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class OcrResultCache:
+    """Bounded, expiring map of frame hash -> reading, looked up by Hamming distance."""
+
+    def __init__(self, max_entries=256, ttl=300, max_distance=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # hash -> (stored at, reading)
+        self._band_bits = -(-HASH_BITS // (max_distance + 1))
+        self._bands = [{} for _ in range(max_distance + 1)]  # band value -> set of hashes
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Reading from the closest live entry within max_distance bits of `key`, or None."""
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            nearest, nearest_distance = None, None
+            for candidate in self._candidates(key):
+                stored_at, _ = self._entries[candidate]
+                if now - stored_at > self.ttl:
+                    self._remove(candidate)
+                    continue
+                distance = (candidate ^ key).bit_count()
+                if distance <= self.max_distance and (nearest is None or distance < nearest_distance):
+                    nearest, nearest_distance = candidate, distance
+            if nearest is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(nearest)
+            return self._entries[nearest][1]
+
+    def put(self, key, reading):
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), reading)
+            for band, value in zip(self._bands, self._band_values(key)):
+                band.setdefault(value, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_values(self, key):
+        mask = (1 << self._band_bits) - 1
+        return [(key >> (i * self._band_bits)) & mask for i in range(len(self._bands))]
+
+    def _candidates(self, key):
+        found = set()
+        for band, value in zip(self._bands, self._band_values(key)):
+            found.update(band.get(value, ()))
+        return found
+
+    def _remove(self, key):
+        del self._entries[key]
+        for band, value in zip(self._bands, self._band_values(key)):
+            keys = band.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del band[value]
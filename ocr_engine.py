@@ -0,0 +1,112 @@
+# ocr_engine.py
+#
+# The Tesseract call behind ocr_pipeline.ocr_image.
+#
+# pytesseract runs the `tesseract` binary for every scan: the image goes out
+# through a temp file, the traineddata is loaded again, and the text comes
+# back through another temp file.  When tesserocr is installed the engine
+# instead keeps one TessBaseAPI handle per OCR process, configured once with
+# the same settings as TESSERACT_CONFIG (--psm 6, A-Z whitelist), and hands
+# it the image in memory.
+#
+# OCR_ENGINE picks the backend: 'tesserocr', 'pytesseract', or 'auto' (the
+# default; tesserocr if it imports, else pytesseract).  It is read from the
+# environment because it has to reach the OCR worker processes too.
+#
+# `python -m benchmarks.ocr_engines` compares per-scan latency of the two.
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+PSM_SINGLE_BLOCK = 6
+OEM_DEFAULT = 3
+CHAR_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+TESSERACT_CONFIG = f'--oem {OEM_DEFAULT} --psm {PSM_SINGLE_BLOCK} -c tessedit_char_whitelist="{CHAR_WHITELIST}"'
+
+
+class PytesseractEngine:
+    """One `tesseract` subprocess per call."""
+
+    name = "pytesseract"
+
+    def __init__(self):
+        import pytesseract
+
+        self._pytesseract = pytesseract
+
+    def recognize(self, image):
+        """Text in a PIL image."""
+        return self._pytesseract.image_to_string(image, config=TESSERACT_CONFIG)
+
+    def version(self):
+        return str(self._pytesseract.get_tesseract_version())
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """A TessBaseAPI handle kept open for the life of the process."""
+
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self._api = tesserocr.PyTessBaseAPI(
+            psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.DEFAULT
+        )
+        self._api.SetVariable("tessedit_char_whitelist", CHAR_WHITELIST)
+        # The handle holds per-image state, so scans from request threads take turns
+        self._lock = threading.Lock()
+
+    def recognize(self, image):
+        """Text in a PIL image."""
+        with self._lock:
+            self._api.SetImage(image)
+            text = self._api.GetUTF8Text()
+            self._api.Clear()
+        return text
+
+    def version(self):
+        return self._tesserocr.tesseract_version().splitlines()[0]
+
+    def close(self):
+        with self._lock:
+            self._api.End()
+
+
+ENGINES = {
+    "tesserocr": TesserocrEngine,
+    "pytesseract": PytesseractEngine,
+}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(name="auto"):
+    """Build an engine by name; 'auto' prefers tesserocr and falls back to pytesseract."""
+    if name == "auto":
+        try:
+            return TesserocrEngine()
+        except (ImportError, RuntimeError) as e:
+            # RuntimeError: tesserocr is installed but couldn't load its traineddata
+            log.info("tesserocr unavailable (%s); using pytesseract", e)
+            return PytesseractEngine()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR_ENGINE: {name}")
+    return ENGINES[name]()
+
+
+def get_engine():
+    """This process's engine, created on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(os.environ.get("OCR_ENGINE", "auto"))
+    return _engine
@@ -0,0 +1,98 @@
+# ocr_geometry.py
+#
+# Where the calibrated viewfinder is in a camera frame.
+#
+# Calibration (/save) stores the viewfinder circle in screen pixels:
+# session["x"], session["y"], session["diameter"].  The kiosk shows the camera
+# with `object-fit: cover`, so the frame is scaled to fill the screen and the
+# overflow on one axis is cut off; a screen point maps to the frame by undoing
+# that scale and offset.  The scanning box is ROI_SCALE of the diameter, the
+# square drawn inside the circle.
+#
+# The kiosk uploads whole frames with the size of the screen it was shown on,
+# and the server crops that box once.  Working out the crop only depends on
+# the calibration and the two sizes, which don't change between scans, so the
+# plan (slice bounds plus the white padding needed where the box runs off the
+# frame) is cached and each scan is a slice and, rarely, a border copy.
+#
+# The kiosk page crops that same box itself before uploading, so a scan sends
+# a few hundred pixels square rather than whole frames; its uploads say so
+# (view CLIENT_CROP) and are read as they are.  Uploads with neither (older
+# kiosks) get the fixed CROP_WIDTH x CROP_HEIGHT centre.
+#
+# Cropping is plain array slicing, so this module doesn't import OpenCV
+# unless a border has to be added; the web process can use it without
+# loading the OCR stack.
+from collections import namedtuple
+from functools import lru_cache
+
+ROI_SCALE = 0.6
+CROP_WIDTH = 200
+CROP_HEIGHT = 350
+
+CLIENT_CROP = "client"  # the upload is already the scanning box
+
+Viewfinder = namedtuple("Viewfinder", ["x", "y", "diameter", "view_width", "view_height"])
+CropPlan = namedtuple("CropPlan", ["top", "bottom", "left", "right", "padding"])
+
+
+def crop_center(img, cropx, cropy):
+    y, x = img.shape[:2]
+    startx = x // 2 - (cropx // 2)
+    starty = y // 2 - (cropy // 2)
+    return img[starty : starty + cropy, startx : startx + cropx]
+
+
+@lru_cache(maxsize=64)
+def crop_plan(viewfinder, frame_width, frame_height):
+    """The frame-pixel box under the viewfinder for a frame of this size."""
+    x, y, diameter, view_width, view_height = viewfinder
+    # object-fit: cover scales the frame by the larger ratio and centres it
+    scale = max(view_width / frame_width, view_height / frame_height)
+    offset_x = (view_width - frame_width * scale) / 2
+    offset_y = (view_height - frame_height * scale) / 2
+
+    center_x = (x - offset_x) / scale
+    center_y = (y - offset_y) / scale
+    size = max(round(diameter * ROI_SCALE / scale), 1)
+
+    left = round(center_x - size / 2)
+    top = round(center_y - size / 2)
+    right, bottom = left + size, top + size
+    padding = (
+        max(-top, 0),
+        max(bottom - frame_height, 0),
+        max(-left, 0),
+        max(right - frame_width, 0),
+    )
+    return CropPlan(
+        max(top, 0),
+        min(bottom, frame_height),
+        max(left, 0),
+        min(right, frame_width),
+        padding if any(padding) else None,
+    )
+
+
+def crop_viewfinder(image, viewfinder):
+    """The part of `image` under the calibrated scanning box. Raises ValueError if it's off the frame."""
+    height, width = image.shape[:2]
+    plan = crop_plan(viewfinder, width, height)
+    cropped = image[plan.top : plan.bottom, plan.left : plan.right]
+    if not cropped.size:
+        raise ValueError("Viewfinder is outside the camera frame; recalibrate")
+    if plan.padding:
+        import cv2
+
+        top, bottom, left, right = plan.padding
+        cropped = cv2.copyMakeBorder(cropped, top, bottom, left, right, cv2.BORDER_CONSTANT, value=255)
+    return cropped
+
+
+def crop_scan(image, view):
+    """The part of `image` to OCR for an upload with this view (a Viewfinder, CLIENT_CROP or None)."""
+    if view == CLIENT_CROP:
+        return image
+    if view is not None:
+        return crop_viewfinder(image, view)
+    return crop_center(image, CROP_WIDTH, CROP_HEIGHT)
@@ -0,0 +1,246 @@
+# ocr_jobs.py
+#
+# Background OCR jobs for /ocr_jobs.
+#
+# Running Tesseract inside the request blocked a gunicorn worker for hundreds
+# of milliseconds per scan, and a burst of camera captures could tie up every
+# worker while audio requests queued behind them.  Instead a request submits
+# the image to a small pool of warm OCR processes and returns a job id at
+# once; the browser then polls for the result.
+#
+# Results are written to a directory shared by all gunicorn workers, because
+# the poll may land on a different worker than the submit did.  A submit from
+# a client that already has a job in flight is coalesced onto that job.  The
+# pool is bounded by frames, not jobs (a burst of three frames is three
+# tasks): a submit that would take more than `max_pending` frames into the
+# queue is rejected with QueueFull so the caller can answer 429, except into
+# an empty queue, so one burst larger than the bound still runs.
+#
+# The pool is started by start(), which app.py calls on a worker's first
+# request, so the processes have spawned and loaded Tesseract before the
+# first visitor scans.
+#
+# A burst job OCRs several frames of one capture in parallel and finishes as
+# soon as its vote is confident (see ocr_vote.py), so a blurry frame no longer
+# costs the visitor a second round-trip.
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class QueueFull(Exception):
+    """Raised by OcrJobQueue.submit when too many frames are already queued."""
+
+
+class OcrJobQueue:
+    def __init__(self, results_dir, workers=2, max_pending=12, job_ttl=300, warm_up=None, preload="ocr_pipeline"):
+        self.results_dir = results_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.warm_up = warm_up
+        self.preload = preload  # module the forkserver imports instead of __main__
+        self._executor = None
+        self._pending = {}  # job id -> Future, for jobs submitted by this process
+        self._by_key = {}  # coalesce key -> job id
+        self._queued_frames = 0  # pool tasks submitted and not finished
+        self._lock = threading.Lock()
+        self._frames_lock = threading.Lock()
+        os.makedirs(results_dir, exist_ok=True)
+
+    def start(self):
+        """Start the pool and warm its processes up, if that hasn't happened yet."""
+        if self._executor is None:
+            with self._lock:
+                self._get_executor()
+
+    def _get_executor(self):
+        # Created after the fork (start() or the first submit) so each gunicorn
+        # worker gets its own pool.  forkserver avoids forking a process that
+        # already runs threads (the archive watcher).  The forkserver preloads
+        # __main__ by default, which under `python app.py` would run the app's
+        # module setup (index load, watcher and prewarm threads) again in the
+        # server, so it preloads only the module the OCR work lives in.  Called
+        # with self._lock held.
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            ctx = multiprocessing.get_context(method)
+            if method == "forkserver":
+                ctx.set_forkserver_preload([self.preload])
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+            if self.warm_up:
+                for _ in range(self.workers):
+                    self._executor.submit(self.warm_up)
+        return self._executor
+
+    def submit(self, fn, *args, coalesce_key=None):
+        """Queue fn(*args) in the pool. Returns (job_id, coalesced)."""
+        with self._lock:
+            if coalesce_key is not None:
+                job_id = self._by_key.get(coalesce_key)
+                if job_id in self._pending:
+                    return job_id, True
+            self._check_room(1)
+
+            job_id = self._new_job(coalesce_key)
+            future = self._pool_submit(fn, *args)
+            self._pending[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, coalesce_key, f))
+        return job_id, False
+
+    def submit_burst(self, fn, calls, vote, coalesce_key=None):
+        """Queue fn(*args) for every args tuple in `calls` at once; the job ends as soon as `vote` decides.
+
+        `vote.add(result)` is called with each frame's result as it arrives and
+        returns True once it has seen enough; `vote.result()` is then stored as
+        the job's result and frames that haven't started are cancelled.
+        """
+        with self._lock:
+            if coalesce_key is not None:
+                job_id = self._by_key.get(coalesce_key)
+                if job_id in self._pending:
+                    return job_id, True
+            self._check_room(len(calls))
+
+            job_id = self._new_job(coalesce_key)
+            job = Future()
+            frame_futures = [self._pool_submit(fn, *args) for args in calls]
+            self._pending[job_id] = job
+
+        burst_lock = threading.Lock()
+        remaining = [len(frame_futures)]
+        errors = []
+
+        def frame_done(future):
+            with burst_lock:
+                if job.done():
+                    return
+                remaining[0] -= 1
+                try:
+                    decided = vote.add(future.result())
+                except Exception as e:
+                    decided = False
+                    errors.append(e)
+                if not decided and remaining[0] > 0:
+                    return
+                if errors and len(errors) == len(frame_futures):
+                    job.set_exception(errors[0])
+                else:
+                    job.set_result(vote.result())
+            for other in frame_futures:
+                other.cancel()
+
+        job.add_done_callback(lambda f: self._finish(job_id, coalesce_key, f))
+        for future in frame_futures:
+            future.add_done_callback(frame_done)
+        return job_id, False
+
+    def _new_job(self, coalesce_key):
+        # Called with self._lock held
+        self._expire_results()
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {"state": "pending", "created": time.time()})
+        if coalesce_key is not None:
+            self._by_key[coalesce_key] = job_id
+        return job_id
+
+    def _check_room(self, frames):
+        # Called with self._lock held
+        with self._frames_lock:
+            queued = self._queued_frames
+        if queued and queued + frames > self.max_pending:
+            raise QueueFull()
+
+    def _pool_submit(self, fn, *args):
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # An OCR process died (e.g. killed by the OOM killer); start a fresh pool
+            self._executor = None
+            future = self._get_executor().submit(fn, *args)
+        with self._frames_lock:
+            self._queued_frames += 1
+        # Also runs when a burst cancels a frame that hadn't started
+        future.add_done_callback(self._frame_finished)
+        return future
+
+    def _frame_finished(self, future):
+        with self._frames_lock:
+            self._queued_frames -= 1
+
+    def status(self, job_id, wait=0):
+        """The job's state dict ({"state": "pending" | "done" | "error", ...}), or None if unknown.
+
+        With `wait` > 0, blocks for up to that many seconds for the job to finish.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            with self._lock:
+                future = self._pending.get(job_id)
+            if future is not None and wait > 0:
+                try:
+                    future.exception(timeout=max(deadline - time.monotonic(), 0))
+                except FutureTimeoutError:
+                    pass
+            state = self._read(job_id)
+            if state is None or state["state"] != "pending" or time.monotonic() >= deadline:
+                return state
+            # Submitted by another worker; all we can do is watch the file
+            time.sleep(0.05)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _finish(self, job_id, coalesce_key, future):
+        try:
+            state = {"state": "done", "result": future.result()}
+        except Exception as e:
+            state = {"state": "error", "error": str(e)}
+        state["created"] = time.time()
+        self._write(job_id, state)
+        with self._lock:
+            self._pending.pop(job_id, None)
+            if coalesce_key is not None and self._by_key.get(coalesce_key) == job_id:
+                del self._by_key[coalesce_key]
+
+    def _path(self, job_id):
+        return os.path.join(self.results_dir, f"{job_id}.json")
+
+    def _write(self, job_id, state):
+        tmp_path = f"{self._path(job_id)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(job_id))
+
+    def _read(self, job_id):
+        # Job ids are hex; anything else can't be ours (and mustn't reach the filesystem)
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _expire_results(self):
+        cutoff = time.time() - self.job_ttl
+        try:
+            names = os.listdir(self.results_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.results_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
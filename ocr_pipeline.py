@@ -0,0 +1,142 @@
+# ocr_pipeline.py
+#
+# The image -> country half of /image_processing: decode the uploaded JPEG as
+# grayscale, crop the calibrated viewfinder (ocr_geometry.py), cut it into
+# text boxes (ocr_preprocess.py), stack them on one page, run Tesseract once
+# and find the country in the text (country_matcher.py).  Kept free of
+# Flask so it can run inside the OCR worker processes (see ocr_jobs.py) as
+# well as in a request.
+#
+# The OCR jobs run read_country, not just ocr_image, so the country is matched
+# in the OCR worker as well: the fuzzy pass is pure Python and takes tens of
+# milliseconds on noisy text (benchmarks/country_matching.py), which the web
+# workers shouldn't spend on every burst frame and live-scan frame.
+#
+# cv2, numpy, PIL and the preprocessing are imported on the first scan (or by
+# load_ocr_stack), not with the module: every web worker imports this at boot,
+# and most of their requests are audio.
+import logging
+import os
+import time
+
+import debug_capture
+import metrics
+from country_matcher import DEFAULT_MIN_CONFIDENCE, default_matcher
+from log_setup import configure_logging
+from ocr_engine import get_engine
+from ocr_geometry import crop_scan
+
+log = logging.getLogger(__name__)
+
+OCR_STAGE_SECONDS = metrics.Histogram(
+    "globo_ocr_stage_duration_seconds", "Time in each OCR stage, in the OCR workers", ["stage"]
+)
+
+_config = None  # preprocessing stages, read from OCR_PREPROCESS on first use
+
+
+def ocr_image(image_bytes, capture=None, view=None, engine=None):
+    """Run OCR on an encoded image. Raises ValueError if it can't be decoded.
+
+    `view` is the calibrated ocr_geometry.Viewfinder the frame was taken
+    through, or CLIENT_CROP if the kiosk already cropped it; without one
+    (older kiosks) the fixed CROP_WIDTH x CROP_HEIGHT centre is used.  `capture` is (directory,
+    capture id, file prefix) when this scan was sampled for debugging (see
+    debug_capture.py).
+    """
+    return ocr_image_timed(image_bytes, capture, view, engine)[0]
+
+
+def read_country(image_bytes, capture=None, view=None, min_confidence=DEFAULT_MIN_CONFIDENCE, matcher=None):
+    """OCR a frame and find the country in it. Returns a reading, see read_text."""
+    return read_text(ocr_image(image_bytes, capture, view), min_confidence, matcher)
+
+
+def read_text(text, min_confidence=DEFAULT_MIN_CONFIDENCE, matcher=None):
+    """{"text": text, "country": the best country_matcher.Candidate as a dict, or None}.
+
+    Plain data, so it can go through the job results files and the OCR cache.
+    """
+    started = time.perf_counter()
+    candidate = (matcher or default_matcher()).best(text, min_confidence)
+    OCR_STAGE_SECONDS.observe(time.perf_counter() - started, stage="match")
+    return {"text": text, "country": candidate._asdict() if candidate else None}
+
+
+def ocr_image_timed(image_bytes, capture=None, view=None, engine=None, config=None):
+    """ocr_image, also returning how long each stage took: (text, {stage: ms})."""
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from ocr_preprocess import preprocess, stack_boxes
+
+    started = time.perf_counter()
+    # Only the luminance is used, so let the decoder skip the colour conversion
+    file_bytes = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Failed to decode image")
+    timings = {"decode": round((time.perf_counter() - started) * 1000, 2)}
+
+    crop_started = time.perf_counter()
+    gray = crop_scan(image, view)
+    timings["crop"] = round((time.perf_counter() - crop_started) * 1000, 2)
+
+    boxes, stage_timings = preprocess(gray, config or _preprocess_config())
+    timings.update(stage_timings)
+
+    ocr_started = time.perf_counter()
+    engine = engine or get_engine()
+    # One call per scan: with pytesseract each call is a `tesseract` process
+    page = stack_boxes(boxes)
+    lines = engine.recognize(Image.fromarray(page)).splitlines()
+    text = "\n".join(line.strip() for line in lines if line.strip())
+    timings["ocr"] = round((time.perf_counter() - ocr_started) * 1000, 2)
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    for stage, ms in timings.items():
+        OCR_STAGE_SECONDS.observe(ms / 1000, stage=stage)
+
+    if capture:
+        directory, capture_id, prefix = capture
+        files = {
+            f"{prefix}original.jpg": image,
+            f"{prefix}cropped.jpg": gray,
+            f"{prefix}ocr.txt": text,
+            f"{prefix}timings.json": timings,
+            f"{prefix}page.jpg": page,
+        }
+        debug_capture.writer_for(directory).save(capture_id, files)
+    return text, timings
+
+
+def _preprocess_config():
+    global _config
+    if _config is None:
+        from ocr_preprocess import config_from_env
+
+        _config = config_from_env()
+    return _config
+
+
+def load_ocr_stack():
+    """Import the libraries a scan needs, ahead of the first scan."""
+    import cv2
+    import numpy
+    from PIL import Image
+
+    import ocr_preprocess
+
+
+def warm_up():
+    """Called once in each OCR worker process so the first real scan doesn't pay for imports."""
+    # Workers log to stderr only; the web process owns the log file
+    configure_logging(os.environ.get("LOG_LEVEL", "INFO"))
+    try:
+        load_ocr_stack()
+        default_matcher()
+        engine = get_engine()
+        log.info("Worker %d using %s (Tesseract %s)", os.getpid(), engine.name, engine.version())
+    except Exception as e:
+        log.error("Worker %d could not start an OCR engine: %s", os.getpid(), e)
+        return False
+    return True
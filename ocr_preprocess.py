@@ -0,0 +1,220 @@
+# ocr_preprocess.py
+#
+# Turns the grayscale crop into a few small, level, black-on-white text boxes
+# so Tesseract reads the label instead of the globe's texture.
+#
+# Stages, each optional and each timed:
+#
+#   downscale  shrink the crop so its longest side is at most max_side
+#   clahe      local contrast equalisation, so labels in the shadow of the
+#              globe's curve come out as clearly as those in the light
+#   threshold  adaptive threshold to black text on white; the result is
+#              inverted when most of it came out dark (light text on a dark sea)
+#   regions    morphological text-region proposal: close the letters of a word
+#              into blobs and keep the blob rectangles that look like text
+#   deskew     rotate each region level using its minimum-area rectangle;
+#              labels follow the globe's curvature, so each word is levelled
+#              on its own rather than the image as a whole
+#
+# Each region is finally scaled so its text is about text_height pixels tall,
+# the size Tesseract reads best.  If no regions are found the whole
+# thresholded crop is used.  stack_boxes lays the boxes out one per line on a
+# single white page, so a scan is one Tesseract call however many regions it
+# has (one `tesseract` process with pytesseract, not one per region).
+#
+# OCR_PREPROCESS picks the stages (comma separated, "none" for the plain crop);
+# like OCR_ENGINE it is read from the environment so the OCR workers see it.
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+ALL_STAGES = ("downscale", "clahe", "threshold", "regions", "deskew")
+
+PreprocessConfig = namedtuple(
+    "PreprocessConfig",
+    [
+        "stages",
+        "max_side",
+        "text_height",
+        "clahe_clip",
+        "block_size",
+        "threshold_c",
+        "min_region_height",
+        "max_regions",
+    ],
+)
+
+DEFAULT_CONFIG = PreprocessConfig(
+    stages=ALL_STAGES,
+    max_side=800,
+    text_height=32,
+    clahe_clip=2.0,
+    block_size=31,
+    threshold_c=15,
+    min_region_height=8,
+    max_regions=6,
+)
+
+
+def config_from_env():
+    stages = os.environ.get("OCR_PREPROCESS")
+    if stages is None:
+        return DEFAULT_CONFIG
+    if stages.strip().lower() == "none":
+        return DEFAULT_CONFIG._replace(stages=())
+    names = tuple(s.strip() for s in stages.split(",") if s.strip())
+    unknown = [s for s in names if s not in ALL_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown OCR_PREPROCESS stage(s): {', '.join(unknown)}")
+    return DEFAULT_CONFIG._replace(stages=names)
+
+
+class _Timer:
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._last) * 1000, 2)
+        self._last = now
+
+
+def preprocess(gray, config=DEFAULT_CONFIG):
+    """Text boxes to OCR (top to bottom) and per-stage timings in ms for a grayscale crop."""
+    timer = _Timer()
+    stages = config.stages
+    image = gray
+
+    if "downscale" in stages:
+        longest = max(image.shape[:2])
+        if longest > config.max_side:
+            scale = config.max_side / longest
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        timer.lap("downscale")
+
+    if "clahe" in stages:
+        clahe = cv2.createCLAHE(clipLimit=config.clahe_clip, tileGridSize=(8, 8))
+        image = clahe.apply(image)
+        timer.lap("clahe")
+
+    binary = None
+    if "threshold" in stages:
+        block_size = config.block_size | 1  # must be odd
+        # Smooth sensor noise first, or it thresholds into speckle that joins up with the letters
+        smoothed = cv2.GaussianBlur(image, (5, 5), 0)
+        binary = cv2.adaptiveThreshold(
+            smoothed, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, config.threshold_c
+        )
+        if np.count_nonzero(binary) < binary.size // 2:
+            binary = cv2.bitwise_not(binary)
+        image = binary
+        timer.lap("threshold")
+
+    boxes = []
+    if "regions" in stages:
+        rects = text_regions(image, config, binary=binary is not None)
+        timer.lap("regions")
+        for rect in rects:
+            if "deskew" in stages:
+                box = _deskew(image, rect)
+            else:
+                x, y, w, h = cv2.boundingRect(cv2.boxPoints(rect).astype(np.int32))
+                pad = int(min(w, h) * 0.2)
+                box = image[max(y - pad, 0) : y + h + pad, max(x - pad, 0) : x + w + pad]
+            if box.size:
+                boxes.append(_scale_to_text_height(box, config.text_height))
+        if "deskew" in stages:
+            timer.lap("deskew")
+
+    if not boxes:
+        boxes = [image]
+    return boxes, timer.timings
+
+
+def text_regions(image, config=DEFAULT_CONFIG, binary=True):
+    """Rotated rectangles ((cx, cy), (w, h), angle) around word-like blobs, top to bottom.
+
+    `image` is black text on white; pass binary=False for a grayscale image.
+    """
+    # Work on the inverse so letters are the foreground
+    ink = cv2.bitwise_not(image)
+    if not binary:
+        _, ink = cv2.threshold(ink, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+    height, width = ink.shape[:2]
+    # Drop specks, join letters into words (but not lines into paragraphs), then
+    # drop thin strokes such as coastlines and graticule lines
+    ink = cv2.morphologyEx(ink, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 25, 3), 3))
+    blobs = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, kernel)
+    blobs = cv2.morphologyEx(blobs, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rects = []
+    for contour in contours:
+        rect = cv2.minAreaRect(contour)
+        (_, _), (w, h), _ = rect
+        short, long = min(w, h), max(w, h)
+        if short < config.min_region_height or short > height * 0.5:
+            continue
+        # Words are wider than tall; globe texture and coastlines rarely are so regular
+        if long < short * 1.5 or cv2.contourArea(contour) < 0.4 * long * short:
+            continue
+        rects.append(rect)
+
+    rects.sort(key=lambda r: r[0][1])
+    if len(rects) > config.max_regions:
+        # Keep the largest; the label dominates the crop
+        rects = sorted(rects, key=lambda r: r[1][0] * r[1][1], reverse=True)[: config.max_regions]
+        rects.sort(key=lambda r: r[0][1])
+    return rects
+
+
+def stack_boxes(boxes, gap=None):
+    """The boxes on one white page, one per line and left-aligned, `gap` pixels apart."""
+    if len(boxes) == 1:
+        return boxes[0]
+    if gap is None:
+        gap = max(min(box.shape[0] for box in boxes) // 2, 8)
+    width = max(box.shape[1] for box in boxes) + 2 * gap
+    height = sum(box.shape[0] for box in boxes) + gap * (len(boxes) + 1)
+    page = np.full((height, width), 255, np.uint8)
+    top = gap
+    for box in boxes:
+        page[top : top + box.shape[0], gap : gap + box.shape[1]] = box
+        top += box.shape[0] + gap
+    return page
+
+
+def _deskew(image, rect):
+    (cx, cy), (w, h), angle = rect
+    # minAreaRect's angle convention changed in OpenCV 4.5; normalise to a
+    # rotation that makes the long side horizontal
+    if w < h:
+        w, h = h, w
+        angle += 90
+    if angle > 45:
+        angle -= 180
+    elif angle < -45:
+        angle += 180
+    # Pad a little so descenders and the ends of words survive the rotation
+    w, h = int(w + h * 0.4), int(h * 1.4)
+    matrix = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    matrix[0, 2] += w / 2 - cx
+    matrix[1, 2] += h / 2 - cy
+    return cv2.warpAffine(
+        image, matrix, (max(w, 1), max(h, 1)), flags=cv2.INTER_LINEAR, borderValue=255
+    )
+
+
+def _scale_to_text_height(box, text_height):
+    # Regions are padded by ~40%, so the letters are ~70% of the box height
+    scale = text_height / (box.shape[0] * 0.7)
+    if 0.8 < scale < 1.25:
+        return box
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(box, None, fx=scale, fy=scale, interpolation=interpolation)
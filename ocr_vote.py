@@ -0,0 +1,35 @@
+# ocr_vote.py
+#
+# Picks the country from a burst of frames.
+#
+# The kiosk sends a few frames of one capture (see /ocr_jobs).  Each frame is
+# read on its own (ocr_pipeline.read_country, in the OCR worker), and the
+# confidence of every match is added to that country's score.  The vote is decided as soon as one country's score
+# reaches `exit_score`: with the default of 1.0 that is one exact read, or two
+# frames agreeing on a fuzzy one.  If no country gets there the highest score
+# wins once every frame is in.
+class CountryVote:
+    def __init__(self, exit_score=1.0):
+        self.exit_score = exit_score
+        self.scores = {}  # country code -> summed confidence
+        self._best = {}  # country code -> (confidence, reading) of its best frame
+        self._readings = []
+
+    def add(self, reading):
+        """Count one frame's reading (see ocr_pipeline.read_text). Returns True once the vote is decided."""
+        self._readings.append(reading)
+        country = reading["country"]
+        if country is None:
+            return False
+        code, confidence = country["code"], country["confidence"]
+        self.scores[code] = self.scores.get(code, 0) + confidence
+        if confidence > self._best.get(code, (0, None))[0]:
+            self._best[code] = (confidence, reading)
+        return self.scores[code] >= self.exit_score
+
+    def result(self):
+        """Reading of the winning country's best frame (or of the first frame if none matched)."""
+        if not self.scores:
+            return self._readings[0] if self._readings else {"text": "", "country": None}
+        winner = max(self.scores, key=self.scores.get)
+        return self._best[winner][1]
@@ -0,0 +1,154 @@
+# queue_store.py
+#
+# Server-side storage for app2's shuffled play queues.
+#
+# A queue used to live in session['queue'], which Flask serialises into the
+# signed session cookie; a decade with a few thousand tracks blows past the
+# browser's cookie limit and is re-sent on every request.  Now the queue lives
+# here and the cookie only carries its id and the cursor:
+#
+#     session['queue_id'], session['queue_pos']
+#
+# Selections that include "all" don't use this at all; they walk a lazy
+# permutation of the archive index instead (see shuffle.py).
+#
+# Reading the next track is a list index (memory) or a primary-key lookup
+# (SQLite).  The memory store is per process; with several gunicorn workers
+# use the SQLite store so every worker sees the same queues.  A queue missing
+# from the store (evicted, or created by another worker with the memory store)
+# is treated like an empty queue and the caller rebuilds it.
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def new_queue_id():
+    return uuid.uuid4().hex
+
+
+class MemoryQueueStore:
+    """In-process LRU of queues, keyed by queue id."""
+
+    def __init__(self, max_queues=1000):
+        self.max_queues = max_queues
+        self._queues = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, tracks):
+        queue_id = new_queue_id()
+        with self._lock:
+            self._queues[queue_id] = list(tracks)
+            while len(self._queues) > self.max_queues:
+                self._queues.popitem(last=False)
+        return queue_id
+
+    def get(self, queue_id, position):
+        """The track at `position`, or None past the end / for an unknown queue."""
+        with self._lock:
+            tracks = self._queues.get(queue_id)
+            if tracks is None:
+                return None
+            self._queues.move_to_end(queue_id)
+        return tracks[position] if 0 <= position < len(tracks) else None
+
+    def length(self, queue_id):
+        with self._lock:
+            tracks = self._queues.get(queue_id)
+        return len(tracks) if tracks is not None else 0
+
+    def delete(self, queue_id):
+        with self._lock:
+            self._queues.pop(queue_id, None)
+
+
+class SQLiteQueueStore:
+    """Queues in a SQLite file shared by all worker processes."""
+
+    def __init__(self, path, max_age=24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS queues (
+                    id TEXT PRIMARY KEY,
+                    length INTEGER NOT NULL,
+                    touched REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS queue_items (
+                    queue_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    track TEXT NOT NULL,
+                    PRIMARY KEY (queue_id, position)
+                ) WITHOUT ROWID;
+                """
+            )
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def create(self, tracks):
+        queue_id = new_queue_id()
+        now = time.time()
+        with self._connect() as db:
+            self._expire(db, now)
+            db.execute(
+                "INSERT INTO queues (id, length, touched) VALUES (?, ?, ?)",
+                (queue_id, len(tracks), now),
+            )
+            db.executemany(
+                "INSERT INTO queue_items (queue_id, position, track) VALUES (?, ?, ?)",
+                ((queue_id, i, track) for i, track in enumerate(tracks)),
+            )
+        return queue_id
+
+    def get(self, queue_id, position):
+        db = self._connect()
+        row = db.execute(
+            "SELECT track FROM queue_items WHERE queue_id = ? AND position = ?",
+            (queue_id, position),
+        ).fetchone()
+        if row is None:
+            return None
+        with db:
+            db.execute("UPDATE queues SET touched = ? WHERE id = ?", (time.time(), queue_id))
+        return row[0]
+
+    def length(self, queue_id):
+        row = self._connect().execute("SELECT length FROM queues WHERE id = ?", (queue_id,)).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, queue_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM queue_items WHERE queue_id = ?", (queue_id,))
+            db.execute("DELETE FROM queues WHERE id = ?", (queue_id,))
+
+    def _expire(self, db, now):
+        cutoff = now - self.max_age
+        stale = [row[0] for row in db.execute("SELECT id FROM queues WHERE touched < ?", (cutoff,))]
+        for queue_id in stale:
+            db.execute("DELETE FROM queue_items WHERE queue_id = ?", (queue_id,))
+            db.execute("DELETE FROM queues WHERE id = ?", (queue_id,))
+
+
+def create_queue_store(config):
+    """Build the store selected by QUEUE_STORE ('memory' or 'sqlite')."""
+    backend = config.get("QUEUE_STORE", "memory")
+    if backend == "memory":
+        return MemoryQueueStore(max_queues=config.get("QUEUE_STORE_MAX_QUEUES", 1000))
+    if backend == "sqlite":
+        path = config.get("QUEUE_STORE_PATH") or os.path.join(
+            os.path.dirname(__file__), "queues.sqlite3"
+        )
+        return SQLiteQueueStore(path)
+    raise ValueError(f"Unknown QUEUE_STORE backend: {backend}")
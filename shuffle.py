@@ -0,0 +1,77 @@
+# shuffle.py
+#
+# Lazy shuffles: a no-repeat random order over N tracks without ever building
+# or storing the shuffled list.
+#
+# A shuffle is just (seed, length, cursor).  The track at step `cursor` is
+# tracks[perm(cursor)], where perm is a pseudo-random bijection on [0, length)
+# keyed by the seed.  We get that bijection from a small Feistel network: a
+# Feistel network is a permutation of its (power-of-two sized) domain for any
+# round function, and "cycle walking" (re-applying it until the result falls
+# below `length`) restricts it to [0, length) while keeping it a bijection.
+#
+# That makes a listener's queue O(1) memory no matter how big the archive is,
+# and because the state is three integers it can sit in the session cookie and
+# resume on any worker, as long as every worker orders the tracks the same way
+# (see ArchiveIndex.ordered_tracks).
+import random
+
+MASK64 = (1 << 64) - 1
+
+
+def _mix(value, key):
+    """64-bit integer hash (splitmix64 finaliser) used as the Feistel round function."""
+    x = (value + key) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class FeistelPermutation:
+    """A seeded pseudo-random permutation of range(length), evaluated one index at a time."""
+
+    def __init__(self, length, seed, rounds=4):
+        if length < 0:
+            raise ValueError("length must be >= 0")
+        self.length = length
+        self.rounds = rounds
+        # Split the index into two halves of `half_bits` bits each
+        self.half_bits = max(1, ((length - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(64) for _ in range(rounds)]
+
+    def __len__(self):
+        return self.length
+
+    def _encrypt(self, value):
+        left = value >> self.half_bits
+        right = value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ (_mix(right, key) & self.half_mask)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError("permutation index out of range")
+        # The domain is < 4 * length, so this loops ~4 times at worst on average
+        value = self._encrypt(index)
+        while value >= self.length:
+            value = self._encrypt(value)
+        return value
+
+
+def new_shuffle(length, seed=None):
+    """Fresh shuffle state for `length` tracks."""
+    if seed is None:
+        seed = random.getrandbits(63)
+    return {"seed": seed, "length": length, "cursor": 0}
+
+
+def next_index(state):
+    """Advance a shuffle state and return the next track index, or None when it is used up."""
+    if state["cursor"] >= state["length"]:
+        return None
+    index = FeistelPermutation(state["length"], state["seed"])[state["cursor"]]
+    state["cursor"] += 1
+    return index
@@ -384,49 +384,18 @@ function captureAndSend() {
   processingProgress = 0;
   drawRadarOverlay();
 
-  // === CROP FULL-RES AREA ===
-
-  const boxSize = diameter * 0.6;
-
-  // Scale UI center position from screen to video pixel space
-  const videoRect = video.getBoundingClientRect();
-  const scaleX = video.videoWidth / videoRect.width;
-  const scaleY = video.videoHeight / videoRect.height;
-
-  const actualVideoX = (x - videoRect.left) * scaleX;
-  const actualVideoY = (y - videoRect.top) * scaleY;
-
-  const cropWidth = boxSize * scaleX;
-  const cropHeight = boxSize * scaleY;
-
-  const cropX = actualVideoX - cropWidth / 2;
-  const cropY = actualVideoY - cropHeight / 2;
-
-  // Create canvas at crop resolution (no downscaling)
-  const tempCanvas = document.createElement('canvas');
-  tempCanvas.width = cropWidth;
-  tempCanvas.height = cropHeight;
-
-  const tempCtx = tempCanvas.getContext('2d');
-  tempCtx.drawImage(
-    video,
-    cropX,
-    cropY,
-    cropWidth,
-    cropHeight,
-    0,
-    0,
-    cropWidth,
-    cropHeight
-  );
-
-  // Convert to blob
-  const dataUrl = tempCanvas.toDataURL('image/jpeg', 0.95);
-  const blob = dataURLToBlob(dataUrl);
-
-  // Send to server
+  // Grab a short burst of frames; the server reads them in parallel and
+  // votes, so one blurry frame doesn't cost another scan. Frames that fail
+  // the quality check are dropped here instead of being uploaded.
   const formData = new FormData();
-  formData.append('photo', blob, 'capture.jpg');
+  const frames = [captureFrame()];
+  const captureRest = () => {
+    if (frames.length >= OCR_BURST_FRAMES) return Promise.all(frames);
+    return new Promise((resolve) => setTimeout(resolve, OCR_BURST_INTERVAL)).then(() => {
+      frames.push(captureFrame());
+      return captureRest();
+    });
+  };
 
   const animateProcessing = () => {
     processingProgress += 0.02;
@@ -438,18 +407,41 @@ function captureAndSend() {
   };
   animateProcessing();
 
-  console.log('Sending image to server...');
-
-  fetch('/image_processing', {
-    method: 'POST',
-    body: formData,
-  })
+  // The server queues the scan and answers with a job id; poll until it's done.
+  // Servers without the job routes (app2.py) get the first frame on /image_processing.
+  let usable = [];
+  captureRest()
+    .then((blobs) => {
+      usable = blobs.filter((blob) => blob);
+      if (!usable.length) {
+        return { status: 'error', message: 'Too blurry or too dark. Hold the globe still in good light.' };
+      }
+      usable.forEach((blob, i) => formData.append('photo', blob, `capture-${i}.jpg`));
+      appendCropInfo(formData);
+      console.log(`Sending ${usable.length} of ${blobs.length} frame(s) to server...`);
+      return fetch('/ocr_jobs', {
+        method: 'POST',
+        body: formData,
+      });
+    })
+    .then((response) => {
+      if (!(response instanceof Response) || response.status !== 404) return response;
+      const single = new FormData();
+      single.append('photo', usable[0], 'capture.jpg');
+      appendCropInfo(single);
+      return fetch('/image_processing', { method: 'POST', body: single });
+    })
     .then((response) => {
+      if (!(response instanceof Response)) return response;
+      if (response.status === 429) {
+        return { status: 'error', message: 'Scanner busy, please try again.' };
+      }
       if (!response.ok) {
         throw new Error('Network response was not ok: ' + response.status);
       }
       return response.json();
     })
+    .then((data) => (data.job_id ? pollOcrJob(data.job_id) : data))
     .then((data) => {
       console.log('Server response:', data);
       handleImageProcessingResponse(data);
@@ -462,6 +454,195 @@ function captureAndSend() {
   resetCameraShutdownTimer(); // 🔁 Restart shutdown timer
 }
 
+const OCR_BURST_FRAMES = 3; // frames per scan
+const OCR_BURST_INTERVAL = 80; // ms between burst frames
+
+// Upload size and quality limits come from the server (captureSettings in
+// main_ui.html, see capture_settings() in app.py); these are the fallbacks.
+const CAPTURE = Object.assign(
+  {
+    max_side: 1280, // longest side of an uploaded viewfinder crop, px
+    quality: 0.85, // JPEG quality
+    min_sharpness: 40, // Laplacian variance of the viewfinder sample
+    min_brightness: 40, // mean luma of the viewfinder sample, 0-255
+    max_brightness: 225,
+    live_scan: false, // whether the server has /live_scan
+    live_max_side: 640, // live scan frames
+    live_frame_ms: 250, // ms between live scan frames
+  },
+  typeof captureSettings !== 'undefined' ? captureSettings : {}
+);
+const QUALITY_SAMPLE_SIZE = 96; // the viewfinder is checked at this size, px
+
+const frameCanvas = document.createElement('canvas');
+const sampleCanvas = document.createElement('canvas');
+sampleCanvas.width = QUALITY_SAMPLE_SIZE;
+sampleCanvas.height = QUALITY_SAMPLE_SIZE;
+const sampleCtx = sampleCanvas.getContext('2d', { willReadFrequently: true });
+
+// The viewfinder's scanning box in video pixels. The video is shown with
+// object-fit: cover, so undo that scale and centring (as ocr_geometry.py does).
+function viewfinderSourceRect() {
+  const videoRect = video.getBoundingClientRect();
+  const scale = Math.max(videoRect.width / video.videoWidth, videoRect.height / video.videoHeight);
+  const offsetX = (videoRect.width - video.videoWidth * scale) / 2;
+  const offsetY = (videoRect.height - video.videoHeight * scale) / 2;
+  const size = (diameter * 0.6) / scale;
+  return {
+    x: (x - offsetX) / scale - size / 2,
+    y: (y - offsetY) / scale - size / 2,
+    size: size,
+  };
+}
+
+// Mean brightness and Laplacian variance (sharpness) of the viewfinder,
+// sampled small so the check costs well under a millisecond
+function frameQuality() {
+  const rect = viewfinderSourceRect();
+  const n = QUALITY_SAMPLE_SIZE;
+  sampleCtx.drawImage(video, rect.x, rect.y, rect.size, rect.size, 0, 0, n, n);
+  const rgba = sampleCtx.getImageData(0, 0, n, n).data;
+
+  const luma = new Float32Array(n * n);
+  let sum = 0;
+  for (let i = 0; i < n * n; i++) {
+    luma[i] = 0.299 * rgba[i * 4] + 0.587 * rgba[i * 4 + 1] + 0.114 * rgba[i * 4 + 2];
+    sum += luma[i];
+  }
+
+  let lapSum = 0;
+  let lapSquares = 0;
+  for (let row = 1; row < n - 1; row++) {
+    for (let col = 1; col < n - 1; col++) {
+      const i = row * n + col;
+      const lap = luma[i - n] + luma[i + n] + luma[i - 1] + luma[i + 1] - 4 * luma[i];
+      lapSum += lap;
+      lapSquares += lap * lap;
+    }
+  }
+  const count = (n - 2) * (n - 2);
+  const lapMean = lapSum / count;
+  return { brightness: sum / (n * n), sharpness: lapSquares / count - lapMean * lapMean };
+}
+
+// The viewfinder's scanning box, scaled down to maxSide, as a JPEG blob;
+// resolves to null if it is too blurry, too dark or washed out. Only the box
+// is OCR'd, so there's no point uploading the rest of the frame; where the
+// box runs off the video it's padded white, as the server would.
+function captureFrame(maxSide = CAPTURE.max_side) {
+  const quality = frameQuality();
+  if (
+    quality.sharpness < CAPTURE.min_sharpness ||
+    quality.brightness < CAPTURE.min_brightness ||
+    quality.brightness > CAPTURE.max_brightness
+  ) {
+    console.log('Frame rejected:', quality);
+    return Promise.resolve(null);
+  }
+
+  const rect = viewfinderSourceRect();
+  const side = Math.max(1, Math.round(Math.min(rect.size, maxSide)));
+  const scale = side / rect.size;
+  frameCanvas.width = side;
+  frameCanvas.height = side;
+  const frameCtx = frameCanvas.getContext('2d');
+  frameCtx.fillStyle = '#fff';
+  frameCtx.fillRect(0, 0, side, side);
+  frameCtx.drawImage(video, -rect.x * scale, -rect.y * scale, video.videoWidth * scale, video.videoHeight * scale);
+
+  return new Promise((resolve) => frameCanvas.toBlob(resolve, 'image/jpeg', CAPTURE.quality));
+}
+
+// Tells the server the frames are already cropped to the viewfinder (ocr_geometry.py)
+function appendCropInfo(formData) {
+  formData.append('crop', 'viewfinder');
+}
+
+// --- Live scan ---
+// While on, small frames are posted every CAPTURE.live_frame_ms and the server
+// answers "scanning" until its reads settle on a country (see live_scan.py).
+// A tick is skipped while the previous post is still out, so a slow server
+// gets fewer frames rather than a backlog.
+let liveScanTimer = null;
+let liveScanInFlight = false;
+
+function toggleLiveScan() {
+  if (!CAPTURE.live_scan) {
+    console.log('Live scan is not available on this server');
+    return;
+  }
+  if (liveScanTimer) {
+    stopLiveScan();
+  } else {
+    console.log('Live scan on');
+    liveScanTimer = setInterval(liveScanTick, CAPTURE.live_frame_ms);
+  }
+}
+
+function stopLiveScan() {
+  if (liveScanTimer) {
+    console.log('Live scan off');
+    clearInterval(liveScanTimer);
+    liveScanTimer = null;
+  }
+}
+
+function liveScanTick() {
+  if (liveScanInFlight || isCameraProcessing || escHeld || !video.srcObject) return;
+  liveScanInFlight = true;
+
+  captureFrame(CAPTURE.live_max_side)
+    .then((blob) => {
+      if (!blob) return null;
+      const formData = new FormData();
+      formData.append('photo', blob, 'live.jpg');
+      appendCropInfo(formData);
+      return fetch('/live_scan', { method: 'POST', body: formData }).then((response) => {
+        if (response.status === 404) stopLiveScan();
+        return response.ok ? response.json() : null;
+      });
+    })
+    .then((data) => {
+      if (data && data.status === 'success') {
+        stopLiveScan();
+        handleImageProcessingResponse(data);
+      }
+    })
+    .catch((error) => console.error('Live scan error:', error))
+    .finally(() => {
+      liveScanInFlight = false;
+    });
+  lastImageCaptureTime = Date.now();
+  resetCameraShutdownTimer();
+}
+
+const OCR_POLL_WAIT = 2; // s the server holds each poll open waiting for the result
+const OCR_POLL_TIMEOUT = 30000; // give up on a scan after 30 seconds
+
+// Long-poll an OCR job until it finishes; resolves with the final response body
+function pollOcrJob(jobId) {
+  const startedAt = Date.now();
+
+  const poll = () =>
+    fetch(`/ocr_jobs/${jobId}?wait=${OCR_POLL_WAIT}`)
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error('Network response was not ok: ' + response.status);
+        }
+        return response.json();
+      })
+      .then((data) => {
+        if (data.status !== 'pending') return data;
+        if (Date.now() - startedAt > OCR_POLL_TIMEOUT) {
+          throw new Error('Timed out waiting for OCR result');
+        }
+        // The server already waited, so ask again straight away
+        return poll();
+      });
+
+  return poll();
+}
+
 function resetCameraShutdownTimer() {
   if (autoCameraShutdownTimer) {
     clearTimeout(autoCameraShutdownTimer);
@@ -478,21 +659,6 @@ function resetCameraShutdownTimer() {
   }, 180000); // 3 minutes = 180,000 ms
 }
 
-// Helper function to convert dataURL to Blob
-function dataURLToBlob(dataURL) {
-  const parts = dataURL.split(';base64,');
-  const contentType = parts[0].split(':')[1];
-  const raw = window.atob(parts[1]);
-  const rawLength = raw.length;
-  const uInt8Array = new Uint8Array(rawLength);
-
-  for (let i = 0; i < rawLength; ++i) {
-    uInt8Array[i] = raw.charCodeAt(i);
-  }
-
-  return new Blob([uInt8Array], { type: contentType });
-}
-
 // Handle the response from the server
 function handleImageProcessingResponse(data) {
   console.log('Processing server response:', data);
@@ -940,6 +1106,10 @@ document.addEventListener('keydown', (e) => {
       }
       break;
 
+    case '*':
+      toggleLiveScan();
+      break;
+
     case 'Subtract':
       window.location.href = '/';
       break;